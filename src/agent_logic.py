@@ -1,45 +1,45 @@
-import os
-import sys
-from dotenv import load_dotenv
-from langchain_chroma import Chroma
-from langchain_huggingface import HuggingFaceEmbeddings
-from langchain_mistralai import ChatMistralAI
+import asyncio
+import threading
+import time
+from collections import defaultdict
+from functools import partial
+from operator import itemgetter
+from langchain_core.messages import AIMessage
 from langchain_core.prompts import ChatPromptTemplate
-from langchain_core.runnables import RunnablePassthrough
+from langchain_core.runnables import RunnableBranch, RunnableLambda, RunnableParallel, RunnablePassthrough
 #from langchain_core.output_parsers import StrOutputParser
 
-# Chargement des variables d'environnement (récupère la clé depuis .env)
-load_dotenv()
-
-# Vérification de sécurité
-if not os.getenv("MISTRAL_API_KEY"):
-    print("❌ ERREUR : La clé MISTRAL_API_KEY est introuvable.")
-    print("Assure-toi d'avoir créé le fichier .env à la racine du projet.")
-    sys.exit(1)
-
-
-# --- CONFIGURATION DES CHEMINS ---
-current_dir = os.path.dirname(os.path.abspath(__file__))
-root_dir = os.path.dirname(current_dir)
-VECTORSTORE_PATH = os.path.join(root_dir, "data", "vectorstore")
-
-# --- 1. CHARGEMENT DE LA MÉMOIRE (RAG) ---
-print("Chargement de la base vectorielle...")
-embedding_function = HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2")
-vector_db = Chroma(persist_directory=VECTORSTORE_PATH, embedding_function=embedding_function)
+# --- CONFIGURATION ---
+# Les variables d'environnement (.env) sont chargées par config.
+# Rien de lourd n'est chargé à l'import : l'embedder, Chroma et le LLM sont
+# fournis par le moteur (engine.py) au premier usage.
+from config import (
+    REGIONS, RETRIEVAL_MODE, RETRIEVER_K, RETRIEVER_FETCH_K, CONTEXT_MAX_TOKENS,
+    ANSWER_CACHE_ENABLED, ANSWER_CACHE_PERSIST, ANSWER_CACHE_PATH,
+    ANSWER_CACHE_MAX_ENTRIES, ANSWER_CACHE_TTL_SECONDS, ANSWER_CACHE_SIMILARITY,
+    LLM_RATE_LIMIT_RPS, LLM_RATE_LIMIT_BURST, LLM_RETRY_ATTEMPTS,
+    LLM_RETRY_BASE_SECONDS, LLM_RETRY_MAX_SECONDS, LLM_SINGLE_FLIGHT, LLM_SINGLE_FLIGHT_TIMEOUT_SECONDS
+)
+from answer_cache import SemanticAnswerCache, normalize_question
+from context_budget import assemble_context
+from engine import ConfigurationError, get_engine
+from ingestion_state import get_region_version
+from lexical_index import HybridRetriever
+from relevance_gate import ScoredVectorRetriever, best_relevance, get_threshold
+from telemetry import stage, stage_callbacks, trace_request
+from throttling import (
+    AsyncRateLimiter, CallInterrupted, RateLimiter, SingleFlight,
+    backoff_delay, is_rate_limited, is_retryable, retrying
+)
 
+# --- 1. MÉMOIRE (RAG) ---
 # RETRIEVER : C'est ici qu'on règle la sensibilité !
-# k=4: On récupère les 4 morceaux les plus proches pour donner un max de contexte au LLM
-# Cela compense le fait que la "Javel" puisse arriver en 4ème.
-retriever = vector_db.as_retriever(search_kwargs={"k": 4})
-
-# --- 2. INITIALISATION DU CERVEAU (LLM) ---
-# 'mistral-large-latest' est le plus intelligent. 
-# Si tu veux économiser, utilise 'open-mistral-nemo' ou 'mistral-small-latest'.
-llm = ChatMistralAI(
-    model="mistral-small-latest", 
-    temperature=0.1  # Faible température = Réponse factuelle et précise
-)
+# Avant : k=4 en vectoriel pur, pour compenser le fait que la "Javel" puisse arriver en 4ème.
+# Maintenant : récupération hybride (vecteurs + BM25, voir lexical_index.py), plus précise
+# sur les noms de produits exacts -> k=2 suffit et divise le contexte envoyé à Mistral par ~2.
+
+# --- 2. CERVEAU (LLM) ---
+# Client Mistral créé par le moteur (engine.py, modèle réglable via LLM_MODEL).
 
 # --- 3. DÉFINITION DE LA PERSONNALITÉ (Prompt) ---
 # [cite_start]On utilise les sources [cite: 7, 50] pour définir un agent RAG strict.
@@ -63,6 +63,30 @@ RÉPONSE :
 """
 prompt = ChatPromptTemplate.from_template(template)
 
+# Réponse de repli (consigne 4), renvoyée sans appel Mistral quand la question est
+# hors sujet : aucun morceau du guide n'atteint le seuil de pertinence (relevance_gate.py)
+FALLBACK_ANSWER = "Je n'ai pas l'information précise dans mon guide pour cet objet. Par précaution, vérifiez sur le site de la région : {region_name}."
+
+# Variante multi-objets : une photo, plusieurs déchets, une seule réponse
+multi_template = """
+Tu es Eco-Sorter, un assistant expert en gestion des déchets pour la région : {region_name}.
+Ta mission est d'aider les citoyens à trier correctement pour soutenir l'objectif de développement durable.
+
+Une photo contient plusieurs déchets : {objects}.
+
+CONSIGNES STRICTES :
+1. Utilise UNIQUEMENT le contexte fourni ci-dessous pour répondre.
+2. Réponds pour CHAQUE déchet, une ligne par déchet, au format "- déchet : consigne", en disant exactement dans quel sac (Jaune, Bleu, Blanc, Orange, Vert) ou quel lieu (Proxy Chimik, Recypark, Bulles à verre) il doit aller.
+3. Si le contexte mentionne que c'est "INTERDIT" dans un sac, cherche dans le reste du contexte où c'est "AUTORISÉ".
+4. Si tu ne trouves PAS la réponse pour un déchet, écris pour ce déchet : "Je n'ai pas l'information précise dans mon guide pour cet objet. Par précaution, vérifiez sur le site de la région : {region_name}." (N'invente rien).
+
+CONTEXTE ISSU DU GUIDE DE TRI :
+{context}
+
+RÉPONSE :
+"""
+multi_prompt = ChatPromptTemplate.from_template(multi_template)
+
 # OLD CHAIN with string parser
 # # --- 4. CRÉATION DE LA CHAÎNE (Pipeline) ---
 # def format_docs(docs):
@@ -80,11 +104,203 @@ prompt = ChatPromptTemplate.from_template(template)
 def format_docs(docs):
     return "\n\n".join([d.page_content for d in docs])
 
-rag_chain = (
-    {"context": retriever | format_docs, "question": RunnablePassthrough()}
-    | prompt
-    | llm
-)
+# --- PROTECTION DU QUOTA MISTRAL ---
+# Limiteur partagé par tous les appels du process (ask, stream, lots, multi-objets),
+# nouvelles tentatives à backoff exponentiel avec gigue sur les erreurs transitoires
+# (429, 5xx, réseau), et coalescence des questions identiques en cours.
+llm_rate_limiter = RateLimiter(LLM_RATE_LIMIT_RPS, LLM_RATE_LIMIT_BURST) if LLM_RATE_LIMIT_RPS > 0 else None
+_inflight = SingleFlight(timeout=LLM_SINGLE_FLIGHT_TIMEOUT_SECONDS)
+
+def _throttle(prompt_value):
+    if llm_rate_limiter is not None:
+        llm_rate_limiter.acquire()
+    return prompt_value
+
+async def _athrottle(prompt_value):
+    if llm_rate_limiter is not None:
+        await llm_rate_limiter.aacquire()
+    return prompt_value
+
+def _guard_llm(chat_prompt):
+    """
+    prompt | limiteur | llm : chaque appel Mistral consomme un jeton du limiteur.
+    """
+    return chat_prompt | RunnableLambda(_throttle, afunc=_athrottle) | get_engine().llm
+
+def _retrying(asynchronous=False):
+    return retrying(LLM_RETRY_ATTEMPTS, LLM_RETRY_BASE_SECONDS, LLM_RETRY_MAX_SECONDS, asynchronous)
+
+def _inflight_key(region, user_input):
+    return (region, normalize_question(user_input))
+
+# Partie "génération" commune à toutes les régions : {context, question, region_name} -> message
+_generation_chain = None
+
+def get_generation_chain():
+    """
+    Retourne la chaîne prompt | limiteur | llm (le LLM est chargé au premier appel).
+    """
+    global _generation_chain
+    if _generation_chain is None:
+        _generation_chain = _guard_llm(prompt)
+    return _generation_chain
+
+_multi_generation_chain = None
+
+def get_multi_generation_chain():
+    """
+    Retourne la chaîne multi_prompt | limiteur | llm (mode multi-objets).
+    """
+    global _multi_generation_chain
+    if _multi_generation_chain is None:
+        _multi_generation_chain = _guard_llm(multi_prompt)
+    return _multi_generation_chain
+
+# --- 5. REGISTRE DES CHAÎNES PAR RÉGION ---
+# Une chaîne LCEL pré-construite et réutilisée par région (clé = tag région).
+# Avant, on recréait retriever + chaîne à chaque question : coûteux sous charge.
+_rag_chains = {}
+_rag_chains_lock = threading.Lock()
+
+def build_retriever(region, k=None):
+    """
+    Retriever de la région : hybride (vecteurs + BM25) ou vectoriel seul selon RETRIEVAL_MODE,
+    avec le seuil de pertinence calibré pour la région (liste vide = question hors sujet).
+    """
+    vector_db = get_engine().vector_db
+    threshold = get_threshold(region)
+    if RETRIEVAL_MODE == "hybrid":
+        return HybridRetriever(
+            vector_store=vector_db, region=region, k=k or RETRIEVER_K, fetch_k=RETRIEVER_FETCH_K,
+            score_threshold=threshold
+        )
+    # Filtre metadata sur la région (ScoredVectorRetriever) + scores de pertinence
+    return ScoredVectorRetriever(vector_store=vector_db, region=region, k=k or RETRIEVER_K, score_threshold=threshold)
+
+def _context_with_gate(docs, max_tokens=CONTEXT_MAX_TOKENS):
+    context, context_stats = assemble_context(docs, max_tokens=max_tokens)
+    context_stats = dict(context_stats)
+    context_stats["relevance"] = best_relevance(docs)
+    context_stats["out_of_scope"] = not docs
+    return context, context_stats
+
+def _assemble_inputs(inputs, region):
+    # Contexte dédoublonné, fusionné et plafonné (context_budget.py) au lieu de format_docs
+    with stage("format", region=region):
+        context, context_stats = _context_with_gate(inputs["docs"])
+    return {
+        "context": context,
+        "context_stats": context_stats,
+        "question": inputs["question"],
+        "region_name": region
+    }
+
+def _fallback_message(region):
+    # Même forme qu'une réponse du LLM, avec un usage nul
+    return AIMessage(
+        content=FALLBACK_ANSWER.format(region_name=region),
+        usage_metadata={"input_tokens": 0, "output_tokens": 0, "total_tokens": 0}
+    )
+
+def _out_of_scope_output(inputs):
+    return {"message": _fallback_message(inputs["region_name"]), "context_stats": inputs["context_stats"]}
+
+def build_rag_chain(region):
+    """
+    Construit la chaîne RAG (retriever filtré + budget de contexte + prompt + LLM) pour une région.
+    Question hors sujet (aucun morceau pertinent) : réponse de repli, sans appel au LLM.
+    Sortie : {'message': réponse du LLM, 'context_stats': statistiques du contexte}
+    """
+    retriever = build_retriever(region)
+    return (
+        {"docs": retriever, "question": RunnablePassthrough()}
+        | RunnableLambda(partial(_assemble_inputs, region=region))
+        | RunnableBranch(
+            (lambda inputs: inputs["context_stats"]["out_of_scope"], RunnableLambda(_out_of_scope_output)),
+            RunnableParallel(message=get_generation_chain(), context_stats=itemgetter("context_stats"))
+        )
+    )
+
+def _run_config(region):
+    """
+    Config d'exécution d'une chaîne : étapes retrieve / llm mesurées (telemetry.py).
+    """
+    return {"callbacks": [stage_callbacks], "metadata": {"region": region}}
+
+def get_rag_chain(region):
+    """
+    Retourne la chaîne de la région depuis le registre (construite au premier appel).
+    """
+    chain = _rag_chains.get(region)
+    if chain is None:
+        with _rag_chains_lock:
+            chain = _rag_chains.get(region)
+            if chain is None:
+                chain = build_rag_chain(region)
+                _rag_chains[region] = chain
+    return chain
+
+def invalidate_rag_chains(region=None):
+    """
+    Hook d'invalidation à appeler après une ré-ingestion de la base vectorielle.
+    region : tag de la région à invalider, ou None pour tout vider.
+    """
+    global _generation_chain, _multi_generation_chain
+    with _rag_chains_lock:
+        if region is None:
+            _rag_chains.clear()
+            # Le LLM du moteur a pu être remplacé (engine.set) : on reconstruit aussi la génération
+            _generation_chain = None
+            _multi_generation_chain = None
+        else:
+            _rag_chains.pop(region, None)
+
+def prebuild_rag_chains():
+    """
+    Pré-construit une chaîne par région connue de l'app (appelé au préchauffage du moteur).
+    """
+    for region in REGIONS:
+        get_rag_chain(region)
+    return dict(_rag_chains)
+
+# --- 6. CACHE SÉMANTIQUE DES RÉPONSES ---
+# Clé = région + question normalisée, ou question "proche" (similarité d'embedding).
+# Les entrées sont liées à la version du guide écrite par rag_engine.create_vector_db :
+# une ré-ingestion de la région les invalide automatiquement.
+_answer_cache = None
+_answer_cache_lock = threading.Lock()
+
+def get_answer_cache():
+    """
+    Retourne le cache sémantique (créé au premier appel), ou None s'il est désactivé.
+    """
+    global _answer_cache
+    if not ANSWER_CACHE_ENABLED:
+        return None
+    if _answer_cache is None:
+        with _answer_cache_lock:
+            if _answer_cache is None:
+                _answer_cache = SemanticAnswerCache(
+                    get_engine().embedding_function,
+                    max_entries_per_region=ANSWER_CACHE_MAX_ENTRIES,
+                    ttl_seconds=ANSWER_CACHE_TTL_SECONDS,
+                    similarity_threshold=ANSWER_CACHE_SIMILARITY,
+                    persist_path=ANSWER_CACHE_PATH if ANSWER_CACHE_PERSIST else None,
+                    version_fn=get_region_version
+                )
+    return _answer_cache
+
+_seen_region_versions = {}
+
+def _sync_region_version(region):
+    """
+    Invalide la chaîne de la région si son guide a été ré-ingéré depuis.
+    """
+    version = get_region_version(region)
+    if _seen_region_versions.get(region, version) != version:
+        print(f"🔄 Guide '{region}' ré-ingéré : invalidation des caches")
+        invalidate_rag_chains(region)
+    _seen_region_versions[region] = version
 
 # OLD VERSION of ask_agent
 # # --- FONCTION D'INTERACTION ---
@@ -99,59 +315,552 @@ rag_chain = (
 #         print(f"❌ Erreur technique : {e}")
 #         return "Désolé, une erreur est survenue."
     
+# --- OUTILS COMMUNS (ask_agent / stream_agent) ---
+def _cached_response(region, user_input):
+    """
+    Retourne la réponse en cache (format ask_agent) ou None.
+    """
+    answer_cache = get_answer_cache()
+    if answer_cache is None:
+        return None
+    with stage("cache", region=region) as timer:
+        cached = answer_cache.get(region, user_input)
+        timer.set_attribute("cache_hit", cached is not None)
+    if cached is None:
+        return None
+    return _response_from_cache(region, cached)
+
+def _cached_responses(queries):
+    """
+    Version par lot de _cached_response (un seul appel à l'embedder pour tout le lot).
+    queries : liste de (region, question) ; retourne une réponse ou None par question.
+    """
+    for region in {region for region, _ in queries}:
+        _sync_region_version(region)
+    answer_cache = get_answer_cache()
+    if answer_cache is None:
+        return [None] * len(queries)
+    with stage("cache", questions=len(queries)) as timer:
+        hits = answer_cache.get_many(queries)
+        timer.set_attribute("cache_hits", sum(cached is not None for cached in hits))
+    return [None if cached is None else _response_from_cache(region, cached)
+            for (region, _), cached in zip(queries, hits)]
+
+def _response_from_cache(region, cached):
+    metrics = cached["metrics"]
+    # Le contexte n'a pas été reconstruit : pas de statistiques de contexte
+    metrics.pop("context_tokens", None)
+    metrics.pop("context_tokens_saved", None)
+    metrics.update({
+        "input_tokens": 0,
+        "output_tokens": 0,
+        "total_tokens": 0,
+        "cache_hit": True,
+        "cache_similarity": round(cached["similarity"], 4)
+    })
+    print(f"⚡ Cache ({region}, similarité {cached['similarity']:.2f}) : {cached['answer']}")
+    return {
+        "answer": cached["answer"],
+        "metrics": metrics,
+        "error": None
+    }
+
+def _metrics_from_message(message):
+    """
+    Métriques de tokens d'une réponse du LLM (message complet ou chunks agrégés).
+    """
+    # En streaming, l'usage arrive dans usage_metadata du dernier chunk
+    usage = getattr(message, "usage_metadata", None)
+    if usage:
+        return {
+            "input_tokens": usage.get("input_tokens", 0),
+            "output_tokens": usage.get("output_tokens", 0),
+            "total_tokens": usage.get("total_tokens", 0),
+            "cache_hit": False
+        }
+    token_usage = message.response_metadata.get('token_usage', {})
+    return {
+        "input_tokens": token_usage.get('prompt_tokens', 0),
+        "output_tokens": token_usage.get('completion_tokens', 0),
+        "total_tokens": token_usage.get('total_tokens', 0),
+        "cache_hit": False
+    }
+
+def _add_context_metrics(metrics, context_stats):
+    if context_stats:
+        metrics["context_tokens"] = context_stats["context_tokens"]
+        metrics["context_tokens_saved"] = context_stats["context_tokens_saved"]
+        if context_stats.get("relevance") is not None:
+            metrics["relevance"] = context_stats["relevance"]
+        if context_stats.get("out_of_scope"):
+            # Réponse de repli locale : aucun token Mistral consommé
+            metrics["out_of_scope"] = True
+    return metrics
+
+def _out_of_scope_response(region, context_stats):
+    metrics = _add_context_metrics(_metrics_from_message(_fallback_message(region)), context_stats)
+    return {"answer": FALLBACK_ANSWER.format(region_name=region), "metrics": metrics, "error": None}
+
+def _error_response(error):
+    """
+    Résultat d'erreur (même format que ask_agent, jamais une simple chaîne).
+    """
+    if is_rate_limited(error):
+        answer = "Eco-Sorter est très sollicité en ce moment. Réessayez dans quelques instants."
+    else:
+        answer = "Désolé, une erreur technique est survenue."
+    return {
+        "answer": answer,
+        "metrics": {"input_tokens": 0, "output_tokens": 0, "total_tokens": 0, "cache_hit": False},
+        "error": str(error) or type(error).__name__
+    }
+
+def _coalesced(response, leader):
+    """
+    Copie du résultat partagé pour un appel coalescé (les métriques restent propres à chaque appel).
+    """
+    metrics = dict(response["metrics"])
+    if not leader:
+        # Pas de tokens consommés par cet appel : il a attendu la réponse d'un appel identique
+        metrics.update({"input_tokens": 0, "output_tokens": 0, "total_tokens": 0, "coalesced": True})
+    return {"answer": response["answer"], "metrics": metrics, "error": None}
+
+def _single_flight(region, user_input, fn):
+    if not LLM_SINGLE_FLIGHT:
+        return fn(), True
+    return _inflight.do(_inflight_key(region, user_input), fn)
+
+async def _asingle_flight(region, user_input, coroutine_fn):
+    if not LLM_SINGLE_FLIGHT:
+        return await coroutine_fn(), True
+    return await _inflight.ado(_inflight_key(region, user_input), coroutine_fn)
+
+def _response_from_output(region, user_input, output):
+    response_message = output["message"]
+    content = response_message.content
+    metrics = _add_context_metrics(_metrics_from_message(response_message), output["context_stats"])
+    _store_response(region, user_input, content, metrics)
+    return {"answer": content, "metrics": metrics}
+
+def _invoke_rag_chain(region, user_input):
+    # Nouvelle tentative de toute la chaîne : la récupération est locale et rapide
+    output = _retrying()(get_rag_chain(region).invoke, user_input, config=_run_config(region))
+    return _response_from_output(region, user_input, output)
+
+async def _ainvoke_rag_chain(region, user_input):
+    async for attempt in _retrying(asynchronous=True):
+        with attempt:
+            output = await get_rag_chain(region).ainvoke(user_input, config=_run_config(region))
+    return _response_from_output(region, user_input, output)
+
+def _store_response(region, user_input, content, metrics):
+    answer_cache = get_answer_cache()
+    # Les réponses de repli ne coûtent rien : pas de cache (un nouveau seuil s'applique tout de suite)
+    if answer_cache is not None and not metrics.get("out_of_scope"):
+        answer_cache.put(region, user_input, content, metrics)
+    print(f"🤖 Eco-Sorter ({region}) : {content}")
+    print(f"📊 Tokens : {metrics['total_tokens']}")
+
 # --- FONCTION D'INTERACTION DYNAMIQUE ---
 def ask_agent(user_input, region="bruxelles"):
     """
     Pose une question à l'agent en filtrant par région.
-    region : soit "bruxelles", soit "wallonie"
+    region : tag d'une région de REGION_MAPPING (ex: "bruxelles", "hainaut")
     """
     print(f"\n🌍 Région sélectionnée : {region.upper()}")
     print(f"👤 Question : {user_input}")
     
     try:
-        # A. CRÉATION D'UN RETRIEVER FILTRÉ A LA VOLÉE
-        # C'est l'astuce : on applique le filtre metadata ici
-        retriever = vector_db.as_retriever(
-            search_kwargs={
-                "k": 4,
-                "filter": {"region": region} # <-- LE FILTRE MAGIQUE
-            }
-        )
-        
-        # B. RECONSTRUCTION DE LA CHAINE
-        # On doit recréer la chaine car le retriever a changé
-        rag_chain = (
-            {"context": retriever | format_docs, "question": RunnablePassthrough(), "region_name": lambda x: region}
-            | prompt
-            | llm
-        )
-        
-        # C. INVOCATION
-        response_message = rag_chain.invoke(user_input)
-        
-        # D. METRIQUES
-        content = response_message.content
-        token_usage = response_message.response_metadata.get('token_usage', {})
+        with trace_request("ask_agent", region=region) as request:
+            _sync_region_version(region)
+
+            # A. CACHE : une question (quasi) identique a déjà été posée pour cette région
+            cached = _cached_response(region, user_input)
+            request.set_attribute("cache_hit", cached is not None)
+            if cached is not None:
+                cached["metrics"]["timings_ms"] = dict(request.timings)
+                return cached
+
+            # B. CHAÎNE PRÉ-CONSTRUITE DE LA RÉGION (étapes retrieve / format / llm mesurées),
+            #    un seul appel pour les questions identiques en cours, nouvelles tentatives
+            response, leader = _single_flight(region, user_input, partial(_invoke_rag_chain, region, user_input))
+            request.set_attribute("coalesced", not leader)
+            request.set_attribute("out_of_scope", bool(response["metrics"].get("out_of_scope")))
+            
+            # C. METRIQUES (pour l'App ET le Terminal)
+            response = _coalesced(response, leader)
+            # Durées propres à cet appel : ajoutées après la mise en cache
+            response["metrics"]["timings_ms"] = dict(request.timings)
         
-        # Préparation des métriques pour l'App ET le Terminal
-        metrics = {
-            "input_tokens": token_usage.get('prompt_tokens', 0),
-            "output_tokens": token_usage.get('completion_tokens', 0),
-            "total_tokens": token_usage.get('total_tokens', 0)
+        return response
+
+    except ConfigurationError:
+        # Mauvaise configuration : on remonte l'erreur (plus de sys.exit)
+        raise
+    except Exception as e:
+        print(f"❌ Erreur : {e}")
+        return _error_response(e)
+
+# --- VERSION STREAMING ---
+class AgentStream:
+    """
+    Réponse de l'agent en streaming.
+    On itère dessus pour recevoir les morceaux de texte au fil de l'eau
+    (compatible st.write_stream), puis `result` contient le même dict
+    que ask_agent ({'answer', 'metrics', 'error'}) une fois le flux terminé.
+    """
+    def __init__(self, user_input, region):
+        self.user_input = user_input
+        self.region = region
+        self.result = None
+
+    def __iter__(self):
+        print(f"\n🌍 Région sélectionnée : {self.region.upper()}")
+        print(f"👤 Question (stream) : {self.user_input}")
+        start = time.perf_counter()
+
+        try:
+            with trace_request("stream_agent", region=self.region) as request:
+                _sync_region_version(self.region)
+
+                cached = _cached_response(self.region, self.user_input)
+                request.set_attribute("cache_hit", cached is not None)
+                if cached is not None:
+                    cached["metrics"]["ttft_ms"] = round((time.perf_counter() - start) * 1000, 1)
+                    cached["metrics"]["timings_ms"] = dict(request.timings)
+                    self.result = cached
+                    yield cached["answer"]
+                    return
+
+                if not LLM_SINGLE_FLIGHT:
+                    yield from self._stream(request, start)
+                    return
+
+                # Question identique déjà en cours de génération : on attend sa réponse
+                key = _inflight_key(self.region, self.user_input)
+                future, leader = _inflight.begin(key)
+                request.set_attribute("coalesced", not leader)
+                if not leader:
+                    try:
+                        shared = future.result(timeout=_inflight.timeout)
+                    except (TimeoutError, CallInterrupted):
+                        # Flux identique trop lent ou abandonné par son lecteur : on génère nous-mêmes
+                        request.set_attribute("coalesced", False)
+                        yield from self._stream(request, start)
+                        return
+                    self.result = _coalesced(shared, leader=False)
+                    self.result["metrics"]["ttft_ms"] = round((time.perf_counter() - start) * 1000, 1)
+                    self.result["metrics"]["timings_ms"] = dict(request.timings)
+                    yield self.result["answer"]
+                    return
+
+                error = None
+                try:
+                    yield from self._stream(request, start)
+                except Exception as e:
+                    error = e
+                    raise
+                finally:
+                    # Flux fermé ou abandonné (GeneratorExit) : self.result est vide, les appels
+                    # en attente reçoivent CallInterrupted et relancent la génération eux-mêmes
+                    if error is not None or self.result is None:
+                        _inflight.finish(key, future, error=error or CallInterrupted("flux interrompu"))
+                    else:
+                        _inflight.finish(key, future, {"answer": self.result["answer"], "metrics": self.result["metrics"]})
+
+        except ConfigurationError:
+            raise
+        except Exception as e:
+            print(f"❌ Erreur : {e}")
+            self.result = _error_response(e)
+            yield self.result["answer"]
+
+    def _stream(self, request, start):
+        ttft_ms = None
+        rag_chain = get_rag_chain(self.region)
+        for attempt in range(LLM_RETRY_ATTEMPTS):
+            full_message = None
+            context_stats = None
+            try:
+                for part in rag_chain.stream(self.user_input, config=_run_config(self.region)):
+                    if "context_stats" in part:
+                        context_stats = part["context_stats"]
+                    chunk = part.get("message")
+                    if chunk is None:
+                        continue
+                    full_message = chunk if full_message is None else full_message + chunk
+                    if chunk.content:
+                        if ttft_ms is None:
+                            ttft_ms = round((time.perf_counter() - start) * 1000, 1)
+                        yield chunk.content
+                break
+            except Exception as e:
+                # On ne réessaie que si rien n'a encore été affiché
+                if ttft_ms is not None or not is_retryable(e) or attempt + 1 >= LLM_RETRY_ATTEMPTS:
+                    raise
+                delay = backoff_delay(attempt, LLM_RETRY_BASE_SECONDS, LLM_RETRY_MAX_SECONDS)
+                print(f"🔁 Tentative {attempt + 1} échouée ({e}), nouvel essai dans {delay:.1f} s")
+                time.sleep(delay)
+
+        content = full_message.content if full_message is not None else ""
+        metrics = _metrics_from_message(full_message) if full_message is not None else {
+            "input_tokens": 0, "output_tokens": 0, "total_tokens": 0, "cache_hit": False
+        }
+        _add_context_metrics(metrics, context_stats)
+        _store_response(self.region, self.user_input, content, metrics)
+        # On ne met pas ces temps en cache : ils ne concernent que cet appel
+        metrics = dict(metrics)
+        metrics["ttft_ms"] = ttft_ms
+        metrics["latency_ms"] = round((time.perf_counter() - start) * 1000, 1)
+        metrics["timings_ms"] = dict(request.timings)
+        self.result = {
+            "answer": content,
+            "metrics": metrics,
+            "error": None
         }
 
-        print(f"🤖 Eco-Sorter ({region}) : {content}")
-        print(f"📊 Tokens : {token_usage.get('total_tokens', 0)}")
-        
+def stream_agent(user_input, region="bruxelles"):
+    """
+    Variante streaming de ask_agent (réduit le temps avant le premier mot affiché).
+
+    Returns:
+        AgentStream: itérable de morceaux de texte ; .result disponible à la fin
+    """
+    return AgentStream(user_input, region)
+
+# --- VERSIONS ASYNCHRONE ET PAR LOTS (jobs hors-ligne) ---
+async def aask_agent(user_input, region="bruxelles"):
+    """
+    Équivalent asynchrone de ask_agent (utilise ainvoke de la chaîne).
+    """
+    try:
+        with trace_request("aask_agent", region=region) as request:
+            _sync_region_version(region)
+            cached = _cached_response(region, user_input)
+            request.set_attribute("cache_hit", cached is not None)
+            if cached is not None:
+                cached["metrics"]["timings_ms"] = dict(request.timings)
+                return cached
+
+            response, leader = await _asingle_flight(region, user_input, partial(_ainvoke_rag_chain, region, user_input))
+            request.set_attribute("coalesced", not leader)
+            response = _coalesced(response, leader)
+            response["metrics"]["timings_ms"] = dict(request.timings)
+        return response
+    except ConfigurationError:
+        raise
+    except Exception as e:
+        print(f"❌ Erreur : {e}")
+        return _error_response(e)
+
+def retrieve_batch(questions, region, k=None):
+    """
+    Récupère le contexte de plusieurs questions d'une même région.
+    L'embedder encode toutes les questions en un seul appel.
+
+    Returns:
+        list[list[Document]]: documents par question (même ordre), vide si hors sujet
+    """
+    if not questions:
+        return []
+    vectors = get_engine().embedding_function.embed_documents(list(questions))
+    with stage("retrieve", region=region, questions=len(questions)):
+        retriever = build_retriever(region, k=k)
+        return [retriever.retrieve_by_vector(q, vector) for q, vector in zip(questions, vectors)]
+
+async def aask_agent_batch(items, max_concurrency=8, requests_per_second=None):
+    """
+    Répond à une liste de (question, région) avec concurrence bornée.
+
+    Args:
+        items: liste de tuples (question, region)
+        max_concurrency: nombre max d'appels Mistral simultanés
+        requests_per_second: limite de débit des appels Mistral (None = pas de limite)
+
+    Returns:
+        list[dict]: un résultat par item, dans l'ordre d'entrée (format ask_agent)
+    """
+    items = list(items)
+    results = [None] * len(items)
+    start = time.perf_counter()
+
+    # 1. Questions identiques (même région, même question normalisée) regroupées :
+    #    un seul traitement par groupe, puis réponses déjà en cache (embeddings en un
+    #    lot, hors de la boucle d'événements)
+    groups = defaultdict(list)  # (région, question normalisée) -> indices dans items
+    for i, (question, region) in enumerate(items):
+        groups[_inflight_key(region, question)].append(i)
+    keys = list(groups)
+    questions = {key: items[groups[key][0]][0] for key in keys}
+    group_results = {}
+    cached_responses = await asyncio.to_thread(_cached_responses, [(key[0], questions[key]) for key in keys])
+    pending_by_region = defaultdict(list)
+    for key, cached in zip(keys, cached_responses):
+        if cached is not None:
+            group_results[key] = cached
+        else:
+            pending_by_region[key[0]].append(key)
+
+    # 2. Récupération groupée par région (embedding des questions en un lot)
+    inputs = []
+    pending = []
+    for region, region_keys in pending_by_region.items():
+        try:
+            docs_per_question = await asyncio.to_thread(retrieve_batch, [questions[key] for key in region_keys], region)
+        except Exception as e:
+            print(f"❌ Erreur de récupération ({region}) : {e}")
+            for key in region_keys:
+                group_results[key] = _error_response(e)
+            continue
+        for key, docs in zip(region_keys, docs_per_question):
+            with stage("format", region=region):
+                context, context_stats = _context_with_gate(docs)
+            if context_stats["out_of_scope"]:
+                group_results[key] = _out_of_scope_response(region, context_stats)
+                continue
+            inputs.append({
+                "context": context,
+                "context_stats": context_stats,
+                "question": questions[key],
+                "region_name": region
+            })
+            pending.append(key)
+
+    # 3. Génération : concurrence bornée + limiteur de débit (en plus du limiteur
+    #    global) + nouvelles tentatives par question sur erreur transitoire
+    chain = get_generation_chain()
+    if requests_per_second:
+        limiter = AsyncRateLimiter(requests_per_second)
+
+        async def _batch_throttle(x):
+            await limiter.acquire()
+            return x
+
+        chain = RunnableLambda(_batch_throttle) | get_generation_chain()
+
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def _generate(payload):
+        async with semaphore:
+            async for attempt in _retrying(asynchronous=True):
+                with attempt:
+                    # La région suit chaque appel Mistral dans la télémétrie
+                    return await chain.ainvoke(payload, config=_run_config(payload["region_name"]))
+
+    messages = await asyncio.gather(*(_generate(payload) for payload in inputs), return_exceptions=True)
+
+    for key, payload, message in zip(pending, inputs, messages):
+        if isinstance(message, Exception):
+            print(f"❌ Erreur : {message}")
+            group_results[key] = _error_response(message)
+            continue
+        metrics = _add_context_metrics(_metrics_from_message(message), payload["context_stats"])
+        _store_response(payload["region_name"], payload["question"], message.content, metrics)
+        group_results[key] = {
+            "answer": message.content,
+            "metrics": metrics,
+            "error": None
+        }
+
+    # 4. Une réponse par item : les doublons reçoivent une copie coalescée (sans tokens)
+    for key, idxs in groups.items():
+        response = group_results[key]
+        results[idxs[0]] = response
+        for i in idxs[1:]:
+            if response["error"] is None:
+                results[i] = _coalesced(response, leader=False)
+            else:
+                results[i] = {**response, "metrics": dict(response["metrics"])}
+
+    elapsed = time.perf_counter() - start
+    print(f"📦 Lot de {len(items)} question(s) traité en {elapsed:.1f} s ({len(pending)} appel(s) Mistral)")
+    return results
+
+def ask_agent_batch(items, max_concurrency=8, requests_per_second=None):
+    """
+    Version synchrone de aask_agent_batch (scripts hors-ligne).
+    """
+    return asyncio.run(aask_agent_batch(items, max_concurrency, requests_per_second))
+
+# --- MODE MULTI-OBJETS (une photo, plusieurs déchets) ---
+def _interleave(rankings):
+    """
+    Fusionne des listes de documents rang par rang (le 1er de chaque objet, puis
+    le 2ème...) : sous le budget, chaque objet garde au moins son meilleur morceau.
+    """
+    merged = []
+    for rank in range(max((len(r) for r in rankings), default=0)):
+        merged.extend(r[rank] for r in rankings if rank < len(r))
+    return merged
+
+def ask_agent_multi(objects, region="bruxelles"):
+    """
+    Répond pour plusieurs déchets d'une même photo avec UNE récupération groupée
+    (embeddings en un lot, contexte commun dédoublonné) et UN seul appel Mistral.
+
+    Args:
+        objects: libellés des déchets détectés (ex : ["métal", "plastique", "carton"])
+
+    Returns:
+        dict: même format que ask_agent
+    """
+    objects = list(dict.fromkeys(objects))
+    if len(objects) == 1:
+        return ask_agent(f"Où jeter ce déchet qui ressemble à : {objects[0]} ?", region=region)
+
+    combined_question = "Où jeter ces déchets : " + ", ".join(objects) + " ?"
+    print(f"\n🌍 Région sélectionnée : {region.upper()}")
+    print(f"👤 Question (multi-objets) : {combined_question}")
+
+    try:
+        with trace_request("ask_agent_multi", region=region, objects=len(objects)) as request:
+            _sync_region_version(region)
+            cached = _cached_response(region, combined_question)
+            request.set_attribute("cache_hit", cached is not None)
+            if cached is not None:
+                cached["metrics"]["timings_ms"] = dict(request.timings)
+                return cached
+
+            # A. Récupération groupée : une question par objet, un seul lot d'embeddings
+            questions = [f"Où dois-je jeter : {label} ?" for label in objects]
+            docs_per_object = retrieve_batch(questions, region)
+
+            # B. Contexte commun (les morceaux partagés ne sont envoyés qu'une fois),
+            #    budget proportionnel au nombre d'objets
+            max_tokens = CONTEXT_MAX_TOKENS * len(objects) if CONTEXT_MAX_TOKENS else None
+            with stage("format", region=region):
+                context, context_stats = _context_with_gate(_interleave(docs_per_object), max_tokens=max_tokens)
+            if context_stats["out_of_scope"]:
+                # Aucun objet couvert par le guide : repli local, sans appel Mistral
+                response = _out_of_scope_response(region, context_stats)
+                response["metrics"]["objects"] = len(objects)
+                response["metrics"]["timings_ms"] = dict(request.timings)
+                return response
+
+            # C. Un seul appel Mistral pour tous les objets
+            message = _retrying()(get_multi_generation_chain().invoke, {
+                "context": context,
+                "objects": ", ".join(objects),
+                "region_name": region
+            }, config=_run_config(region))
+
+            content = message.content
+            metrics = _add_context_metrics(_metrics_from_message(message), context_stats)
+            metrics["objects"] = len(objects)
+            _store_response(region, combined_question, content, metrics)
+            metrics = dict(metrics)
+            metrics["timings_ms"] = dict(request.timings)
+
         return {
             "answer": content,
             "metrics": metrics,
             "error": None
         }
-
+    except ConfigurationError:
+        raise
     except Exception as e:
         print(f"❌ Erreur : {e}")
-        return "Erreur technique."
+        return _error_response(e)
 
 if __name__ == "__main__":
     # --- TEST DE LA DIFFERENCE REGIONALE ---
@@ -0,0 +1,325 @@
+import atexit
+import base64
+import json
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+import numpy as np
+
+# --- CACHE SÉMANTIQUE DES RÉPONSES ---
+# La majorité du trafic = les mêmes questions formulées différemment
+# ("peau de banane", "bouteille de Javel"...). On évite un aller-retour Mistral
+# en reconnaissant une question déjà posée pour la même région :
+#   1. correspondance exacte sur la question normalisée
+#   2. sinon, similarité cosinus des embeddings (all-MiniLM-L6-v2) >= seuil
+
+def normalize_question(text):
+    """
+    Normalise une question : minuscules, sans accents, sans ponctuation.
+    """
+    text = unicodedata.normalize("NFKD", text.lower())
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    text = re.sub(r"[^\w\s]", " ", text)
+    return " ".join(text.split())
+
+def _encode_vector(vector):
+    return base64.b64encode(np.asarray(vector, dtype=np.float32).tobytes()).decode("ascii")
+
+def _decode_vector(data):
+    return np.frombuffer(base64.b64decode(data), dtype=np.float32)
+
+class SemanticAnswerCache:
+    """
+    Cache LRU + TTL par région des réponses de l'agent.
+
+    Args:
+        embedding_function: objet LangChain Embeddings (embed_query, embed_documents)
+        max_entries_per_region: taille max par région (éviction LRU)
+        ttl_seconds: durée de vie d'une entrée
+        similarity_threshold: similarité cosinus minimale pour un "hit" sémantique
+        persist_path: fichier JSON de persistance (None = mémoire uniquement)
+        version_fn: fonction region -> version du guide (invalide les entrées périmées)
+    """
+    def __init__(self, embedding_function, max_entries_per_region=256, ttl_seconds=24 * 3600,
+                 similarity_threshold=0.92, persist_path=None, version_fn=None,
+                 autosave_interval=30.0):
+        self.embedding_function = embedding_function
+        self.max_entries_per_region = max_entries_per_region
+        self.ttl_seconds = ttl_seconds
+        self.similarity_threshold = similarity_threshold
+        self.persist_path = persist_path
+        self.version_fn = version_fn
+        self.autosave_interval = autosave_interval
+
+        self._regions = {}  # region -> OrderedDict(normalized_question -> entry)
+        self._embedding_memo = OrderedDict()  # évite de ré-encoder get() puis put()
+        self._lock = threading.RLock()
+        self._dirty = False
+        self._last_save = time.time()
+        self.stats = {"hits": 0, "semantic_hits": 0, "misses": 0, "evictions": 0}
+
+        if self.persist_path:
+            self._load()
+            atexit.register(self.flush)
+
+    # --- EMBEDDINGS ---
+    def _embed(self, normalized):
+        with self._lock:
+            vector = self._embedding_memo.get(normalized)
+            if vector is not None:
+                self._embedding_memo.move_to_end(normalized)
+                return vector
+        vector = np.asarray(self.embedding_function.embed_query(normalized), dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        if norm > 0:
+            vector = vector / norm
+        with self._lock:
+            self._remember(normalized, vector)
+        return vector
+
+    def _embed_many(self, normalized_questions):
+        """
+        Comme _embed, pour plusieurs questions : un seul appel embed_documents.
+        """
+        with self._lock:
+            vectors = {q: self._embedding_memo[q] for q in normalized_questions if q in self._embedding_memo}
+        missing = list(dict.fromkeys(q for q in normalized_questions if q not in vectors))
+        if missing:
+            matrix = np.asarray(self.embedding_function.embed_documents(missing), dtype=np.float32)
+            norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+            matrix = matrix / np.where(norms > 0, norms, 1.0)
+            with self._lock:
+                for normalized, vector in zip(missing, matrix):
+                    vectors[normalized] = vector
+                    self._remember(normalized, vector)
+        return [vectors[q] for q in normalized_questions]
+
+    def _remember(self, normalized, vector):
+        self._embedding_memo[normalized] = vector
+        self._embedding_memo.move_to_end(normalized)
+        while len(self._embedding_memo) > 128:
+            self._embedding_memo.popitem(last=False)
+
+    # --- LECTURE ---
+    def _current_version(self, region):
+        return self.version_fn(region) if self.version_fn is not None else None
+
+    def _is_valid(self, entry, version, now):
+        # version : version courante du guide de la région, lue une fois par l'appelant
+        if now - entry["created_at"] > self.ttl_seconds:
+            return False
+        if self.version_fn is not None and entry.get("version") != version:
+            return False
+        return True
+
+    def _purge_region(self, region, now):
+        entries = self._regions.get(region)
+        if not entries:
+            return entries
+        version = self._current_version(region)
+        stale = [key for key, entry in entries.items() if not self._is_valid(entry, version, now)]
+        for key in stale:
+            del entries[key]
+        if stale:
+            self._dirty = True
+        return entries
+
+    def get(self, region, question):
+        """
+        Cherche une réponse en cache.
+
+        Returns:
+            dict ou None: {'answer', 'metrics', 'similarity', 'matched_question'}
+        """
+        normalized = normalize_question(question)
+        now = time.time()
+        with self._lock:
+            entries = self._purge_region(region, now)
+            if not entries:
+                self.stats["misses"] += 1
+                return None
+
+            # 1. Correspondance exacte
+            entry = entries.get(normalized)
+            if entry is not None:
+                entries.move_to_end(normalized)
+                self.stats["hits"] += 1
+                return self._hit(entry, normalized, 1.0)
+
+            keys = list(entries.keys())
+            matrix = np.stack([entries[key]["embedding"] for key in keys])
+
+        # 2. Correspondance sémantique (embedding hors verrou)
+        query_vector = self._embed(normalized)
+        with self._lock:
+            return self._semantic_hit(region, keys, matrix @ query_vector)
+
+    def get_many(self, queries):
+        """
+        Version par lot de get() : les questions sans correspondance exacte
+        sont encodées ensemble (un seul appel embed_documents).
+
+        Args:
+            queries: liste de (region, question)
+
+        Returns:
+            list[dict ou None]: un résultat par question, dans le même ordre
+        """
+        results = [None] * len(queries)
+        semantic = []  # (position, region, question normalisée)
+        matrices = {}  # region -> (clés, matrice des embeddings)
+        now = time.time()
+        with self._lock:
+            purged = {}
+            for position, (region, question) in enumerate(queries):
+                normalized = normalize_question(question)
+                if region not in purged:
+                    purged[region] = self._purge_region(region, now)
+                entries = purged[region]
+                if not entries:
+                    self.stats["misses"] += 1
+                    continue
+                entry = entries.get(normalized)
+                if entry is not None:
+                    entries.move_to_end(normalized)
+                    self.stats["hits"] += 1
+                    results[position] = self._hit(entry, normalized, 1.0)
+                    continue
+                if region not in matrices:
+                    keys = list(entries.keys())
+                    matrices[region] = (keys, np.stack([entries[key]["embedding"] for key in keys]))
+                semantic.append((position, region, normalized))
+
+        if semantic:
+            vectors = self._embed_many([normalized for _, _, normalized in semantic])
+            with self._lock:
+                for (position, region, _), vector in zip(semantic, vectors):
+                    keys, matrix = matrices[region]
+                    results[position] = self._semantic_hit(region, keys, matrix @ vector)
+        return results
+
+    def _semantic_hit(self, region, keys, similarities):
+        # Appelé sous self._lock : l'entrée a pu être évincée pendant l'encodage
+        best_idx = int(np.argmax(similarities))
+        best_similarity = float(similarities[best_idx])
+        entries = self._regions.get(region, {})
+        entry = entries.get(keys[best_idx])
+        if entry is None or best_similarity < self.similarity_threshold:
+            self.stats["misses"] += 1
+            return None
+        entries.move_to_end(keys[best_idx])
+        self.stats["hits"] += 1
+        self.stats["semantic_hits"] += 1
+        return self._hit(entry, keys[best_idx], best_similarity)
+
+    @staticmethod
+    def _hit(entry, matched_question, similarity):
+        return {
+            "answer": entry["answer"],
+            "metrics": dict(entry["metrics"]),
+            "similarity": similarity,
+            "matched_question": matched_question
+        }
+
+    # --- ÉCRITURE ---
+    def put(self, region, question, answer, metrics):
+        """
+        Enregistre une réponse (éviction LRU si la région est pleine).
+        """
+        normalized = normalize_question(question)
+        vector = self._embed(normalized)
+        entry = {
+            "answer": answer,
+            "metrics": dict(metrics),
+            "embedding": vector,
+            "created_at": time.time(),
+            "version": self._current_version(region)
+        }
+        with self._lock:
+            entries = self._regions.setdefault(region, OrderedDict())
+            entries[normalized] = entry
+            entries.move_to_end(normalized)
+            while len(entries) > self.max_entries_per_region:
+                entries.popitem(last=False)
+                self.stats["evictions"] += 1
+            self._dirty = True
+        self._maybe_save()
+
+    def invalidate(self, region=None):
+        """
+        Vide le cache d'une région (ou de toutes si region=None).
+        """
+        with self._lock:
+            if region is None:
+                self._regions.clear()
+            else:
+                self._regions.pop(region, None)
+            self._dirty = True
+        self.flush()
+
+    # --- PERSISTANCE ---
+    def _maybe_save(self):
+        if self.persist_path and time.time() - self._last_save >= self.autosave_interval:
+            self.flush()
+
+    def flush(self):
+        """
+        Écrit le cache sur disque (si persistance activée et modifications en attente).
+        """
+        if not self.persist_path:
+            return
+        with self._lock:
+            if not self._dirty:
+                return
+            data = {
+                region: [
+                    {
+                        "question": key,
+                        "answer": entry["answer"],
+                        "metrics": entry["metrics"],
+                        "embedding": _encode_vector(entry["embedding"]),
+                        "created_at": entry["created_at"],
+                        "version": entry["version"]
+                    }
+                    for key, entry in entries.items()
+                ]
+                for region, entries in self._regions.items()
+            }
+            self._dirty = False
+            self._last_save = time.time()
+        os.makedirs(os.path.dirname(self.persist_path), exist_ok=True)
+        tmp_path = f"{self.persist_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp_path, self.persist_path)
+
+    def _load(self):
+        if not os.path.exists(self.persist_path):
+            return
+        try:
+            with open(self.persist_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"⚠️ Cache de réponses illisible, ignoré : {e}")
+            return
+        now = time.time()
+        for region, items in data.items():
+            version = self._current_version(region)
+            entries = OrderedDict()
+            for item in items:
+                entry = {
+                    "answer": item["answer"],
+                    "metrics": item["metrics"],
+                    "embedding": _decode_vector(item["embedding"]),
+                    "created_at": item["created_at"],
+                    "version": item.get("version")
+                }
+                if self._is_valid(entry, version, now):
+                    entries[item["question"]] = entry
+            if entries:
+                self._regions[region] = entries
+        print(f"✅ Cache de réponses chargé ({sum(len(e) for e in self._regions.values())} entrées)")
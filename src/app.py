@@ -1,22 +1,32 @@
 import streamlit as st
 import time
 from PIL import Image
+from config import REGION_MAPPING, SERVICE_URL
+from engine import ConfigurationError
+from vision_model import describe_prediction, describe_detections
 
-# --- OPTIMISATION VITESSE (CACHE) ---
-@st.cache_resource
-def load_agent_engine():
-    from agent_logic import ask_agent
-    return ask_agent
+if SERVICE_URL:
+    # Client léger : les modèles tournent une seule fois dans service.py
+    from client import (
+        get_engine, stream_agent, ask_agent_multi, predict_cached, predict_all_cached, lookup_bin_answer
+    )
+else:
+    # Imports légers : les modèles (embedder, Chroma, Mistral, YOLO) sont créés
+    # par le moteur au premier usage, pas à l'import
+    from engine import get_engine
+    from agent_logic import stream_agent, ask_agent_multi
+    from vision_model import predict_cached, predict_all_cached
+    from bin_table import lookup_bin_answer
 
-@st.cache_resource
-def load_vision_model():
-    """Charge le modèle CNN une seule fois au démarrage"""
-    from vision_model import predict_waste_type
-    return predict_waste_type
+# --- OPTIMISATION VITESSE (CACHE + PRÉCHAUFFAGE) ---
+@st.cache_resource(show_spinner=False)
+def load_engine():
+    """Crée le moteur une seule fois et le préchauffe en arrière-plan pendant le rendu de la page"""
+    engine = get_engine()
+    engine.warmup(background=True)
+    return engine
 
-# On charge les moteurs IA
-ask_agent = load_agent_engine()
-predict_waste_type = load_vision_model()
+engine = load_engine()
 
 # --- 1. CONFIGURATION ---
 st.set_page_config(page_title="Eco-Sorter AI", page_icon="♻️", layout="wide")
@@ -34,17 +44,8 @@ with st.sidebar:
     #st.image("https://sdgs.un.org/sites/default/files/goals/F_SDG_goals_icons-individual-rgb-11.png", width=100)
     st.title("🌍 Ma Localisation")
     
-    region_mapping = {
-        "Bruxelles": "bruxelles",
-        "Hainaut": "hainaut", 
-        "Anvers": "antwerp",
-        "Liège": "liege",
-        "Namur": "namur", 
-        "Brabant Wallon": "brabant_wallon",
-        "Charleroi": "charleroi",
-        "Luxembourg": "luxembourg",
-        "Mons": "mons"
-    }
+    # Mapping partagé avec agent_logic (une chaîne RAG pré-construite par région)
+    region_mapping = REGION_MAPPING
     
     selected_label = st.selectbox(
         "Choix de la zone :",
@@ -55,9 +56,57 @@ with st.sidebar:
     
     st.divider()
     
+    # ÉTAT DU MOTEUR (temps de chargement par composant)
+    with st.expander("⚙️ Moteur IA" + (f" ({SERVICE_URL})" if SERVICE_URL else "")):
+        icons = {"ready": "✅", "loading": "⏳", "pending": "💤", "error": "❌"}
+        for name, info in engine.status().items():
+            duration = f" - {info['seconds']:.2f} s" if info["seconds"] is not None else ""
+            st.caption(f"{icons[info['state']]} {name}{duration}")
+            if info["error"]:
+                st.caption(f"↳ {info['error']}")
+    
     # ZONE UPLOAD IMAGE (Placée dans la sidebar pour la propreté)
     st.header("📸 Vision")
     uploaded_file = st.file_uploader("Prendre une photo", type=["jpg", "png", "jpeg"])
+    # Plusieurs déchets sur la photo : toutes les détections, une seule réponse
+    multi_mode = st.toggle(
+        "Plusieurs objets sur la photo",
+        on_change=lambda: st.session_state.pop("current_image_prediction", None)
+    )
+
+def show_error(response_data):
+    """Signale une réponse dégradée (quota Mistral, réseau...) sans interrompre l'app"""
+    if response_data.get("error"):
+        st.caption(f"⚠️ Détail technique : {response_data['error']}")
+
+def show_metrics(m, title="📊 Empreinte CO2"):
+    """Affiche les métriques de consommation d'une réponse (format uniformisé)"""
+    with st.expander(title):
+        c1, c2, c3 = st.columns(3)
+        c1.metric("Input", f"{m['input_tokens']}")
+        c2.metric("Output", f"{m['output_tokens']}")
+        
+        # Correction demandée : Afficher CO2 au lieu du Total
+        co2_val = m['total_tokens'] * 0.0004
+        c3.metric("Est. CO2", f"{co2_val:.4f} g")
+        
+        if m.get("ttft_ms") is not None:
+            st.caption(f"⏱️ Premier mot : {m['ttft_ms']:.0f} ms - réponse complète : {m.get('latency_ms', 0):.0f} ms")
+        if m.get("timings_ms"):
+            # Durée par étape (telemetry.py) : embed, retrieve, format, llm, vision...
+            st.caption("🔍 Étapes : " + " · ".join(f"{stage} {ms:.0f} ms" for stage, ms in m["timings_ms"].items()))
+        if m.get("context_tokens") is not None:
+            st.caption(f"✂️ Contexte : ~{m['context_tokens']} tokens ({m.get('context_tokens_saved', 0)} économisés par dédoublonnage/budget)")
+        if m.get("objects"):
+            st.caption(f"🧺 {m['objects']} objets traités en un seul appel")
+        if m.get("precomputed"):
+            st.caption("📋 Réponse pré-calculée (table classe détectée -> consigne de tri) - 0 token consommé")
+        if m.get("out_of_scope"):
+            st.caption("🚫 Question hors sujet : aucun passage du guide assez pertinent, réponse de repli - 0 token consommé")
+        if m.get("coalesced"):
+            st.caption("🤝 Même question déjà en cours : réponse partagée - 0 token consommé")
+        if m.get("cache_hit"):
+            st.caption(f"⚡ Réponse servie depuis le cache (similarité : {m.get('cache_similarity', 1.0):.0%}) - 0 token consommé")
 
 # --- 3. SESSION STATE ---
 if "messages" not in st.session_state:
@@ -73,15 +122,7 @@ for msg in st.session_state.messages:
         
         # AFFICHAGE METRIQUES (Format Uniformisé)
         if "metrics" in msg:
-            with st.expander("📊 Empreinte CO2"):
-                m = msg["metrics"]
-                c1, c2, c3 = st.columns(3)
-                c1.metric("Input", f"{m['input_tokens']}")
-                c2.metric("Output", f"{m['output_tokens']}")
-                
-                # Correction demandée : Afficher CO2 au lieu du Total
-                co2_val = m['total_tokens'] * 0.0004
-                c3.metric("Est. CO2", f"{co2_val:.4f} g")
+            show_metrics(msg["metrics"])
 
 # --- 5. LOGIQUE IMAGE (Nouveau Flow Corrigé) ---
 if uploaded_file:
@@ -92,11 +133,18 @@ if uploaded_file:
     # Si on n'a pas encore validé cette image, on lance la prédiction (Mock)
     if "current_image_prediction" not in st.session_state:
         with st.spinner("🧠 Analyse visuelle en cours (CNN)..."):
-            prediction = predict_waste_type(image)
-            st.session_state.current_image_prediction = prediction
+            if multi_mode:
+                st.session_state.current_image_prediction = predict_all_cached(image)
+            else:
+                st.session_state.current_image_prediction = predict_cached(image)
     
     # Récupération de la prédiction stockée
-    prediction = st.session_state.current_image_prediction
+    prediction_result = st.session_state.current_image_prediction
+    detections = prediction_result.get("detections")  # None hors mode multi-objets
+    if detections is not None:
+        prediction = describe_detections(prediction_result)
+    else:
+        prediction = describe_prediction(prediction_result)
     
     # Interface de validation
     st.info(f"Je pense voir : **{prediction}**")
@@ -110,28 +158,58 @@ if uploaded_file:
         st.chat_message("user").markdown(user_text)
         st.session_state.messages.append({"role": "user", "content": user_text})
         
-        # 2. On lance l'IA et on affiche la réponse TOUT DE SUITE (sans rerun)
+        # 2. On affiche la réponse TOUT DE SUITE (sans rerun)
         with st.chat_message("assistant"):
-            with st.spinner("Consultation du guide de tri..."):
-                response_data = ask_agent(user_text, region=region_tag)
-                
-                # Affichage texte
+            # Réponse pré-calculée pour (région, classe détectée) : instantanée, 0 token.
+            # Le LLM ne sert que si la table est absente/périmée ou pour les questions de suivi.
+            precomputed = None
+            if detections:
+                entries = [lookup_bin_answer(d["class_name"], region_tag) for d in detections]
+                if all(entries):
+                    precomputed = {"answer": "\n".join(
+                        f"- **{d['class_name_fr']}** : {entry['answer']}" for d, entry in zip(detections, entries)
+                    )}
+            elif prediction_result["detected"]:
+                precomputed = lookup_bin_answer(prediction_result["class_name"], region_tag)
+            
+            if precomputed is not None:
+                st.markdown(precomputed["answer"])
+                response_data = {
+                    "answer": precomputed["answer"],
+                    "metrics": {"input_tokens": 0, "output_tokens": 0, "total_tokens": 0, "precomputed": True},
+                    "error": None
+                }
+            elif detections:
+                # Plusieurs déchets : une récupération groupée et un seul appel Mistral
+                try:
+                    with st.spinner("♻️ Recherche des consignes pour chaque objet..."):
+                        response_data = ask_agent_multi([d["class_name_fr"] for d in detections], region=region_tag)
+                except ConfigurationError as e:
+                    st.error(f"⚙️ Configuration incomplète : {e}")
+                    st.stop()
                 st.markdown(response_data["answer"])
-                
-                # Affichage Métriques (CO2)
-                metrics = response_data["metrics"]
-                with st.expander("📊 Détails de consommation (Live)"):
-                    c1, c2, c3 = st.columns(3)
-                    c1.metric("Input", metrics['input_tokens'])
-                    c2.metric("Output", metrics['output_tokens'])
-                    c3.metric("Est. CO2", f"{metrics['total_tokens'] * 0.0004:.4f} g")
-
-                # 3. Sauvegarde dans l'historique
-                st.session_state.messages.append({
-                    "role": "assistant", 
-                    "content": response_data["answer"],
-                    "metrics": metrics
-                })
+            else:
+                # Affichage texte en streaming (les mots apparaissent au fil de la génération)
+                stream = stream_agent(user_text, region=region_tag)
+                try:
+                    st.write_stream(stream)
+                except ConfigurationError as e:
+                    st.error(f"⚙️ Configuration incomplète : {e}")
+                    st.stop()
+                response_data = stream.result
+            show_error(response_data)
+            
+            # Affichage Métriques (CO2) : durées de la vision + durées de la réponse
+            metrics = dict(response_data["metrics"])
+            metrics["timings_ms"] = {**prediction_result.get("timings_ms", {}), **metrics.get("timings_ms", {})}
+            show_metrics(metrics, "📊 Détails de consommation (Live)")
+
+            # 3. Sauvegarde dans l'historique
+            st.session_state.messages.append({
+                "role": "assistant", 
+                "content": response_data["answer"],
+                "metrics": metrics
+            })
         
         # 4. Nettoyage (On supprime la prédiction pour éviter de boucler)
         del st.session_state.current_image_prediction
@@ -149,22 +227,22 @@ if prompt := st.chat_input("Ex: Bouteille de Javel..."):
     st.session_state.messages.append({"role": "user", "content": prompt})
 
     with st.chat_message("assistant"):
-        with st.spinner("Analyse..."):
-            response_data = ask_agent(prompt, region=region_tag)
-            
-            st.markdown(response_data["answer"])
-            
-            # Sauvegarde
-            st.session_state.messages.append({
-                "role": "assistant", 
-                "content": response_data["answer"],
-                "metrics": response_data["metrics"]
-            })
-            
-            # Métriques Live
-            with st.expander("📊 Empreinte CO2 (Live)"):
-                m = response_data["metrics"]
-                c1, c2, c3 = st.columns(3)
-                c1.metric("Input", m['input_tokens'])
-                c2.metric("Output", m['output_tokens'])
-                c3.metric("Est. CO2", f"{m['total_tokens'] * 0.0004:.4f} g")
\ No newline at end of file
+        # Streaming : le premier mot s'affiche dès qu'il arrive de Mistral
+        stream = stream_agent(prompt, region=region_tag)
+        try:
+            st.write_stream(stream)
+        except ConfigurationError as e:
+            st.error(f"⚙️ Configuration incomplète : {e}")
+            st.stop()
+        response_data = stream.result
+        show_error(response_data)
+        
+        # Sauvegarde
+        st.session_state.messages.append({
+            "role": "assistant", 
+            "content": response_data["answer"],
+            "metrics": response_data["metrics"]
+        })
+        
+        # Métriques Live
+        show_metrics(response_data["metrics"], "📊 Empreinte CO2 (Live)")
\ No newline at end of file
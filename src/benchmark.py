@@ -0,0 +1,364 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+# --- BENCHMARK HORS-LIGNE (sans crédits Mistral ni réseau) ---
+# Mesure la récupération (query_vector_db, retrievers), l'assemblage du contexte,
+# ask_agent de bout en bout avec un faux LLM déterministe, et l'inférence vision.
+# Sortie JSON stable pour comparer deux commits :
+#   python benchmark.py --output bench_avant.json
+#   python benchmark.py --output bench_apres.json
+
+PROJECT_ROOT = Path(__file__).parent.parent
+GOLD_PATH = PROJECT_ROOT / "data" / "benchmarks" / "gold_questions.json"
+TEST_IMAGES_DIR = PROJECT_ROOT / "data" / "test_images"
+
+class FakeEcoSorterChat(BaseChatModel):
+    """
+    Remplaçant déterministe de ChatMistralAI : répond avec la première ligne
+    du contexte et rapporte un usage de tokens estimé (même format que Mistral).
+    latency_ms / token_latency_ms simulent le temps du premier token et par token.
+    """
+    latency_ms: float = 0.0
+    token_latency_ms: float = 0.0
+
+    @property
+    def _llm_type(self):
+        return "fake-eco-sorter"
+
+    @staticmethod
+    def _prompt_text(messages):
+        return "\n".join(str(m.content) for m in messages)
+
+    @staticmethod
+    def _answer(prompt):
+        context = prompt.split("CONTEXTE ISSU DU GUIDE DE TRI :")[-1].split("QUESTION DE L'UTILISATEUR")[0]
+        lines = [line.strip() for line in context.splitlines() if line.strip() and not line.startswith("#")]
+        if not lines:
+            return "Je n'ai pas l'information précise dans mon guide pour cet objet."
+        return f"D'après le guide : {lines[0]}"
+
+    @staticmethod
+    def _usage(prompt, answer):
+        from context_budget import estimate_tokens
+        input_tokens = estimate_tokens(prompt)
+        output_tokens = estimate_tokens(answer)
+        return {
+            "input_tokens": input_tokens,
+            "output_tokens": output_tokens,
+            "total_tokens": input_tokens + output_tokens
+        }
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        prompt = self._prompt_text(messages)
+        answer = self._answer(prompt)
+        usage = self._usage(prompt, answer)
+        time.sleep((self.latency_ms + self.token_latency_ms * usage["output_tokens"]) / 1000)
+        message = AIMessage(
+            content=answer,
+            usage_metadata=usage,
+            response_metadata={"token_usage": {
+                "prompt_tokens": usage["input_tokens"],
+                "completion_tokens": usage["output_tokens"],
+                "total_tokens": usage["total_tokens"]
+            }}
+        )
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        prompt = self._prompt_text(messages)
+        answer = self._answer(prompt)
+        usage = self._usage(prompt, answer)
+        time.sleep(self.latency_ms / 1000)
+        words = answer.split(" ")
+        for i, word in enumerate(words):
+            time.sleep(self.token_latency_ms / 1000)
+            last = i == len(words) - 1
+            yield ChatGenerationChunk(message=AIMessageChunk(
+                content=word if last else word + " ",
+                usage_metadata=usage if last else None
+            ))
+
+# --- OUTILS ---
+def summarize(samples_ms):
+    """
+    p50 / p95 / moyenne (ms) d'une liste de durées.
+    """
+    if not samples_ms:
+        return {"n": 0, "p50": None, "p95": None, "mean": None}
+    ordered = sorted(samples_ms)
+
+    def _percentile(q):
+        return ordered[min(len(ordered) - 1, max(0, round(q * len(ordered) + 0.5) - 1))]
+
+    return {
+        "n": len(ordered),
+        "p50": round(_percentile(0.50), 3),
+        "p95": round(_percentile(0.95), 3),
+        "mean": round(sum(ordered) / len(ordered), 3)
+    }
+
+def timed(fn, *args, **kwargs):
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, (time.perf_counter() - start) * 1000
+
+def load_gold(path=GOLD_PATH, regions=None):
+    """
+    Returns: liste de dicts {'region', 'id', 'question', 'expected'}
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        gold = json.load(f)
+    return [
+        {"region": region, **question}
+        for region in (regions or gold["regions"])
+        for question in gold["questions"]
+    ]
+
+def _hit(docs, expected):
+    return any(expected.lower() in doc.page_content.lower() for doc in docs)
+
+def git_commit():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=PROJECT_ROOT, stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+# --- BENCHMARKS ---
+def bench_retrieval(gold, k, repeat=1):
+    """
+    Latence par étape (embedding, recherche, query_vector_db, retrievers, assemblage) + recall@k.
+    search_numpy : même recherche sur l'index NumPy (numpy_store.py), s'il a été exporté.
+    """
+    from context_budget import assemble_context
+    from config import CONTEXT_MAX_TOKENS, NUMPY_STORE_PATH, RETRIEVER_FETCH_K, VECTOR_BACKEND
+    from engine import get_engine
+    from lexical_index import HybridRetriever
+    from numpy_store import NumpyVectorStore
+    from rag_engine import query_vector_db
+
+    engine = get_engine()
+    stages = {"embed": [], "search": [], "query_vector_db": [], "retrieve_vector": [], "retrieve_hybrid": [], "assemble": []}
+    try:
+        numpy_db = NumpyVectorStore(NUMPY_STORE_PATH, engine.embedding_function)
+        stages["search_numpy"] = []
+    except FileNotFoundError:
+        numpy_db = None
+    hits = {"vector": 0, "hybrid": 0}
+    per_question = []
+
+    for item in gold:
+        region = item["region"]
+        vector_retriever = engine.vector_db.as_retriever(search_kwargs={"k": k, "filter": {"region": region}})
+        hybrid_retriever = HybridRetriever(vector_store=engine.vector_db, region=region, k=k, fetch_k=RETRIEVER_FETCH_K)
+        for _ in range(repeat):
+            vector, ms = timed(engine.embedding_function.embed_query, item["question"])
+            stages["embed"].append(ms)
+            _, ms = timed(engine.vector_db.similarity_search_by_vector, vector, k, filter={"region": region})
+            stages["search"].append(ms)
+            if numpy_db is not None:
+                _, ms = timed(numpy_db.similarity_search_by_vector, vector, k, filter={"region": region})
+                stages["search_numpy"].append(ms)
+            _, ms = timed(query_vector_db, item["question"], region, n_results=k, verbose=False)
+            stages["query_vector_db"].append(ms)
+            vector_docs, ms = timed(vector_retriever.invoke, item["question"])
+            stages["retrieve_vector"].append(ms)
+            hybrid_docs, ms = timed(hybrid_retriever.invoke, item["question"])
+            stages["retrieve_hybrid"].append(ms)
+            _, ms = timed(assemble_context, hybrid_docs, CONTEXT_MAX_TOKENS)
+            stages["assemble"].append(ms)
+        vector_hit = _hit(vector_docs, item["expected"])
+        hybrid_hit = _hit(hybrid_docs, item["expected"])
+        hits["vector"] += vector_hit
+        hits["hybrid"] += hybrid_hit
+        per_question.append({"region": region, "id": item["id"], "vector_hit": vector_hit, "hybrid_hit": hybrid_hit})
+
+    n = len(gold) or 1
+    return {
+        "k": k,
+        "vector_backend": VECTOR_BACKEND,
+        "latency_ms": {stage: summarize(samples) for stage, samples in stages.items()},
+        "recall_at_k": {mode: round(count / n, 4) for mode, count in hits.items()},
+        "misses": [q for q in per_question if not q["hybrid_hit"]]
+    }
+
+def bench_agent(gold, repeat=1, batch_concurrency=8):
+    """
+    ask_agent de bout en bout avec le faux LLM : latence, tokens de prompt, débit.
+    """
+    from agent_logic import ask_agent, ask_agent_batch
+
+    latencies = []
+    input_tokens = []
+    context_tokens = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        for item in gold:
+            for _ in range(repeat):
+                response, ms = timed(ask_agent, item["question"], region=item["region"])
+                latencies.append(ms)
+                input_tokens.append(response["metrics"]["input_tokens"])
+                context_tokens.append(response["metrics"].get("context_tokens", 0))
+
+        items = [(item["question"], item["region"]) for item in gold]
+        _, batch_ms = timed(ask_agent_batch, items, max_concurrency=batch_concurrency)
+
+    return {
+        "latency_ms": summarize(latencies),
+        "prompt_tokens": {
+            "mean": round(sum(input_tokens) / len(input_tokens), 1) if input_tokens else 0,
+            "max": max(input_tokens, default=0),
+            "context_mean": round(sum(context_tokens) / len(context_tokens), 1) if context_tokens else 0
+        },
+        "throughput_qps": {
+            "sequential": round(1000 * len(latencies) / sum(latencies), 2) if latencies else 0,
+            "batch": round(1000 * len(items) / batch_ms, 2) if batch_ms else 0
+        }
+    }
+
+def bench_vision(images_dir=TEST_IMAGES_DIR, repeat=3, batch_size=8):
+    """
+    VisionModel.predict par image (sans cache) + débit de predict_batch.
+    """
+    from PIL import Image
+    from vision_model import MODEL_PATH, VisionModel
+
+    if not Path(MODEL_PATH).exists():
+        return {"skipped": f"poids introuvables : {MODEL_PATH}"}
+    paths = sorted(p for p in Path(images_dir).iterdir() if p.suffix.lower() in (".jpg", ".jpeg", ".png"))
+    images = [Image.open(p).convert("RGB") for p in paths]
+
+    model, load_ms = timed(VisionModel)
+    latencies = []
+    for _ in range(repeat):
+        for image in images:
+            _, ms = timed(model.predict, image)
+            latencies.append(ms)
+    _, batch_ms = timed(model.predict_batch, images * repeat, batch_size=batch_size)
+
+    return {
+        "backend": model.backend,
+        "imgsz": model.imgsz,
+        "images": len(images),
+        "load_ms": round(load_ms, 1),
+        "latency_ms": summarize(latencies),
+        "throughput_ips": {
+            "sequential": round(1000 * len(latencies) / sum(latencies), 2) if latencies else 0,
+            "batch": round(1000 * len(images) * repeat / batch_ms, 2) if batch_ms else 0
+        }
+    }
+
+def bench_video(images_dir=TEST_IMAGES_DIR, frames_per_image=30):
+    """
+    FPS soutenu du mode flux vidéo : data/test_images rejouées comme une vidéo 30 FPS.
+    """
+    from vision_model import MODEL_PATH
+    from video_stream import replay_benchmark
+
+    if not Path(MODEL_PATH).exists():
+        return {"skipped": f"poids introuvables : {MODEL_PATH}"}
+    report = replay_benchmark(images_dir, frames_per_image)
+    report["events"] = len(report["events"])
+    return report
+
+def run(args):
+    from config import EMBEDDING_BACKEND, RETRIEVAL_MODE, RETRIEVER_K
+    from engine import get_engine
+
+    # Le faux LLM remplace ChatMistralAI avant toute construction de chaîne
+    get_engine().set("llm", FakeEcoSorterChat(latency_ms=args.llm_latency_ms, token_latency_ms=args.token_latency_ms))
+
+    gold = load_gold(args.gold, args.region)
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "questions": len(gold),
+            "retrieval_mode": RETRIEVAL_MODE,
+            "retriever_k": RETRIEVER_K,
+            "embedding_backend": EMBEDDING_BACKEND,
+            "answer_cache": args.with_cache
+        }
+    }
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        get_engine().warmup(["embedder", "vector_db", "llm"], background=False)
+    report["meta"]["warmup_ms"] = round((time.perf_counter() - start) * 1000, 1)
+    report["meta"]["load_times_s"] = {k: round(v, 3) for k, v in get_engine().load_times.items()}
+
+    report["retrieval"] = bench_retrieval(gold, args.k or RETRIEVER_K, args.repeat)
+    if not args.skip_agent:
+        report["agent"] = bench_agent(gold, args.repeat)
+    if not args.skip_vision:
+        report["vision"] = bench_vision(args.images, repeat=args.repeat)
+    if not args.skip_video:
+        report["video"] = bench_video(args.images)
+    return report
+
+def print_summary(report):
+    retrieval = report["retrieval"]
+    print(f"\n--- Benchmark ({report['meta']['questions']} questions, commit {report['meta']['commit']}) ---")
+    for stage, stats in retrieval["latency_ms"].items():
+        print(f"{stage:18s} p50 {stats['p50']:>9} ms | p95 {stats['p95']:>9} ms")
+    print(f"recall@{retrieval['k']} : vecteurs {retrieval['recall_at_k']['vector']:.0%} | hybride {retrieval['recall_at_k']['hybrid']:.0%}")
+    if "agent" in report:
+        agent = report["agent"]
+        print(f"ask_agent          p50 {agent['latency_ms']['p50']:>9} ms | p95 {agent['latency_ms']['p95']:>9} ms")
+        print(f"tokens de prompt   moyenne {agent['prompt_tokens']['mean']} (contexte {agent['prompt_tokens']['context_mean']})")
+        print(f"débit              {agent['throughput_qps']['sequential']} q/s séquentiel | {agent['throughput_qps']['batch']} q/s par lot")
+    if "vision" in report:
+        vision = report["vision"]
+        if "skipped" in vision:
+            print(f"vision             ignorée ({vision['skipped']})")
+        else:
+            print(f"vision.predict     p50 {vision['latency_ms']['p50']:>9} ms | p95 {vision['latency_ms']['p95']:>9} ms "
+                  f"({vision['backend']}, imgsz {vision['imgsz']})")
+            print(f"débit vision       {vision['throughput_ips']['sequential']} img/s | {vision['throughput_ips']['batch']} img/s par lot")
+    if "video" in report:
+        video = report["video"]
+        if "skipped" in video:
+            print(f"vidéo              ignorée ({video['skipped']})")
+        else:
+            print(f"vidéo (rejeu)      {video['sustained_fps']} FPS soutenus | {video['processed_fps']} FPS traités "
+                  f"(pas {video['final_stride']}, {video['events']} objets)")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark hors-ligne Eco-Sorter (faux LLM, aucun appel réseau)")
+    parser.add_argument("--output", help="Fichier JSON de résultats (à comparer entre commits)")
+    parser.add_argument("--gold", default=str(GOLD_PATH), help="Jeu de questions de référence")
+    parser.add_argument("--region", action="append", help="Limite à une ou plusieurs régions")
+    parser.add_argument("--images", default=str(TEST_IMAGES_DIR))
+    parser.add_argument("-k", type=int, default=None, help="k de la récupération (défaut : RETRIEVER_K)")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--llm-latency-ms", type=float, default=0.0, help="Latence simulée du faux LLM")
+    parser.add_argument("--token-latency-ms", type=float, default=0.0, help="Latence simulée par token")
+    parser.add_argument("--with-cache", action="store_true", help="Laisse le cache de réponses actif")
+    parser.add_argument("--skip-agent", action="store_true")
+    parser.add_argument("--skip-vision", action="store_true")
+    parser.add_argument("--skip-video", action="store_true")
+    args = parser.parse_args()
+
+    # Le cache de réponses fausserait les latences : désactivé sauf demande explicite
+    # (à régler avant le premier import de config)
+    if not args.with_cache:
+        os.environ["ANSWER_CACHE_ENABLED"] = "0"
+    if "config" in sys.modules:
+        raise RuntimeError("config importé trop tôt : le benchmark doit régler l'environnement d'abord")
+
+    report = run(args)
+    print_summary(report)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\nRésultats écrits dans {args.output}")
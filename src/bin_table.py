@@ -0,0 +1,155 @@
+import argparse
+import os
+import threading
+import time
+
+from config import REGIONS, VECTORSTORE_PATH
+from ingestion_state import load_json, save_json, get_region_version
+from vision_model import CLASS_NAMES, CLASS_NAMES_FR
+
+# --- TABLE PRÉ-CALCULÉE CLASSE VISION -> CONSIGNE DE TRI ---
+# Le détecteur ne connaît que 7 classes : pour une région donnée il n'y a donc
+# que 7 réponses possibles à "où jeter ce déchet ?". On les calcule hors-ligne
+# (RAG + Mistral, une fois par région et par classe) et l'app répond
+# instantanément, sans token, quand l'utilisateur confirme une photo.
+# Chaque région est liée à la version de son guide : une ré-ingestion rend ses
+# réponses périmées jusqu'à la reconstruction (python bin_table.py ou
+# python rag_engine.py ingest --bin-table).
+BIN_TABLE_FILE = os.path.join(VECTORSTORE_PATH, "bin_table.json")
+
+# Question canonique posée au RAG pour chaque classe du détecteur
+CLASS_QUESTIONS = {
+    'Cardboard': "Où dois-je jeter un déchet en carton (boîte en carton propre, emballage en carton) ?",
+    'Garbage': "Où dois-je jeter mes ordures ménagères et déchets alimentaires (restes de repas, épluchures) ?",
+    'Glass': "Où dois-je jeter un déchet en verre (bouteille en verre, bocal, pot en verre) ?",
+    'Metal': "Où dois-je jeter un déchet en métal (canette, boîte de conserve, barquette en aluminium) ?",
+    'Paper': "Où dois-je jeter un déchet en papier (journal, magazine, feuille de papier) ?",
+    'Plastic': "Où dois-je jeter un déchet en plastique (bouteille, flacon, pot de yaourt, sachet) ?",
+    'Trash': "Où dois-je jeter un déchet non recyclable qui ne va dans aucune collecte sélective ?"
+}
+
+_table = {"mtime": None, "data": {}}
+_table_lock = threading.Lock()
+
+def load_bin_table():
+    """
+    Retourne la table {region: {'version', 'answers': {classe: entrée}}} (relue si modifiée).
+    """
+    try:
+        stat = os.stat(BIN_TABLE_FILE)
+    except OSError:
+        return {}
+    mtime = (stat.st_mtime_ns, stat.st_size)
+    with _table_lock:
+        if _table["mtime"] != mtime:
+            _table["data"] = load_json(BIN_TABLE_FILE, {})
+            _table["mtime"] = mtime
+        return _table["data"]
+
+def lookup_bin_answer(class_name, region):
+    """
+    Réponse pré-calculée pour une classe détectée dans une région.
+
+    Returns:
+        dict ou None: {'answer', 'question', 'built_at'} ; None si absente ou
+        périmée (guide ré-ingéré depuis) -> l'appelant repasse par le LLM.
+    """
+    region_table = load_bin_table().get(region)
+    if not region_table or region_table.get("version") != get_region_version(region):
+        return None
+    return region_table["answers"].get(class_name)
+
+def stale_regions(regions=None):
+    """
+    Régions dont la table est absente, incomplète ou liée à une ancienne version du guide.
+    Les classes sans réponse dans le guide ("unanswered") comptent comme traitées.
+    """
+    table = load_bin_table()
+    stale = []
+    for region in regions or REGIONS:
+        region_table = table.get(region)
+        if (
+            not region_table
+            or region_table.get("version") != get_region_version(region)
+            or set(region_table.get("answers", {})) | set(region_table.get("unanswered", [])) != set(CLASS_NAMES)
+        ):
+            stale.append(region)
+    return stale
+
+def build_bin_table(regions=None, force=False, max_concurrency=4):
+    """
+    (Re)construit la table pour les régions périmées, en un seul lot de questions
+    (agent_logic.ask_agent_batch : récupération groupée par région, concurrence bornée).
+
+    Returns:
+        list[str]: régions reconstruites
+    """
+    from agent_logic import ask_agent_batch
+
+    todo = list(regions or REGIONS) if force else stale_regions(regions)
+    if not todo:
+        print("Table classe -> sac à jour, rien à faire.")
+        return []
+
+    start = time.perf_counter()
+    versions = {region: get_region_version(region) for region in todo}
+    items = [(CLASS_QUESTIONS[class_name], region) for region in todo for class_name in CLASS_NAMES]
+    results = ask_agent_batch(items, max_concurrency=max_concurrency)
+
+    with _table_lock:
+        data = load_json(BIN_TABLE_FILE, {})
+        built = []
+        for i, region in enumerate(todo):
+            region_results = results[i * len(CLASS_NAMES):(i + 1) * len(CLASS_NAMES)]
+            errors = [r["error"] for r in region_results if r["error"]]
+            if errors:
+                print(f"❌ {region} : {len(errors)} réponse(s) en erreur, table non mise à jour ({errors[0]})")
+                continue
+            # Filtre de pertinence : aucun morceau du guide pour cette classe, la réponse
+            # serait la phrase de repli. On n'enregistre rien : lookup_bin_answer renvoie
+            # None et l'app repasse par le LLM, comme pour le cache des réponses.
+            unanswered = [
+                class_name for class_name, result in zip(CLASS_NAMES, region_results)
+                if result["metrics"].get("out_of_scope")
+            ]
+            if unanswered:
+                print(f"⚠️ {region} : pas d'information dans le guide pour {', '.join(unanswered)}")
+            data[region] = {
+                "version": versions[region],
+                "answers": {
+                    class_name: {
+                        "answer": result["answer"],
+                        "question": CLASS_QUESTIONS[class_name],
+                        "built_at": time.time()
+                    }
+                    for class_name, result in zip(CLASS_NAMES, region_results)
+                    if class_name not in unanswered
+                },
+                "unanswered": unanswered
+            }
+            built.append(region)
+        save_json(BIN_TABLE_FILE, data)
+        _table["mtime"] = None
+
+    print(f"✅ Table classe -> sac reconstruite pour {len(built)} région(s) en {time.perf_counter() - start:.1f} s")
+    return built
+
+def describe_class(class_name):
+    return CLASS_NAMES_FR.get(class_name, class_name.lower())
+
+if __name__ == "__main__":
+    # python bin_table.py [--force] [--region bruxelles ...]
+    parser = argparse.ArgumentParser(description="Table pré-calculée classe vision -> consigne de tri")
+    parser.add_argument("--force", action="store_true", help="Reconstruit même les régions à jour")
+    parser.add_argument("--region", action="append", help="Limite à une ou plusieurs régions")
+    parser.add_argument("--show", action="store_true", help="Affiche la table au lieu de la construire")
+    args = parser.parse_args()
+
+    if args.show:
+        for region in args.region or REGIONS:
+            print(f"\n--- {region} ---")
+            for class_name in CLASS_NAMES:
+                entry = lookup_bin_answer(class_name, region)
+                print(f"[{describe_class(class_name)}] {entry['answer'] if entry else '(absente ou périmée)'}")
+    else:
+        build_bin_table(regions=args.region, force=args.force)
@@ -0,0 +1,148 @@
+import io
+import json
+
+import httpx
+from PIL import Image
+
+from config import SERVICE_URL, SERVICE_TIMEOUT
+from engine import ConfigurationError
+
+# --- CLIENT LÉGER DU SERVICE D'INFÉRENCE (service.py) ---
+# Mêmes fonctions que agent_logic / vision_model / bin_table / engine, mais
+# chaque appel part en HTTP : l'interface Streamlit ne charge aucun modèle.
+# Activé dans app.py quand SERVICE_URL est défini.
+
+_client = None
+
+def get_client():
+    global _client
+    if _client is None:
+        _client = httpx.Client(base_url=SERVICE_URL, timeout=SERVICE_TIMEOUT)
+    return _client
+
+def _raise_for_error(response):
+    if response.status_code < 400:
+        return
+    try:
+        payload = response.json()
+    except ValueError:
+        payload = {"error": response.text}
+    if payload.get("configuration"):
+        raise ConfigurationError(payload["error"])
+    raise RuntimeError(f"Service d'inférence ({response.status_code}) : {payload.get('error')}")
+
+def _error_result(error):
+    # Même format que agent_logic._error_response
+    return {
+        "answer": "Désolé, une erreur technique est survenue.",
+        "metrics": {"input_tokens": 0, "output_tokens": 0, "total_tokens": 0, "cache_hit": False},
+        "error": str(error)
+    }
+
+# --- AGENT ---
+def ask_agent(user_input, region="bruxelles"):
+    response = get_client().post("/ask", json={"question": user_input, "region": region})
+    _raise_for_error(response)
+    return response.json()
+
+class RemoteAgentStream:
+    """
+    Équivalent distant de agent_logic.AgentStream (flux NDJSON de /ask/stream).
+    """
+    def __init__(self, user_input, region):
+        self.user_input = user_input
+        self.region = region
+        self.result = None
+
+    def __iter__(self):
+        try:
+            with get_client().stream("POST", "/ask/stream", json={"question": self.user_input, "region": self.region}) as response:
+                if response.status_code >= 400:
+                    response.read()
+                    _raise_for_error(response)
+                for line in response.iter_lines():
+                    if not line:
+                        continue
+                    message = json.loads(line)
+                    if "chunk" in message:
+                        yield message["chunk"]
+                    elif "result" in message:
+                        self.result = message["result"]
+                    elif message.get("configuration"):
+                        raise ConfigurationError(message["error"])
+                    else:
+                        raise RuntimeError(message.get("error"))
+        except ConfigurationError:
+            raise
+        except (httpx.HTTPError, RuntimeError) as e:
+            print(f"❌ Erreur service : {e}")
+            self.result = _error_result(e)
+            yield self.result["answer"]
+
+def stream_agent(user_input, region="bruxelles"):
+    return RemoteAgentStream(user_input, region)
+
+def ask_agent_multi(objects, region="bruxelles"):
+    response = get_client().post("/ask/multi", json={"objects": list(objects), "region": region})
+    _raise_for_error(response)
+    return response.json()
+
+def query_vector_db(question, region_name, n_results=4):
+    """
+    Returns:
+        list[dict]: {'content', 'metadata'} par morceau
+    """
+    response = get_client().post("/query", json={"question": question, "region": region_name, "k": n_results})
+    _raise_for_error(response)
+    return response.json()["results"]
+
+# --- VISION ---
+def predict_cached(image, conf_threshold=0.5):
+    """
+    Envoie l'image (PNG) au service ; le cache et les micro-lots sont côté service.
+    """
+    return _predict(image, conf_threshold, "best")
+
+def predict_all_cached(image, conf_threshold=0.5):
+    return _predict(image, conf_threshold, "all")
+
+def _predict(image, conf_threshold, kind):
+    if isinstance(image, Image.Image):
+        buffer = io.BytesIO()
+        image.convert("RGB").save(buffer, format="PNG")
+        data = buffer.getvalue()
+    else:
+        with open(image, "rb") as f:
+            data = f.read()
+    response = get_client().post("/predict", params={"conf": conf_threshold, "mode": kind}, content=data,
+                                 headers={"content-type": "application/octet-stream"})
+    _raise_for_error(response)
+    return response.json()
+
+def lookup_bin_answer(class_name, region):
+    response = get_client().get("/bin", params={"class_name": class_name, "region": region})
+    if response.status_code == 404:
+        return None
+    _raise_for_error(response)
+    return response.json()
+
+# --- ÉTAT DU MOTEUR DISTANT ---
+class RemoteEngine:
+    """
+    Interface de engine.Engine utilisée par app.py (status / warmup).
+    """
+    def warmup(self, components=None, background=True):
+        # Le service se préchauffe lui-même au démarrage
+        return None
+
+    def status(self):
+        try:
+            response = get_client().get("/ready")
+            return response.json()["components"]
+        except (httpx.HTTPError, ValueError, KeyError) as e:
+            return {"service": {"state": "error", "seconds": None, "error": f"{SERVICE_URL} injoignable : {e}"}}
+
+_remote_engine = RemoteEngine()
+
+def get_engine():
+    return _remote_engine
@@ -0,0 +1,137 @@
+import os
+from dotenv import load_dotenv
+
+# Les réglages ci-dessous peuvent être surchargés dans le .env
+load_dotenv()
+
+# --- CONFIGURATION PARTAGÉE ---
+# Chemins communs à tous les modules (app, agent, RAG, vision)
+current_dir = os.path.dirname(os.path.abspath(__file__))
+root_dir = os.path.dirname(current_dir)
+VECTORSTORE_PATH = os.path.join(root_dir, "data", "vectorstore")
+DOCUMENTS_PATH = os.path.join(root_dir, "data", "documents")
+
+# Libellé affiché dans l'app -> tag "region" stocké dans les métadonnées Chroma
+REGION_MAPPING = {
+    "Bruxelles": "bruxelles",
+    "Hainaut": "hainaut",
+    "Anvers": "antwerp",
+    "Liège": "liege",
+    "Namur": "namur",
+    "Brabant Wallon": "brabant_wallon",
+    "Charleroi": "charleroi",
+    "Luxembourg": "luxembourg",
+    "Mons": "mons"
+}
+
+REGIONS = list(REGION_MAPPING.values())
+
+# --- BACKEND VECTORIEL (engine.py) ---
+# "chroma" (base persistante, sert aussi à l'ingestion) ou "numpy" : shards .npy par
+# région lus en mémoire partagée (numpy_store.py), exportés depuis Chroma
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "chroma")
+NUMPY_STORE_PATH = os.getenv("NUMPY_STORE_PATH", os.path.join(root_dir, "data", "vectorstore_numpy"))
+NUMPY_STORE_DTYPE = os.getenv("NUMPY_STORE_DTYPE", "float32")  # "float32" ou "int8" (4x plus petit)
+
+# --- CACHE DES RÉPONSES (agent_logic) ---
+CACHE_DIR = os.path.join(root_dir, "data", "cache")
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "1") == "1"
+ANSWER_CACHE_PERSIST = os.getenv("ANSWER_CACHE_PERSIST", "1") == "1"
+ANSWER_CACHE_PATH = os.getenv("ANSWER_CACHE_PATH", os.path.join(CACHE_DIR, "answer_cache.json"))
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "256"))  # par région
+ANSWER_CACHE_TTL_SECONDS = int(os.getenv("ANSWER_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+ANSWER_CACHE_SIMILARITY = float(os.getenv("ANSWER_CACHE_SIMILARITY", "0.92"))
+
+# --- INGESTION ---
+# Suffixe du fichier guide_<suffixe>.txt/pdf -> tag région (si différent du suffixe)
+GUIDE_REGION_ALIASES = {
+    "bw": "brabant_wallon"
+}
+# Découpage des guides (rag_engine.py) ; context_budget.py s'appuie sur le même recouvrement
+CHUNK_SIZE = 350
+CHUNK_OVERLAP = 50
+
+# --- EMBEDDINGS (embeddings.py) ---
+# "torch" (sentence-transformers), "onnx" ou "onnx-int8" (ONNX Runtime, sans PyTorch au runtime)
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch")
+EMBEDDING_ONNX_DIR = os.getenv("EMBEDDING_ONNX_DIR", os.path.join(root_dir, "data", "models"))
+EMBEDDING_THREADS = int(os.getenv("EMBEDDING_THREADS", "0")) or None
+
+# --- VISION (vision_model.py) ---
+# Profil d'inférence (choisi avec python vision_profile.py) : run d'entraînement
+# (models_training_runs/<run>/weights/best.pt) ou chemin explicite des poids,
+# taille d'entrée, backend et threads CPU
+VISION_RUN = os.getenv("VISION_RUN", "eco_sorter_v5")
+VISION_WEIGHTS = os.getenv("VISION_WEIGHTS", "")  # prioritaire sur VISION_RUN si défini
+# "torch" (poids .pt) ou "onnx" (export ONNX Runtime mis en cache à côté du .pt)
+VISION_BACKEND = os.getenv("VISION_BACKEND", "torch")
+VISION_IMGSZ = int(os.getenv("VISION_IMGSZ", "640"))
+VISION_THREADS = int(os.getenv("VISION_THREADS", "0")) or None  # 0 = défaut du backend
+# Cache des prédictions (0 = désactivé) ; mode "exact" ou "perceptual" (ré-encodages proches)
+VISION_CACHE_SIZE = int(os.getenv("VISION_CACHE_SIZE", "256"))
+VISION_CACHE_MODE = os.getenv("VISION_CACHE_MODE", "exact")
+VISION_CACHE_MAX_DISTANCE = int(os.getenv("VISION_CACHE_MAX_DISTANCE", "4"))
+
+# --- LLM (engine.py) ---
+LLM_MODEL = os.getenv("LLM_MODEL", "mistral-small-latest")
+LLM_TEMPERATURE = float(os.getenv("LLM_TEMPERATURE", "0.1"))
+
+# --- RÉCUPÉRATION (agent_logic) ---
+# "hybrid" = vecteurs + BM25 fusionnés (lexical_index.py), "vector" = vecteurs seuls
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "hybrid")
+# k par défaut : 2 en hybride (la fusion remonte le bon morceau en tête) ; 4 en vectoriel
+# seul, comme avant la recherche hybride (le bon morceau peut n'arriver qu'en 4e position)
+RETRIEVER_K = int(os.getenv("RETRIEVER_K", "2" if RETRIEVAL_MODE == "hybrid" else "4"))
+RETRIEVER_FETCH_K = int(os.getenv("RETRIEVER_FETCH_K", "8"))  # candidats par classement avant fusion
+
+# --- FILTRE DE PERTINENCE (relevance_gate.py) ---
+# Question hors sujet (aucun morceau assez proche) : réponse de repli locale, sans appel Mistral.
+# Seuils par région calibrés sur un jeu de questions étiquetées (python relevance_gate.py).
+RELEVANCE_GATE_ENABLED = os.getenv("RELEVANCE_GATE_ENABLED", "1") == "1"
+RELEVANCE_THRESHOLDS_PATH = os.getenv("RELEVANCE_THRESHOLDS_PATH", os.path.join(root_dir, "data", "relevance_thresholds.json"))
+# Seuil des régions non calibrées (0 = pas de filtre pour ces régions)
+RELEVANCE_DEFAULT_THRESHOLD = float(os.getenv("RELEVANCE_DEFAULT_THRESHOLD", "0")) or None
+
+# --- BUDGET DE CONTEXTE (context_budget.py) ---
+# Plafond (estimé) de tokens du contexte injecté dans le prompt ; 0 = pas de plafond
+CONTEXT_MAX_TOKENS = int(os.getenv("CONTEXT_MAX_TOKENS", "400")) or None
+
+# --- TÉLÉMÉTRIE (telemetry.py) ---
+# "none" (durées par étape dans les métriques uniquement), "console", "file"
+# (JSON lignes dans TELEMETRY_FILE, sans collecteur) ou "otlp" (collecteur
+# OpenTelemetry, adresse via OTEL_EXPORTER_OTLP_ENDPOINT)
+TELEMETRY_EXPORTER = os.getenv("TELEMETRY_EXPORTER", "none")
+TELEMETRY_FILE = os.getenv("TELEMETRY_FILE", os.path.join(root_dir, "data", "telemetry", "otel.jsonl"))
+TELEMETRY_SERVICE_NAME = os.getenv("TELEMETRY_SERVICE_NAME", "eco-sorter")
+TELEMETRY_METRICS_INTERVAL_MS = int(os.getenv("TELEMETRY_METRICS_INTERVAL_MS", "60000"))
+
+# --- SERVICE D'INFÉRENCE HTTP (service.py) ---
+# Si SERVICE_URL est défini (ex : http://127.0.0.1:8000), app.py devient un client
+# léger : les modèles ne sont chargés qu'une fois, dans le service.
+SERVICE_URL = os.getenv("SERVICE_URL", "").rstrip("/")
+SERVICE_HOST = os.getenv("SERVICE_HOST", "127.0.0.1")
+SERVICE_PORT = int(os.getenv("SERVICE_PORT", "8000"))
+SERVICE_WORKERS = int(os.getenv("SERVICE_WORKERS", "4"))  # threads pour les appels bloquants
+SERVICE_TIMEOUT = float(os.getenv("SERVICE_TIMEOUT", "60"))  # côté client, en secondes
+# Micro-lots vision : les images reçues dans la fenêtre passent en une seule passe YOLO
+SERVICE_VISION_BATCH_SIZE = int(os.getenv("SERVICE_VISION_BATCH_SIZE", "8"))
+SERVICE_VISION_BATCH_WAIT_MS = float(os.getenv("SERVICE_VISION_BATCH_WAIT_MS", "10"))
+
+# --- FLUX VIDÉO (video_stream.py) ---
+VIDEO_TARGET_FPS = float(os.getenv("VIDEO_TARGET_FPS", "10"))  # images traitées par YOLO / s
+VIDEO_MIN_HITS = int(os.getenv("VIDEO_MIN_HITS", "3"))  # images où l'objet doit être vu avant l'événement
+VIDEO_MAX_MISSED = int(os.getenv("VIDEO_MAX_MISSED", "5"))  # images manquées avant d'oublier l'objet
+VIDEO_IOU_THRESHOLD = float(os.getenv("VIDEO_IOU_THRESHOLD", "0.3"))
+
+# --- PROTECTION DU QUOTA MISTRAL (throttling.py) ---
+# Limiteur côté client partagé par tous les appels du process (0 = pas de limite)
+LLM_RATE_LIMIT_RPS = float(os.getenv("LLM_RATE_LIMIT_RPS", "0"))
+LLM_RATE_LIMIT_BURST = int(os.getenv("LLM_RATE_LIMIT_BURST", "0")) or None
+# Nouvelles tentatives sur erreurs transitoires (429, 5xx, réseau), backoff à gigue
+LLM_RETRY_ATTEMPTS = int(os.getenv("LLM_RETRY_ATTEMPTS", "4"))
+LLM_RETRY_BASE_SECONDS = float(os.getenv("LLM_RETRY_BASE_SECONDS", "0.5"))
+LLM_RETRY_MAX_SECONDS = float(os.getenv("LLM_RETRY_MAX_SECONDS", "8"))
+# Questions identiques (région + question normalisée) en cours : un seul appel Mistral
+LLM_SINGLE_FLIGHT = os.getenv("LLM_SINGLE_FLIGHT", "1") == "1"
+# Attente max d'une question coalescée avant de lancer son propre appel (secondes)
+LLM_SINGLE_FLIGHT_TIMEOUT_SECONDS = float(os.getenv("LLM_SINGLE_FLIGHT_TIMEOUT_SECONDS", "60"))
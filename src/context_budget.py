@@ -0,0 +1,154 @@
+import math
+import re
+
+from config import CHUNK_OVERLAP
+
+# --- ASSEMBLAGE DU CONTEXTE (entre le retriever et le prompt) ---
+# Les tokens d'entrée sont notre premier coût LLM. Or le splitter recouvre les
+# morceaux (CHUNK_OVERLAP) et la récupération peut renvoyer deux fois le
+# même texte : on fusionne les morceaux qui se chevauchent, on retire les
+# doublons (exacts et quasi-exacts), on garde l'ordre de pertinence et on
+# plafonne le contexte à un budget de tokens.
+
+CHARS_PER_TOKEN = 3.5  # estimation pour du français (pas de tokenizer Mistral en local)
+
+def estimate_tokens(text):
+    """
+    Estimation du nombre de tokens d'un texte.
+    """
+    return math.ceil(len(text) / CHARS_PER_TOKEN) if text else 0
+
+def _normalize(text):
+    return " ".join(text.split()).lower()
+
+def _shingles(text, size=3):
+    words = re.findall(r"\w+", text.lower())
+    if len(words) < size:
+        return {tuple(words)}
+    return {tuple(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+def _jaccard(a, b):
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+def _overlap(a, b, min_overlap=CHUNK_OVERLAP // 2, max_overlap=CHUNK_OVERLAP):
+    """
+    Longueur du recouvrement laissé par le splitter entre la fin de `a` et le début
+    de `b` (0 si aucun). Le splitter recouvre au plus CHUNK_OVERLAP caractères, en
+    coupant entre deux mots : une courte expression commune ("sac PMC") ne compte pas.
+    """
+    for n in range(min(len(a), len(b), max_overlap), min_overlap - 1, -1):
+        if a.endswith(b[:n]) and (n == len(a) or a[-n - 1].isspace()):
+            return n
+    return 0
+
+def _position_overlap(a, b):
+    """
+    Recouvrement de `a` puis `b` d'après leur position dans le document
+    (metadata start_index du splitter) ; None si une position manque.
+    """
+    if a["start"] is None or b["start"] is None:
+        return None
+    if not a["start"] < b["start"] < a["start"] + len(a["text"]):
+        return 0
+    return a["start"] + len(a["text"]) - b["start"]
+
+def _merge_overlapping(chunks):
+    """
+    Fusionne les morceaux voisins d'une même source (et page) qui se recouvrent :
+    d'après leur position si elle est connue, sinon d'après le recouvrement du splitter.
+    chunks : liste de dicts {'text', 'source', 'page', 'start', 'rank'} (rank = meilleure position)
+    """
+    merged = True
+    while merged:
+        merged = False
+        for i, a in enumerate(chunks):
+            for j, b in enumerate(chunks):
+                if i == j or (a["source"], a["page"]) != (b["source"], b["page"]):
+                    continue
+                n = _position_overlap(a, b)
+                if n is None:
+                    n = _overlap(a["text"], b["text"])
+                if n:
+                    a["text"] = a["text"] + b["text"][n:]
+                    a["rank"] = min(a["rank"], b["rank"])
+                    del chunks[j]
+                    merged = True
+                    break
+            if merged:
+                break
+    return chunks
+
+def assemble_context(docs, max_tokens=None, near_duplicate_threshold=0.85):
+    """
+    Construit le contexte envoyé au LLM à partir des documents récupérés.
+
+    Args:
+        docs: Documents triés du plus au moins pertinent (ordre du retriever),
+              ou liste de (Document, score) - score plus grand = plus pertinent
+        max_tokens: budget de tokens du contexte (None = pas de plafond)
+        near_duplicate_threshold: similarité de Jaccard (trigrammes de mots)
+              au-delà de laquelle deux morceaux sont considérés identiques
+
+    Returns:
+        (str, dict): le contexte et ses statistiques
+            {'context_tokens', 'raw_context_tokens', 'context_tokens_saved',
+             'chunks_in', 'chunks_out'}
+    """
+    if docs and isinstance(docs[0], tuple):
+        docs = [doc for doc, _ in sorted(docs, key=lambda pair: pair[1], reverse=True)]
+
+    raw_tokens = estimate_tokens("\n\n".join(d.page_content for d in docs))
+
+    # 1. Doublons exacts puis quasi-doublons (on garde le mieux classé)
+    kept = []
+    seen = set()
+    for rank, doc in enumerate(docs):
+        text = doc.page_content.strip()
+        key = _normalize(text)
+        if not text or key in seen:
+            continue
+        shingles = _shingles(text)
+        if any(_jaccard(shingles, other["shingles"]) >= near_duplicate_threshold for other in kept):
+            continue
+        seen.add(key)
+        kept.append({
+            "text": text,
+            "source": doc.metadata.get("source"),
+            "page": doc.metadata.get("page"),
+            "start": doc.metadata.get("start_index"),
+            "rank": rank,
+            "shingles": shingles
+        })
+
+    # 2. Fusion des morceaux adjacents/chevauchants d'une même source
+    chunks = _merge_overlapping(kept)
+
+    # 3. Ordre de pertinence + budget de tokens : un morceau trop long est sauté,
+    #    les suivants peuvent encore tenir dans le budget restant
+    chunks.sort(key=lambda c: c["rank"])
+    parts = []
+    used = 0
+    separator_tokens = estimate_tokens("\n\n")
+    for chunk in chunks:
+        tokens = estimate_tokens(chunk["text"])
+        cost = tokens + (separator_tokens if parts else 0)
+        if max_tokens is not None and used + cost > max_tokens:
+            if not parts:
+                # Le meilleur morceau dépasse à lui seul le budget : on le tronque
+                parts.append(chunk["text"][:int(max_tokens * CHARS_PER_TOKEN)])
+                used = estimate_tokens(parts[0])
+            continue
+        parts.append(chunk["text"])
+        used += cost
+
+    context = "\n\n".join(parts)
+    context_tokens = estimate_tokens(context)
+    return context, {
+        "context_tokens": context_tokens,
+        "raw_context_tokens": raw_tokens,
+        "context_tokens_saved": max(0, raw_tokens - context_tokens),
+        "chunks_in": len(docs),
+        "chunks_out": len(parts)
+    }
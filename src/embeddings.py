@@ -0,0 +1,285 @@
+import argparse
+import os
+import threading
+import time
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from config import EMBEDDING_BACKEND, EMBEDDING_ONNX_DIR, EMBEDDING_THREADS
+from telemetry import stage
+
+# --- EMBEDDER PARTAGÉ (ingestion + requêtes) ---
+# Un seul modèle all-MiniLM-L6-v2 par processus, quel que soit le module qui
+# l'utilise (rag_engine, agent_logic, cache de réponses).
+# Backends (variable EMBEDDING_BACKEND) :
+#   "torch"     : HuggingFaceEmbeddings (sentence-transformers + PyTorch)
+#   "onnx"      : ONNX Runtime, même modèle exporté en float32
+#   "onnx-int8" : ONNX Runtime, poids quantifiés en int8 (plus léger/rapide)
+# Les vecteurs ONNX sont alignés sur ceux de PyTorch (vérifier avec --parity).
+EMBEDDING_MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
+MAX_SEQ_LENGTH = 256  # max_seq_length de all-MiniLM-L6-v2
+
+def embedding_signature(backend=EMBEDDING_BACKEND):
+    """
+    Identité des vecteurs produits : modèle + backend (dont la quantification
+    "onnx-int8"). Des vecteurs de signatures différentes ne se mélangent pas
+    (manifeste d'ingestion, index NumPy, seuils de pertinence).
+    """
+    return {"embedding_model": EMBEDDING_MODEL_NAME, "embedding_backend": backend}
+
+class OnnxMiniLMEmbeddings(Embeddings):
+    """
+    Embeddings MiniLM via ONNX Runtime (interface LangChain Embeddings).
+    Reproduit le pipeline sentence-transformers : Transformer -> mean pooling -> normalisation L2.
+
+    Args:
+        model_name: modèle Hugging Face à exporter
+        quantize: True pour utiliser la version int8 (quantification dynamique)
+        cache_dir: dossier où l'export ONNX et le tokenizer sont conservés
+        batch_size: taille des lots d'encodage
+        num_threads: threads intra-op ONNX Runtime (None = défaut ORT)
+    """
+    def __init__(self, model_name=EMBEDDING_MODEL_NAME, quantize=False, cache_dir=EMBEDDING_ONNX_DIR,
+                 batch_size=64, num_threads=None):
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        self.model_name = model_name
+        self.quantize = quantize
+        self.batch_size = batch_size
+        self.cache_dir = os.path.join(cache_dir, model_name.split("/")[-1])
+
+        model_path = self._ensure_exported()
+
+        self.tokenizer = Tokenizer.from_file(os.path.join(self.cache_dir, "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_length=MAX_SEQ_LENGTH)
+        self.tokenizer.enable_padding(pad_id=0, pad_token="[PAD]")
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+        self.session = ort.InferenceSession(model_path, options, providers=["CPUExecutionProvider"])
+        self._input_names = {i.name for i in self.session.get_inputs()}
+
+    # --- EXPORT (une seule fois, puis réutilisé depuis le disque) ---
+    def _ensure_exported(self):
+        fp32_path = os.path.join(self.cache_dir, "model.onnx")
+        int8_path = os.path.join(self.cache_dir, "model_int8.onnx")
+
+        if not os.path.exists(fp32_path) or not os.path.exists(os.path.join(self.cache_dir, "tokenizer.json")):
+            self._export(fp32_path)
+
+        if not self.quantize:
+            return fp32_path
+        if not os.path.exists(int8_path):
+            from onnxruntime.quantization import QuantType, quantize_dynamic
+            print(f"Quantification int8 de {self.model_name}...")
+            quantize_dynamic(fp32_path, int8_path, weight_type=QuantType.QInt8)
+        return int8_path
+
+    def _export(self, onnx_path):
+        # PyTorch n'est nécessaire que pour cet export
+        import torch
+        from transformers import AutoModel, AutoTokenizer
+
+        print(f"Export ONNX de {self.model_name} vers {self.cache_dir}...")
+        os.makedirs(self.cache_dir, exist_ok=True)
+        tokenizer = AutoTokenizer.from_pretrained(self.model_name)
+        tokenizer.save_pretrained(self.cache_dir)
+        model = AutoModel.from_pretrained(self.model_name).eval()
+
+        class _LastHiddenState(torch.nn.Module):
+            def __init__(self, model):
+                super().__init__()
+                self.model = model
+
+            def forward(self, input_ids, attention_mask, token_type_ids):
+                return self.model(
+                    input_ids=input_ids,
+                    attention_mask=attention_mask,
+                    token_type_ids=token_type_ids
+                ).last_hidden_state
+
+        sample = tokenizer(["Où jeter une peau de banane ?"], return_tensors="pt")
+        dynamic_axes = {"batch": 0, "sequence": 1}
+        with torch.no_grad():
+            torch.onnx.export(
+                _LastHiddenState(model),
+                (sample["input_ids"], sample["attention_mask"], sample["token_type_ids"]),
+                onnx_path,
+                input_names=["input_ids", "attention_mask", "token_type_ids"],
+                output_names=["last_hidden_state"],
+                dynamic_axes={
+                    "input_ids": dynamic_axes,
+                    "attention_mask": dynamic_axes,
+                    "token_type_ids": dynamic_axes,
+                    "last_hidden_state": dynamic_axes
+                },
+                opset_version=17,
+                dynamo=False
+            )
+        print("✅ Export ONNX terminé")
+
+    # --- ENCODAGE ---
+    def _encode(self, texts):
+        encodings = self.tokenizer.encode_batch(texts)
+        input_ids = np.array([e.ids for e in encodings], dtype=np.int64)
+        attention_mask = np.array([e.attention_mask for e in encodings], dtype=np.int64)
+        feeds = {"input_ids": input_ids, "attention_mask": attention_mask}
+        if "token_type_ids" in self._input_names:
+            feeds["token_type_ids"] = np.array([e.type_ids for e in encodings], dtype=np.int64)
+
+        hidden = self.session.run(None, feeds)[0]
+
+        # Mean pooling sur les tokens réels puis normalisation L2
+        mask = attention_mask[..., None].astype(np.float32)
+        pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        norms = np.linalg.norm(pooled, axis=1, keepdims=True)
+        return pooled / np.clip(norms, 1e-12, None)
+
+    def embed_documents(self, texts):
+        vectors = []
+        for i in range(0, len(texts), self.batch_size):
+            vectors.extend(self._encode(list(texts[i:i + self.batch_size])).tolist())
+        return vectors
+
+    def embed_query(self, text):
+        return self._encode([text])[0].tolist()
+
+def load_embedding_function(backend=EMBEDDING_BACKEND):
+    """
+    Instancie un embedder du backend demandé ("torch", "onnx" ou "onnx-int8").
+    """
+    if backend == "torch":
+        from langchain_huggingface import HuggingFaceEmbeddings
+        return HuggingFaceEmbeddings(
+            model_name=EMBEDDING_MODEL_NAME,
+            encode_kwargs={"batch_size": 64}
+        )
+    if backend in ("onnx", "onnx-int8"):
+        return OnnxMiniLMEmbeddings(quantize=backend == "onnx-int8", num_threads=EMBEDDING_THREADS)
+    raise ValueError(f"EMBEDDING_BACKEND inconnu : {backend!r} (attendu : torch, onnx, onnx-int8)")
+
+class InstrumentedEmbeddings(Embeddings):
+    """
+    Embedder mesuré : chaque appel est une étape "embed" (telemetry.py).
+    Utilisé par le moteur ; l'ingestion garde l'embedder nu.
+    """
+    def __init__(self, embeddings):
+        self.embeddings = embeddings
+
+    def embed_documents(self, texts):
+        with stage("embed", texts=len(texts)):
+            return self.embeddings.embed_documents(texts)
+
+    def embed_query(self, text):
+        with stage("embed", texts=1):
+            return self.embeddings.embed_query(text)
+
+_embedding_function = None
+_embedding_lock = threading.Lock()
+
+def get_embedding_function():
+    """
+    Retourne l'embedder partagé du processus (chargé une seule fois).
+    """
+    global _embedding_function
+    if _embedding_function is None:
+        with _embedding_lock:
+            if _embedding_function is None:
+                start = time.perf_counter()
+                _embedding_function = load_embedding_function()
+                print(f"✅ Embedder '{EMBEDDING_BACKEND}' chargé en {time.perf_counter() - start:.1f} s")
+    return _embedding_function
+
+# --- VÉRIFICATION DE PARITÉ (PyTorch vs ONNX) ---
+PARITY_QUERIES = [
+    "Dans quel sac mettre une peau de banane ?",
+    "Où jeter une bouteille de Javel ?",
+    "Une boîte à pizza sale va dans quel sac ?",
+    "Que faire de mes piles usagées ?",
+    "Où jeter un pot de yaourt ?",
+    "Les bouteilles en verre vont où ?"
+]
+
+def check_parity(backend="onnx", k=4, min_cosine=0.99):
+    """
+    Compare les embeddings du backend ONNX à ceux de PyTorch sur les vrais
+    morceaux des guides, et vérifie que le top-k récupéré par région est identique.
+
+    Returns:
+        dict: similarités cosinus, accord du top-k et latences
+    """
+    from rag_engine import dedupe_chunks, discover_guides, load_and_split
+
+    chunks = []
+    for filename, region_name in discover_guides():
+        chunks.extend(dedupe_chunks(load_and_split(filename, region_name))[1])
+    texts = [doc.page_content for doc in chunks]
+    regions = np.array([doc.metadata["region"] for doc in chunks])
+
+    reports = {}
+    vectors = {}
+    for name in ("torch", backend):
+        start = time.perf_counter()
+        embedder = load_embedding_function(name)
+        load_seconds = time.perf_counter() - start
+        doc_vectors = np.asarray(embedder.embed_documents(texts), dtype=np.float32)
+        start = time.perf_counter()
+        query_vectors = np.asarray([embedder.embed_query(q) for q in PARITY_QUERIES], dtype=np.float32)
+        query_ms = (time.perf_counter() - start) * 1000 / len(PARITY_QUERIES)
+        vectors[name] = (doc_vectors, query_vectors)
+        reports[name] = {"load_seconds": round(load_seconds, 2), "query_ms": round(query_ms, 2)}
+
+    ref_docs, ref_queries = vectors["torch"]
+    new_docs, new_queries = vectors[backend]
+    cosines = np.sum(ref_docs * new_docs, axis=1) / (
+        np.linalg.norm(ref_docs, axis=1) * np.linalg.norm(new_docs, axis=1)
+    )
+
+    # Accord du top-k : pour chaque question et chaque région, mêmes morceaux retrouvés ?
+    same_topk = 0
+    total = 0
+    for region in sorted(set(regions)):
+        idx = np.where(regions == region)[0]
+        ref_top = np.argsort(-(ref_queries @ ref_docs[idx].T), axis=1)[:, :k]
+        new_top = np.argsort(-(new_queries @ new_docs[idx].T), axis=1)[:, :k]
+        for a, b in zip(ref_top, new_top):
+            same_topk += set(a) == set(b)
+            total += 1
+
+    result = {
+        "backend": backend,
+        "chunks": len(texts),
+        "cosine_min": float(cosines.min()),
+        "cosine_mean": float(cosines.mean()),
+        "topk_agreement": same_topk / total if total else 1.0,
+        "timings": reports
+    }
+    result["ok"] = result["cosine_min"] >= min_cosine and result["topk_agreement"] == 1.0
+    return result
+
+if __name__ == "__main__":
+    # python embeddings.py --parity [--backend onnx-int8]
+    parser = argparse.ArgumentParser(description="Embedder partagé all-MiniLM-L6-v2")
+    parser.add_argument("--parity", action="store_true", help="Compare le backend ONNX à PyTorch")
+    parser.add_argument("--backend", default="onnx", choices=["onnx", "onnx-int8"])
+    parser.add_argument("-k", type=int, default=4)
+    parser.add_argument("--min-cosine", type=float, default=None)
+    args = parser.parse_args()
+
+    if args.parity:
+        min_cosine = args.min_cosine or (0.97 if args.backend == "onnx-int8" else 0.99)
+        report = check_parity(args.backend, k=args.k, min_cosine=min_cosine)
+        print(f"--- Parité PyTorch vs {report['backend']} ({report['chunks']} morceaux) ---")
+        print(f"Cosinus min : {report['cosine_min']:.4f} | moyen : {report['cosine_mean']:.4f}")
+        print(f"Top-{args.k} identique : {report['topk_agreement']:.0%}")
+        for name, t in report["timings"].items():
+            print(f"  {name:10s} chargement {t['load_seconds']:.2f} s | requête {t['query_ms']:.2f} ms")
+        print("✅ Parité OK" if report["ok"] else "❌ Parité KO : garder EMBEDDING_BACKEND=torch")
+        raise SystemExit(0 if report["ok"] else 1)
+    else:
+        embedder = get_embedding_function()
+        print(len(embedder.embed_query("Où jeter une peau de banane ?")))
@@ -0,0 +1,190 @@
+import os
+import threading
+import time
+
+from config import VECTORSTORE_PATH, VECTOR_BACKEND, NUMPY_STORE_PATH, LLM_MODEL, LLM_TEMPERATURE
+
+# --- MOTEUR (chargement paresseux des composants lourds) ---
+# Importer agent_logic ou vision_model ne charge plus rien : l'embedder, la base
+# Chroma, le client Mistral et YOLO sont créés au premier usage, ou préchauffés
+# dans un thread de fond pendant que Streamlit affiche la page.
+
+class ConfigurationError(RuntimeError):
+    """Configuration manquante ou invalide (ex : MISTRAL_API_KEY absente)."""
+
+def _load_embedder(engine):
+    # Embedder partagé avec rag_engine (backend PyTorch ou ONNX selon EMBEDDING_BACKEND),
+    # mesuré par étape (telemetry.py)
+    from embeddings import InstrumentedEmbeddings, get_embedding_function
+    return InstrumentedEmbeddings(get_embedding_function())
+
+def _load_vector_db(engine):
+    print(f"Chargement de la base vectorielle ({VECTOR_BACKEND})...")
+    if VECTOR_BACKEND == "numpy":
+        # Shards .npy en mmap exportés depuis Chroma (numpy_store.py)
+        from numpy_store import NumpyVectorStore
+        try:
+            return NumpyVectorStore(NUMPY_STORE_PATH, embedding_function=engine.embedding_function)
+        except FileNotFoundError as e:
+            raise ConfigurationError(str(e)) from e
+    if VECTOR_BACKEND != "chroma":
+        raise ConfigurationError(f"VECTOR_BACKEND inconnu : {VECTOR_BACKEND!r} (attendu : chroma, numpy)")
+    from langchain_chroma import Chroma
+    return Chroma(persist_directory=VECTORSTORE_PATH, embedding_function=engine.embedding_function)
+
+def _load_llm(engine):
+    # Vérification de sécurité
+    if not os.getenv("MISTRAL_API_KEY"):
+        raise ConfigurationError(
+            "La clé MISTRAL_API_KEY est introuvable. "
+            "Assure-toi d'avoir créé le fichier .env à la racine du projet."
+        )
+    from langchain_mistralai import ChatMistralAI
+    # 'mistral-large-latest' est le plus intelligent.
+    # Si tu veux économiser, utilise 'open-mistral-nemo' ou 'mistral-small-latest'.
+    return ChatMistralAI(
+        model=LLM_MODEL,
+        temperature=LLM_TEMPERATURE,  # Faible température = Réponse factuelle et précise
+        # Une seule politique de nouvelles tentatives : celle de throttling.py (agent_logic),
+        # sinon les essais du client se multiplient avec les nôtres
+        max_retries=0
+    )
+
+def _load_vision_model(engine):
+    from vision_model import get_model
+    return get_model()
+
+def _prebuild_rag_chains(engine):
+    # Une chaîne par région (registre de agent_logic)
+    from agent_logic import prebuild_rag_chains
+    return prebuild_rag_chains()
+
+# Ordre de chargement = ordre de préchauffage
+COMPONENTS = {
+    "embedder": _load_embedder,
+    "vector_db": _load_vector_db,
+    "llm": _load_llm,
+    "rag_chains": _prebuild_rag_chains,
+    "vision_model": _load_vision_model
+}
+
+class Engine:
+    """
+    Fabrique des composants IA, chacun chargé une seule fois (thread-safe).
+    Les temps de chargement sont mesurés par composant (voir status()).
+    """
+    def __init__(self, components=None):
+        self._factories = dict(components or COMPONENTS)
+        self._instances = {}
+        self._locks = {name: threading.Lock() for name in self._factories}
+        self.load_times = {}
+        self.errors = {}
+        self._warmup_thread = None
+
+    def get(self, name):
+        """
+        Retourne le composant `name`, en le chargeant au premier appel.
+        Une erreur de chargement est levée (et mémorisée pour status()).
+        """
+        if name in self._instances:
+            return self._instances[name]
+        with self._locks[name]:
+            if name not in self._instances:
+                start = time.perf_counter()
+                try:
+                    instance = self._factories[name](self)
+                except Exception as e:
+                    self.errors[name] = str(e)
+                    raise
+                self.load_times[name] = time.perf_counter() - start
+                self.errors.pop(name, None)
+                self._instances[name] = instance
+                print(f"⏱️ {name} chargé en {self.load_times[name]:.2f} s")
+        return self._instances[name]
+
+    def set(self, name, instance):
+        """
+        Remplace un composant (tests, benchmarks : ex. un faux LLM).
+        """
+        with self._locks.setdefault(name, threading.Lock()):
+            self._instances[name] = instance
+            self.load_times[name] = 0.0
+
+    def is_loaded(self, name):
+        return name in self._instances
+
+    @property
+    def embedding_function(self):
+        return self.get("embedder")
+
+    @property
+    def vector_db(self):
+        return self.get("vector_db")
+
+    @property
+    def llm(self):
+        return self.get("llm")
+
+    @property
+    def vision_model(self):
+        return self.get("vision_model")
+
+    def warmup(self, components=None, background=True):
+        """
+        Charge les composants à l'avance (par défaut tous, dans un thread de fond).
+        Les erreurs n'interrompent pas le préchauffage : elles sont visibles dans status()
+        et seront levées au premier vrai usage du composant.
+        """
+        names = list(components or self._factories)
+
+        def _run():
+            start = time.perf_counter()
+            for name in names:
+                try:
+                    self.get(name)
+                except Exception as e:
+                    print(f"❌ Préchauffage de '{name}' impossible : {e}")
+            print(f"🔥 Préchauffage terminé en {time.perf_counter() - start:.1f} s")
+
+        if not background:
+            _run()
+            return None
+        if self._warmup_thread is None or not self._warmup_thread.is_alive():
+            self._warmup_thread = threading.Thread(target=_run, name="engine-warmup", daemon=True)
+            self._warmup_thread.start()
+        return self._warmup_thread
+
+    def status(self):
+        """
+        État de chaque composant : 'ready' / 'loading' / 'error' / 'pending' + durée.
+        """
+        report = {}
+        for name in self._factories:
+            if name in self._instances:
+                state = "ready"
+            elif name in self.errors:
+                state = "error"
+            elif self._locks[name].locked():
+                state = "loading"
+            else:
+                state = "pending"
+            report[name] = {
+                "state": state,
+                "seconds": self.load_times.get(name),
+                "error": self.errors.get(name)
+            }
+        return report
+
+_engine = None
+_engine_lock = threading.Lock()
+
+def get_engine():
+    """
+    Retourne le moteur partagé du processus (singleton, aucun chargement immédiat).
+    """
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                _engine = Engine()
+    return _engine
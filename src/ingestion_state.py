@@ -0,0 +1,103 @@
+import json
+import os
+import threading
+import time
+import uuid
+
+from config import VECTORSTORE_PATH
+
+# --- ÉTAT DE L'INGESTION (partagé entre processus via le disque) ---
+# rag_engine écrit une nouvelle "version" de région à chaque fois que le guide
+# d'une région change dans la base. Les caches (chaînes, réponses) comparent
+# cette version pour savoir s'ils doivent s'invalider, même si l'ingestion
+# a tourné dans un autre processus (python rag_engine.py).
+REGION_VERSIONS_FILE = os.path.join(VECTORSTORE_PATH, "region_versions.json")
+
+_lock = threading.Lock()
+_versions_cache = {"mtime": None, "data": {}}
+
+def load_json(path, default):
+    if not os.path.exists(path):
+        return default
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"⚠️ Fichier d'état illisible ({path}) : {e}")
+        return default
+
+def save_json(path, data):
+    # Écriture atomique : on écrit un fichier temporaire puis on le renomme
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+def get_region_versions():
+    """
+    Retourne {region: version}. Relu sur disque uniquement si le fichier a changé.
+    """
+    try:
+        stat = os.stat(REGION_VERSIONS_FILE)
+    except OSError:
+        return {}
+    mtime = (stat.st_mtime_ns, stat.st_size)
+    with _lock:
+        if _versions_cache["mtime"] != mtime:
+            _versions_cache["data"] = load_json(REGION_VERSIONS_FILE, {})
+            _versions_cache["mtime"] = mtime
+        return dict(_versions_cache["data"])
+
+def get_region_version(region):
+    """
+    Version courante du guide d'une région (None si jamais ingéré).
+    """
+    return get_region_versions().get(region)
+
+def bump_region_version(region):
+    """
+    Marque le contenu d'une région comme modifié (à appeler après ingestion).
+    """
+    version = f"{int(time.time())}-{uuid.uuid4().hex[:8]}"
+    with _lock:
+        data = load_json(REGION_VERSIONS_FILE, {})
+        data[region] = version
+        save_json(REGION_VERSIONS_FILE, data)
+        _versions_cache["mtime"] = None
+    return version
+
+# --- MANIFESTE DES SOURCES ---
+# Pour chaque guide ingéré : hash du fichier, IDs des morceaux stockés dans
+# Chroma et modèle d'embedding utilisé. Permet une ingestion idempotente et
+# incrémentale (on ne ré-encode que les morceaux qui ont changé).
+SOURCES_MANIFEST_FILE = os.path.join(VECTORSTORE_PATH, "sources_manifest.json")
+
+def load_manifest():
+    """
+    Retourne le manifeste complet {source: entrée}.
+    """
+    with _lock:
+        return load_json(SOURCES_MANIFEST_FILE, {})
+
+def get_source_manifest(source):
+    """
+    Entrée du manifeste pour un fichier source (None si jamais ingéré).
+    """
+    return load_manifest().get(source)
+
+def set_source_manifest(source, region, file_hash, chunk_ids, embedding):
+    """
+    Enregistre l'état d'un fichier source après ingestion.
+    embedding : signature des vecteurs stockés (embeddings.embedding_signature()).
+    """
+    with _lock:
+        data = load_json(SOURCES_MANIFEST_FILE, {})
+        data[source] = {
+            "region": region,
+            "file_hash": file_hash,
+            "chunk_ids": list(chunk_ids),
+            "embedding": embedding,
+            "updated_at": time.time()
+        }
+        save_json(SOURCES_MANIFEST_FILE, data)
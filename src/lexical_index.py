@@ -0,0 +1,178 @@
+import math
+import re
+import threading
+import unicodedata
+from collections import Counter
+from typing import Any, Optional
+
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+from ingestion_state import get_region_version
+from relevance_gate import passes, scored_search
+
+# --- INDEX LEXICAL BM25 + RÉCUPÉRATION HYBRIDE ---
+# Les questions citent souvent un produit exact ("Javel", "Tetra Pak", "frigolite").
+# MiniLM seul classe parfois le bon morceau en 4ème position : on fusionne donc
+# le classement vectoriel avec un classement lexical BM25 (Reciprocal Rank Fusion).
+# Les guides sont petits (~3 Ko par région) : l'index tient en mémoire et se
+# construit en quelques millisecondes à partir des morceaux stockés dans Chroma.
+
+STOP_WORDS = {
+    "a", "au", "aux", "avec", "ce", "ces", "cet", "cette", "dans", "de", "des", "du",
+    "elle", "en", "est", "et", "il", "je", "jeter", "la", "le", "les", "leur", "ma",
+    "mes", "mon", "ne", "ou", "par", "pas", "pour", "qu", "que", "quel", "quelle",
+    "qui", "sa", "se", "ses", "son", "sur", "ta", "tes", "ton", "un", "une", "va",
+    "vont", "vos", "votre", "faire", "mettre", "dois", "peut", "on", "y"
+}
+
+def tokenize(text):
+    """
+    Minuscules, sans accents, sans mots vides ; pluriel simple retiré (bananes -> banane).
+    """
+    text = unicodedata.normalize("NFKD", text.lower())
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    tokens = []
+    for token in re.findall(r"\w+", text):
+        if token in STOP_WORDS or len(token) < 2:
+            continue
+        if len(token) > 3 and token[-1] in "sx":
+            token = token[:-1]
+        tokens.append(token)
+    return tokens
+
+class BM25Index:
+    """
+    Index BM25 (Okapi) en mémoire sur une liste de Documents LangChain.
+    """
+    def __init__(self, documents, k1=1.5, b=0.75):
+        self.documents = list(documents)
+        self.k1 = k1
+        self.b = b
+        self._term_freqs = [Counter(tokenize(doc.page_content)) for doc in self.documents]
+        self._lengths = [sum(tf.values()) for tf in self._term_freqs]
+        self._avg_length = (sum(self._lengths) / len(self._lengths)) if self._lengths else 0.0
+
+        doc_freqs = Counter()
+        for tf in self._term_freqs:
+            doc_freqs.update(tf.keys())
+        n_docs = len(self.documents)
+        self._idf = {
+            term: math.log(1 + (n_docs - df + 0.5) / (df + 0.5))
+            for term, df in doc_freqs.items()
+        }
+
+    def search(self, query, k=4):
+        """
+        Returns:
+            list[(Document, float)]: les k meilleurs morceaux (score > 0), par score décroissant
+        """
+        terms = [t for t in tokenize(query) if t in self._idf]
+        if not terms:
+            return []
+        scores = []
+        for i, tf in enumerate(self._term_freqs):
+            norm = self.k1 * (1 - self.b + self.b * self._lengths[i] / (self._avg_length or 1.0))
+            score = 0.0
+            for term in terms:
+                freq = tf.get(term)
+                if freq:
+                    score += self._idf[term] * freq * (self.k1 + 1) / (freq + norm)
+            if score > 0:
+                scores.append((score, i))
+        scores.sort(reverse=True)
+        return [(self.documents[i], score) for score, i in scores[:k]]
+
+# --- INDEX PAR RÉGION (reconstruit quand le guide est ré-ingéré) ---
+_indices = {}  # region -> (version, BM25Index)
+_indices_lock = threading.Lock()
+
+def build_region_index(vector_db, region):
+    """
+    Construit l'index BM25 d'une région à partir des morceaux stockés dans Chroma
+    (exactement les morceaux produits par rag_engine.create_vector_db).
+    """
+    data = vector_db.get(where={"region": region}, include=["documents", "metadatas"])
+    documents = [
+        Document(page_content=text, metadata=metadata or {}, id=chunk_id)
+        for chunk_id, text, metadata in zip(data["ids"], data["documents"], data["metadatas"])
+    ]
+    return BM25Index(documents)
+
+def get_region_index(vector_db, region):
+    """
+    Index BM25 pré-construit de la région (mis en cache, lié à la version du guide).
+    """
+    version = get_region_version(region)
+    cached = _indices.get(region)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+    with _indices_lock:
+        cached = _indices.get(region)
+        if cached is None or cached[0] != version:
+            cached = (version, build_region_index(vector_db, region))
+            _indices[region] = cached
+    return cached[1]
+
+def invalidate_region_indices(region=None):
+    with _indices_lock:
+        if region is None:
+            _indices.clear()
+        else:
+            _indices.pop(region, None)
+
+# --- FUSION DES CLASSEMENTS ---
+def _doc_key(doc):
+    return doc.id or (doc.metadata.get("source"), doc.page_content)
+
+def fuse_rankings(rankings, k, rrf_k=60):
+    """
+    Reciprocal Rank Fusion : score(d) = somme des 1 / (rrf_k + rang).
+
+    Args:
+        rankings: listes de Documents, chacune triée du plus au moins pertinent
+        k: nombre de documents à retourner
+
+    Returns:
+        list[Document]: les k documents au meilleur score fusionné
+    """
+    scores = {}
+    documents = {}
+    for ranking in rankings:
+        for rank, doc in enumerate(ranking, start=1):
+            key = _doc_key(doc)
+            scores[key] = scores.get(key, 0.0) + 1.0 / (rrf_k + rank)
+            documents.setdefault(key, doc)
+    best = sorted(scores, key=scores.get, reverse=True)[:k]
+    return [documents[key] for key in best]
+
+class HybridRetriever(BaseRetriever):
+    """
+    Retriever LangChain : vecteurs (Chroma filtré par région) + BM25, fusionnés par RRF.
+    score_threshold : filtre de pertinence (relevance_gate.py) appliqué aux scores
+    vectoriels ; liste vide si aucun candidat ne l'atteint (question hors sujet).
+    """
+    vector_store: Any
+    region: str
+    k: int = 2
+    fetch_k: int = 8
+    rrf_k: int = 60
+    score_threshold: Optional[float] = None
+
+    def _fuse(self, query, scored):
+        # BM25 seul ne suffit pas à passer le filtre : "test test" trouve toujours un mot
+        if not passes(scored, self.score_threshold):
+            return []
+        vector_docs = [doc for doc, _ in scored]
+        lexical_docs = [doc for doc, _ in get_region_index(self.vector_store, self.region).search(query, self.fetch_k)]
+        return fuse_rankings([vector_docs, lexical_docs], self.k, self.rrf_k)
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun):
+        return self._fuse(query, scored_search(self.vector_store, self.region, self.fetch_k, query=query))
+
+    def retrieve_by_vector(self, query, vector):
+        """
+        Même récupération, avec l'embedding de la question déjà calculé (traitements par lots).
+        """
+        return self._fuse(query, scored_search(self.vector_store, self.region, self.fetch_k, vector=vector))
@@ -0,0 +1,421 @@
+import argparse
+import json
+import os
+import statistics
+import threading
+import time
+import uuid
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.vectorstores import VectorStore
+
+from config import NUMPY_STORE_DTYPE, NUMPY_STORE_PATH, VECTORSTORE_PATH
+from embeddings import embedding_signature
+from engine import ConfigurationError
+from ingestion_state import get_region_versions, load_json, load_manifest, save_json
+
+# --- INDEX VECTORIEL NUMPY (alternative légère à Chroma) ---
+# Tout le corpus tient en quelques centaines de vecteurs MiniLM (384 dimensions)
+# répartis sur neuf régions. Pour ce volume, une recherche exacte par produit
+# scalaire est plus rapide que le client Chroma (SQLite + HNSW + filtre metadata).
+#
+# Format sur disque (NUMPY_STORE_PATH) :
+#   <region>.npy   matrice (n, 384) des vecteurs normalisés, float32 ou int8
+#   <region>.json  ids, textes et métadonnées des morceaux (+ échelles en int8)
+#   manifest.json  type, dimension, signature d'embedding, version de chaque région
+#
+# Les .npy sont ouverts en mmap_mode="r" : pas de copie à l'ouverture, et les
+# process (Streamlit, service, workers) partagent les mêmes pages du cache disque.
+# Chroma reste la base d'ingestion : les shards en sont exportés (export_from_chroma).
+#
+# Distance renvoyée = distance L2 au carré entre vecteurs normalisés (2 - 2 cos),
+# la même échelle que Chroma : les seuils de relevance_gate.py restent valables.
+
+MANIFEST_FILE = "manifest.json"
+DTYPES = ("float32", "int8")
+
+def _normalize(matrix):
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.clip(norms, 1e-12, None)
+
+def quantize_int8(matrix):
+    """
+    Quantification symétrique par vecteur : v ≈ q * scale, q entier dans [-127, 127].
+
+    Returns:
+        (np.ndarray int8, np.ndarray float32): vecteurs quantifiés, échelle par vecteur
+    """
+    scales = np.abs(matrix).max(axis=1) / 127.0
+    scales = np.where(scales > 0, scales, 1.0).astype(np.float32)
+    return np.round(matrix / scales[:, None]).astype(np.int8), scales
+
+def _shard_paths(path, region):
+    return os.path.join(path, f"{region}.npy"), os.path.join(path, f"{region}.json")
+
+def _top_k(scores, k):
+    # Sélection partielle (O(n)) puis tri des k meilleurs seulement
+    if k >= len(scores):
+        return np.argsort(-scores)
+    top = np.argpartition(-scores, k)[:k]
+    return top[np.argsort(-scores[top])]
+
+def write_shards(path, records, dtype=NUMPY_STORE_DTYPE, signature=None):
+    """
+    Écrit un shard par région (écriture atomique : un process qui lit l'ancien
+    fichier en mmap le garde jusqu'à sa fermeture).
+
+    Args:
+        records: {region: {'ids', 'documents', 'metadatas', 'embeddings'}}
+        dtype: "float32" ou "int8"
+        signature: embedder qui a produit les vecteurs (défaut : embedding_signature())
+
+    Returns:
+        dict: le manifeste écrit
+    """
+    if dtype not in DTYPES:
+        raise ValueError(f"dtype inconnu : {dtype!r} (attendu : {', '.join(DTYPES)})")
+    os.makedirs(path, exist_ok=True)
+    previous = load_json(os.path.join(path, MANIFEST_FILE), {})
+    versions = get_region_versions()
+    manifest = {
+        "dtype": dtype,
+        "dim": None,
+        "embedding": signature or embedding_signature(),
+        "exported_at": int(time.time()),
+        "regions": {}
+    }
+    for region, data in sorted(records.items()):
+        matrix = _normalize(np.asarray(data["embeddings"], dtype=np.float32))
+        sidecar = {"ids": list(data["ids"]), "documents": list(data["documents"]), "metadatas": list(data["metadatas"])}
+        if dtype == "int8":
+            matrix, scales = quantize_int8(matrix)
+            sidecar["scales"] = scales.tolist()
+        npy_path, meta_path = _shard_paths(path, region)
+        tmp_path = f"{npy_path}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.save(f, np.ascontiguousarray(matrix))
+        os.replace(tmp_path, npy_path)
+        save_json(meta_path, sidecar)
+        manifest["dim"] = int(matrix.shape[1])
+        manifest["regions"][region] = {"count": len(sidecar["ids"]), "version": versions.get(region)}
+
+    # Régions disparues de la base : on retire leurs shards
+    for region in set(previous.get("regions", {})) - set(manifest["regions"]):
+        for shard_path in _shard_paths(path, region):
+            if os.path.exists(shard_path):
+                os.remove(shard_path)
+    save_json(os.path.join(path, MANIFEST_FILE), manifest)
+    return manifest
+
+class Shard:
+    """
+    Vecteurs d'une région (mmap) + textes et métadonnées alignés.
+    """
+    def __init__(self, matrix, ids, documents, metadatas, scales=None):
+        self.matrix = matrix
+        self.ids = ids
+        self.documents = documents
+        self.metadatas = metadatas
+        self.scales = scales
+
+    def __len__(self):
+        return len(self.ids)
+
+    def cosine(self, query):
+        """
+        Similarité cosinus de chaque morceau avec la requête (normalisée).
+        """
+        scores = self.matrix @ query
+        if self.scales is not None:
+            scores = scores * self.scales
+        return scores
+
+    def document(self, i):
+        # Nouvelle instance à chaque résultat : relevance_gate annote les métadonnées
+        return Document(page_content=self.documents[i], metadata=dict(self.metadatas[i] or {}), id=self.ids[i])
+
+class NumpyVectorStore(VectorStore):
+    """
+    VectorStore LangChain en lecture seule sur les shards NumPy (recherche exacte).
+    Filtres supportés : égalité sur des clés de métadonnées ; "region" choisit le shard.
+    Même interface que Chroma pour ce qu'utilise l'app (similarity_search*, get, as_retriever).
+    """
+    def __init__(self, path=NUMPY_STORE_PATH, embedding_function=None, signature=None):
+        self.path = path
+        self.embedding_function = embedding_function
+        # Les requêtes sont encodées par l'embedder actif : les shards doivent venir du même
+        self.signature = signature or embedding_signature()
+        self._lock = threading.Lock()
+        self._manifest_mtime = None
+        self._load_manifest()
+        stale = self.stale_regions()
+        if stale:
+            print(f"⚠️ Index NumPy plus ancien que Chroma pour : {', '.join(stale)} (relancez l'export)")
+
+    @property
+    def embeddings(self):
+        return self.embedding_function
+
+    def stale_regions(self):
+        """
+        Régions ré-ingérées dans Chroma depuis l'export (ou absentes de l'export).
+        """
+        versions = get_region_versions()
+        regions = self.manifest["regions"]
+        return sorted(
+            region for region, version in versions.items()
+            if region not in regions or regions[region].get("version") != version
+        )
+
+    # --- SHARDS ---
+    def _manifest_stat(self):
+        try:
+            stat = os.stat(os.path.join(self.path, MANIFEST_FILE))
+        except OSError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def _load_manifest(self):
+        mtime = self._manifest_stat()
+        manifest = load_json(os.path.join(self.path, MANIFEST_FILE), None)
+        if manifest is None:
+            raise FileNotFoundError(
+                f"Aucun index NumPy dans {self.path} : lancez `python numpy_store.py export` après l'ingestion"
+            )
+        if manifest.get("embedding") != self.signature:
+            raise ConfigurationError(
+                f"Index NumPy {self.path} exporté pour l'embedding {manifest.get('embedding')}, "
+                f"embedder actif : {self.signature} (ré-ingérez puis relancez `python numpy_store.py export`)"
+            )
+        self.manifest = manifest
+        self._shards = {}
+        self._manifest_mtime = mtime
+
+    def _refresh(self):
+        # Ré-export (ex : ingestion dans un autre process) : on relit les shards
+        if self._manifest_stat() != self._manifest_mtime:
+            with self._lock:
+                if self._manifest_stat() != self._manifest_mtime:
+                    self._load_manifest()
+
+    def _shard(self, region):
+        if region not in self.manifest["regions"]:
+            return None
+        shard = self._shards.get(region)
+        if shard is None:
+            with self._lock:
+                shard = self._shards.get(region)
+                if shard is None:
+                    shard = self._load_shard(region)
+                    self._shards[region] = shard
+        return shard
+
+    def _load_shard(self, region):
+        npy_path, meta_path = _shard_paths(self.path, region)
+        sidecar = load_json(meta_path, None)
+        if sidecar is None:
+            raise FileNotFoundError(f"Métadonnées manquantes pour la région {region} : {meta_path}")
+        scales = np.asarray(sidecar["scales"], dtype=np.float32) if "scales" in sidecar else None
+        matrix = np.load(npy_path, mmap_mode="r")
+        return Shard(matrix, sidecar["ids"], sidecar["documents"], sidecar["metadatas"], scales)
+
+    def _select(self, filter):
+        filter = dict(filter or {})
+        if any(key.startswith("$") or isinstance(value, dict) for key, value in filter.items()):
+            raise ValueError(f"Filtre non supporté par l'index NumPy (égalité simple uniquement) : {filter}")
+        region = filter.pop("region", None)
+        regions = [region] if region is not None else list(self.manifest["regions"])
+        return regions, filter
+
+    @staticmethod
+    def _matches(metadata, filter):
+        metadata = metadata or {}
+        return all(metadata.get(key) == value for key, value in filter.items())
+
+    # --- RECHERCHE ---
+    def _search(self, embedding, k=4, filter=None):
+        """
+        Returns:
+            list[(Document, float)]: k plus proches, distance L2² croissante
+        """
+        self._refresh()
+        query = np.asarray(embedding, dtype=np.float32)
+        query = query / max(float(np.linalg.norm(query)), 1e-12)
+        regions, filter = self._select(filter)
+        candidates = []
+        for region in regions:
+            shard = self._shard(region)
+            if shard is None or not len(shard):
+                continue
+            scores = shard.cosine(query)
+            if filter:
+                mask = np.fromiter((self._matches(m, filter) for m in shard.metadatas), dtype=bool, count=len(shard))
+                scores = np.where(mask, scores, -np.inf)
+            candidates.extend(
+                (float(scores[i]), shard, int(i)) for i in _top_k(scores, k) if np.isfinite(scores[i])
+            )
+        candidates.sort(key=lambda c: c[0], reverse=True)
+        return [(shard.document(i), max(0.0, 2.0 - 2.0 * score)) for score, shard, i in candidates[:k]]
+
+    def similarity_search(self, query, k=4, filter=None, **kwargs):
+        return [doc for doc, _ in self.similarity_search_with_score(query, k=k, filter=filter)]
+
+    def similarity_search_with_score(self, query, k=4, filter=None, **kwargs):
+        return self._search(self.embedding_function.embed_query(query), k, filter)
+
+    def similarity_search_by_vector(self, embedding, k=4, filter=None, **kwargs):
+        return [doc for doc, _ in self._search(embedding, k, filter)]
+
+    def similarity_search_by_vector_with_relevance_scores(self, embedding, k=4, filter=None, **kwargs):
+        # Comme Chroma, malgré le nom : (Document, distance)
+        return self._search(embedding, k, filter)
+
+    def _select_relevance_score_fn(self):
+        # Distance L2² entre vecteurs normalisés -> similarité cosinus
+        return lambda distance: 1.0 - distance / 2.0
+
+    def get(self, ids=None, where=None, include=None, **kwargs):
+        """
+        Sous-ensemble de Chroma.get : {'ids', 'documents', 'metadatas'} (lexical_index.py).
+        """
+        self._refresh()
+        wanted = set(ids) if ids is not None else None
+        regions, filter = self._select(where)
+        result = {"ids": [], "documents": [], "metadatas": []}
+        for region in regions:
+            shard = self._shard(region)
+            if shard is None:
+                continue
+            for i, chunk_id in enumerate(shard.ids):
+                if (wanted is None or chunk_id in wanted) and self._matches(shard.metadatas[i], filter):
+                    result["ids"].append(chunk_id)
+                    result["documents"].append(shard.documents[i])
+                    result["metadatas"].append(shard.metadatas[i])
+        return result
+
+    def memory_bytes(self):
+        """
+        Taille des vecteurs sur disque (partagée entre process via le cache de pages).
+        """
+        return sum(os.path.getsize(_shard_paths(self.path, region)[0]) for region in self.manifest["regions"])
+
+    @classmethod
+    def from_texts(cls, texts, embedding, metadatas=None, ids=None, path=NUMPY_STORE_PATH,
+                   dtype=NUMPY_STORE_DTYPE, signature=None, **kwargs):
+        """
+        Construit un index directement à partir de textes (regroupés par metadata "region").
+        """
+        texts = list(texts)
+        metadatas = list(metadatas) if metadatas is not None else [{} for _ in texts]
+        ids = list(ids) if ids is not None else [str(uuid.uuid4()) for _ in texts]
+        vectors = embedding.embed_documents(texts)
+        records = {}
+        for chunk_id, text, metadata, vector in zip(ids, texts, metadatas, vectors):
+            _append_record(records, chunk_id, text, metadata, vector)
+        write_shards(path, records, dtype, signature)
+        return cls(path, embedding, signature)
+
+def _append_record(records, chunk_id, text, metadata, vector):
+    region = (metadata or {}).get("region", "default")
+    record = records.setdefault(region, {"ids": [], "documents": [], "metadatas": [], "embeddings": []})
+    record["ids"].append(chunk_id)
+    record["documents"].append(text)
+    record["metadatas"].append(metadata or {})
+    record["embeddings"].append(vector)
+
+# --- EXPORT DEPUIS CHROMA ---
+def _ingested_signature():
+    """
+    Signature d'embedding des vecteurs de Chroma, d'après le manifeste d'ingestion.
+    """
+    signatures = {json.dumps(entry.get("embedding"), sort_keys=True) for entry in load_manifest().values()}
+    if len(signatures) > 1:
+        raise ConfigurationError(
+            "La base Chroma mélange des vecteurs de plusieurs embedders : relancez `python rag_engine.py ingest --force`"
+        )
+    signature = json.loads(signatures.pop()) if signatures else None
+    return signature or embedding_signature()
+
+def export_from_chroma(path=NUMPY_STORE_PATH, dtype=NUMPY_STORE_DTYPE, chroma_path=VECTORSTORE_PATH):
+    """
+    Relit les vecteurs déjà calculés à l'ingestion (pas d'embedder chargé)
+    et écrit un shard par région.
+
+    Returns:
+        dict: le manifeste écrit
+    """
+    from langchain_chroma import Chroma
+
+    start = time.perf_counter()
+    data = Chroma(persist_directory=chroma_path).get(include=["embeddings", "documents", "metadatas"])
+    records = {}
+    for chunk_id, text, metadata, vector in zip(data["ids"], data["documents"], data["metadatas"], data["embeddings"]):
+        _append_record(records, chunk_id, text, metadata, vector)
+    manifest = write_shards(path, records, dtype, _ingested_signature())
+    total = sum(info["count"] for info in manifest["regions"].values())
+    size = sum(os.path.getsize(_shard_paths(path, region)[0]) for region in manifest["regions"])
+    print(
+        f"✅ {total} vecteur(s) de {len(manifest['regions'])} région(s) exporté(s) en {dtype} "
+        f"({size / 1024:.0f} Ko) dans {path} en {(time.perf_counter() - start) * 1000:.0f} ms"
+    )
+    return manifest
+
+# --- COMPARAISON AVEC CHROMA ---
+def compare_with_chroma(questions, k=4, path=NUMPY_STORE_PATH, repeat=20):
+    """
+    Même embedding de question, recherche Chroma vs NumPy : recouvrement du top-k et latence.
+
+    Args:
+        questions: liste de (question, region)
+    """
+    from langchain_chroma import Chroma
+    from embeddings import get_embedding_function
+
+    embedding_function = get_embedding_function()
+    chroma = Chroma(persist_directory=VECTORSTORE_PATH, embedding_function=embedding_function)
+    store = NumpyVectorStore(path, embedding_function)
+    vectors = embedding_function.embed_documents([question for question, _ in questions])
+
+    latencies = {"chroma": [], "numpy": []}
+    overlaps = []
+    for vector, (_, region) in zip(vectors, questions):
+        results = {}
+        for name, db in (("chroma", chroma), ("numpy", store)):
+            for _ in range(repeat):
+                start = time.perf_counter()
+                docs = db.similarity_search_by_vector(vector, k=k, filter={"region": region})
+                latencies[name].append((time.perf_counter() - start) * 1000)
+            results[name] = {doc.id for doc in docs}
+        overlaps.append(len(results["chroma"] & results["numpy"]) / max(1, len(results["chroma"])))
+    return {
+        "k": k,
+        "dtype": store.manifest["dtype"],
+        "overlap_at_k": round(sum(overlaps) / len(overlaps), 4) if overlaps else None,
+        "p50_ms": {name: round(statistics.median(samples), 3) for name, samples in latencies.items() if samples},
+        "vectors_bytes": store.memory_bytes()
+    }
+
+if __name__ == "__main__":
+    # Usage :
+    #   python numpy_store.py export [--dtype int8]   -> shards .npy depuis data/vectorstore
+    #   python numpy_store.py check                   -> recouvrement top-k et latence vs Chroma
+    parser = argparse.ArgumentParser(description="Index vectoriel NumPy (mmap) exporté depuis Chroma")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    export_parser = subparsers.add_parser("export", help="Exporte la base Chroma en shards .npy par région")
+    export_parser.add_argument("--dtype", choices=DTYPES, default=NUMPY_STORE_DTYPE)
+    export_parser.add_argument("--output", default=NUMPY_STORE_PATH)
+
+    check_parser = subparsers.add_parser("check", help="Compare l'index NumPy à Chroma sur les questions de référence")
+    check_parser.add_argument("--gold", default=os.path.join(os.path.dirname(VECTORSTORE_PATH), "benchmarks", "gold_questions.json"))
+    check_parser.add_argument("-k", type=int, default=4)
+
+    args = parser.parse_args()
+    if args.command == "export":
+        export_from_chroma(args.output, args.dtype)
+    else:
+        with open(args.gold, encoding="utf-8") as f:
+            gold = json.load(f)
+        questions = [(q["question"], region) for region in gold["regions"] for q in gold["questions"]]
+        print(json.dumps(compare_with_chroma(questions, k=args.k), ensure_ascii=False, indent=2))
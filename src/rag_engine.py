@@ -1,29 +1,46 @@
+import argparse
+import glob
+import hashlib
 import os
+import time
+from concurrent.futures import ProcessPoolExecutor
 from langchain_community.document_loaders import PyPDFLoader, TextLoader
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langchain_chroma import Chroma
-from langchain_huggingface import HuggingFaceEmbeddings
+from ingestion_state import bump_region_version, get_source_manifest, set_source_manifest
 
 # --- CONFIGURATION ---
 # Chemins relatifs (adaptés à ta structure de dossier)
-current_dir = os.path.dirname(os.path.abspath(__file__))
-root_dir = os.path.dirname(current_dir) # On remonte d'un cran vers 'ia-llm-project'
-VECTORSTORE_PATH = os.path.join(root_dir, "data", "vectorstore")
-DOCUMENTS_PATH = os.path.join(root_dir, "data", "documents")
+from config import VECTORSTORE_PATH, DOCUMENTS_PATH, GUIDE_REGION_ALIASES, VECTOR_BACKEND, CHUNK_SIZE, CHUNK_OVERLAP
 
-# On instancie le modèle d'embedding (Tourne en LOCAL sur ton CPU)
-embedding_function = HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2")
+# Modèle d'embedding (Tourne en LOCAL sur ton CPU)
+# Instance partagée avec agent_logic, chargée au premier usage :
+# les workers d'ingestion (process pool) n'en ont pas besoin.
+from embeddings import embedding_signature, get_embedding_function
 
-def create_vector_db(filename, region_name):
+def file_hash(file_path):
     """
-    Fonction pour ingérer un document (PDF ou TXT), le découper et le stocker.
+    Hash SHA-256 du contenu d'un fichier (détecte les guides modifiés).
+    """
+    sha = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 16), b""):
+            sha.update(block)
+    return sha.hexdigest()
+
+def chunk_id(doc):
+    """
+    ID déterministe d'un morceau = hash de (région, source, contenu).
+    Ré-ingérer le même texte donne le même ID : pas de doublon dans Chroma.
+    """
+    key = f"{doc.metadata.get('region')}|{doc.metadata.get('source')}|{doc.page_content}"
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+def load_and_split(filename, region_name):
+    """
+    Charge un document (PDF ou TXT), ajoute les métadonnées et le découpe.
     """
     file_path = os.path.join(DOCUMENTS_PATH, filename)
-    
-    print(f"--- Chargement de {filename} ---")
-    if not os.path.exists(file_path):
-        print(f"ERREUR : Le fichier {file_path} est introuvable.")
-        return
 
     # 1. Choix du chargeur selon l'extension
     if filename.endswith(".pdf"):
@@ -40,32 +57,295 @@ def create_vector_db(filename, region_name):
         doc.metadata["source"] = filename
         
     # 3. Découpage (Splitting)
-    text_splitter = RecursiveCharacterTextSplitter(chunk_size=350, chunk_overlap=50)
-    splits = text_splitter.split_documents(docs)
-    print(f"Document découpé en {len(splits)} morceaux.")
+    # start_index : position du morceau dans le document (fusion des voisins, context_budget.py)
+    text_splitter = RecursiveCharacterTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP, add_start_index=True)
+    return text_splitter.split_documents(docs)
+
+def dedupe_chunks(splits):
+    """
+    Associe un ID à chaque morceau et retire les morceaux identiques.
+    Returns: (ids, documents) dans l'ordre du document
+    """
+    chunks = {}
+    for doc in splits:
+        chunks.setdefault(chunk_id(doc), doc)
+    return list(chunks.keys()), list(chunks.values())
+
+def _is_up_to_date(entry, current_hash, region_name):
+    return (
+        entry is not None
+        and entry["file_hash"] == current_hash
+        and entry["region"] == region_name
+        and entry.get("embedding") == embedding_signature()
+    )
+
+def _plan_update(entry, region_name, ids, force=False):
+    """
+    Différentiel entre les morceaux du manifeste et ceux du fichier actuel.
+    Returns: (reusable, positions des morceaux à ajouter, IDs à supprimer)
+    """
+    reusable = (
+        entry is not None
+        and entry["region"] == region_name
+        and entry.get("embedding") == embedding_signature()
+        and not force
+    )
+    existing_ids = set(entry["chunk_ids"]) if reusable else set()
+    new_positions = [i for i, cid in enumerate(ids) if cid not in existing_ids]
+    stale_ids = list(existing_ids - set(ids))
+    return reusable, new_positions, stale_ids
+
+def _finish_update(filename, region_name, current_hash, ids, entry, changed):
+    """
+    Met à jour le manifeste et la version des régions modifiées.
+    """
+    set_source_manifest(filename, region_name, current_hash, ids, embedding_signature())
+    # Nouvelle version de la région -> invalide les caches de réponses (agent_logic)
+    if changed:
+        bump_region_version(region_name)
+    if entry is not None and entry["region"] != region_name:
+        bump_region_version(entry["region"])
+
+def _refresh_numpy_store():
+    # Backend NumPy : les shards sont ré-exportés après chaque ingestion qui modifie Chroma
+    if VECTOR_BACKEND == "numpy":
+        from numpy_store import export_from_chroma
+        export_from_chroma()
+
+# Nom de collection par défaut de langchain_chroma (celui des bases déjà ingérées)
+CHROMA_COLLECTION = "langchain"
+
+def open_vector_db():
+    """
+    Ouvre la base Chroma persistante.
+    """
+    return Chroma(
+        persist_directory=VECTORSTORE_PATH, 
+        embedding_function=get_embedding_function(),
+        collection_name=CHROMA_COLLECTION
+    )
+
+def open_collection():
+    """
+    Collection chromadb brute de la base : écriture de vecteurs déjà calculés
+    (le wrapper LangChain ré-encode toujours les textes).
+    """
+    import chromadb
+    client = chromadb.PersistentClient(path=VECTORSTORE_PATH)
+    # Même création que langchain_chroma : pas de fonction d'embedding côté Chroma
+    return client.get_or_create_collection(name=CHROMA_COLLECTION, embedding_function=None)
+
+def _orphan_ids(store, filename, ids):
+    """
+    IDs stockés pour ce fichier qui ne font plus partie de ses morceaux
+    (anciennes ingestions sans manifeste, modèle ou région changés).
+    `store` : wrapper Chroma ou collection chromadb (même méthode get).
+    """
+    stored = store.get(where={"source": filename}, include=[])["ids"]
+    return list(set(stored) - set(ids))
+
+def create_vector_db(filename, region_name, force=False):
+    """
+    Fonction pour ingérer un document (PDF ou TXT), le découper et le stocker.
+    Idempotente et incrémentale : un guide inchangé n'est pas ré-encodé, et
+    seuls les morceaux ajoutés/supprimés sont écrits/effacés dans Chroma.
+
+    Returns:
+        dict: {'added': int, 'deleted': int, 'skipped': bool} (None si fichier absent)
+    """
+    file_path = os.path.join(DOCUMENTS_PATH, filename)
     
-    # 4. Stockage dans Chroma (Persistence)
-    Chroma.from_documents(
-        documents=splits, 
-        embedding=embedding_function, 
-        persist_directory=VECTORSTORE_PATH
+    print(f"--- Chargement de {filename} ---")
+    if not os.path.exists(file_path):
+        print(f"ERREUR : Le fichier {file_path} est introuvable.")
+        return
+
+    start = time.perf_counter()
+    current_hash = file_hash(file_path)
+    entry = get_source_manifest(filename)
+    if _is_up_to_date(entry, current_hash, region_name) and not force:
+        print(f"Inchangé, rien à faire ({(time.perf_counter() - start) * 1000:.1f} ms).")
+        return {"added": 0, "deleted": 0, "skipped": True}
+
+    ids, chunks = dedupe_chunks(load_and_split(filename, region_name))
+    print(f"Document découpé en {len(chunks)} morceaux.")
+
+    db = open_vector_db()
+
+    # 4. Calcul du différentiel avec ce qui est déjà stocké
+    reusable, new_positions, stale_ids = _plan_update(entry, region_name, ids, force)
+
+    # 5. Stockage dans Chroma (Persistence) : uniquement le différentiel.
+    # Ajout (upsert) d'abord : si l'embedding échoue, l'ancienne version reste en place.
+    if new_positions:
+        db.add_documents(
+            documents=[chunks[i] for i in new_positions],
+            ids=[ids[i] for i in new_positions]
+        )
+    if not reusable:
+        # Première ingestion avec manifeste (ou modèle/région changé) :
+        # on purge les anciennes copies de ce fichier (ingestions sans IDs)
+        stale_ids = _orphan_ids(db, filename, ids)
+    if stale_ids:
+        db.delete(ids=stale_ids)
+
+    # 6. Manifeste + versions de région
+    changed = bool(new_positions or stale_ids or not reusable)
+    _finish_update(filename, region_name, current_hash, ids, entry, changed)
+    if changed:
+        _refresh_numpy_store()
+    print(
+        f"Succès ! {len(new_positions)} morceau(x) ajouté(s), {len(stale_ids)} supprimé(s) "
+        f"en {(time.perf_counter() - start) * 1000:.0f} ms dans {VECTORSTORE_PATH}"
+    )
+    return {"added": len(new_positions), "deleted": len(stale_ids), "skipped": False}
+
+# --- INGESTION EN MASSE (tous les guides régionaux) ---
+def region_from_filename(filename):
+    """
+    guide_bruxelles.txt -> "bruxelles", guide_bw.txt -> "brabant_wallon"
+    """
+    stem = os.path.splitext(os.path.basename(filename))[0]
+    if stem.startswith("guide_"):
+        stem = stem[len("guide_"):]
+    return GUIDE_REGION_ALIASES.get(stem, stem)
+
+def discover_guides(documents_path=DOCUMENTS_PATH):
+    """
+    Liste les guides (TXT et PDF) du dossier documents.
+    Returns: liste de (filename, region_name) triée
+    """
+    guides = []
+    for pattern in ("guide_*.txt", "guide_*.pdf"):
+        for path in glob.glob(os.path.join(documents_path, pattern)):
+            filename = os.path.basename(path)
+            guides.append((filename, region_from_filename(filename)))
+    return sorted(guides)
+
+def _load_split_worker(filename, region_name):
+    # Exécuté dans un process du pool : chargement + découpage + IDs
+    ids, chunks = dedupe_chunks(load_and_split(filename, region_name))
+    return filename, region_name, ids, chunks
+
+def _batched(items, size):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+def ingest_all(force=False, max_workers=None, embed_batch_size=512, write_batch_size=1000):
+    """
+    Ingère tous les guides : découpage parallèle (process pool), embedding
+    par gros lots avec un seul embedder, écriture en masse dans Chroma.
+    Incrémental comme create_vector_db (manifeste + IDs par contenu).
+
+    Returns:
+        dict: statistiques (documents, morceaux ajoutés/supprimés, débits)
+    """
+    start = time.perf_counter()
+    guides = discover_guides()
+    print(f"--- {len(guides)} guide(s) trouvé(s) dans {DOCUMENTS_PATH} ---")
+
+    # 1. Filtrage des guides inchangés (hash du fichier vs manifeste)
+    todo = []
+    hashes = {}
+    for filename, region_name in guides:
+        hashes[filename] = file_hash(os.path.join(DOCUMENTS_PATH, filename))
+        if force or not _is_up_to_date(get_source_manifest(filename), hashes[filename], region_name):
+            todo.append((filename, region_name))
+    print(f"{len(guides) - len(todo)} inchangé(s), {len(todo)} à (ré)ingérer.")
+    if not todo:
+        return {"documents": 0, "added": 0, "deleted": 0, "seconds": time.perf_counter() - start}
+
+    # 2. Chargement + découpage en parallèle
+    t_split = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        loaded = list(pool.map(_load_split_worker, *zip(*todo)))
+    t_split = time.perf_counter() - t_split
+
+    # 3. Différentiel par source (aucune écriture avant que tous les vecteurs soient calculés)
+    plans = []
+    to_embed = []
+    for filename, region_name, ids, chunks in loaded:
+        entry = get_source_manifest(filename)
+        reusable, new_positions, stale_ids = _plan_update(entry, region_name, ids, force)
+        to_embed.extend((ids[i], chunks[i]) for i in new_positions)
+        plans.append((filename, region_name, ids, entry, reusable, new_positions, stale_ids))
+
+    # 4. Embedding par gros lots (un seul modèle partagé)
+    t_embed = time.perf_counter()
+    embedding_function = get_embedding_function()
+    vectors = []
+    for batch in _batched(to_embed, embed_batch_size):
+        vectors.extend(embedding_function.embed_documents([doc.page_content for _, doc in batch]))
+    t_embed = time.perf_counter() - t_embed
+
+    # 5. Écriture en masse dans Chroma : upsert des nouveaux morceaux, puis
+    #    suppression des morceaux périmés (un échec laisse l'ancienne version en place)
+    t_write = time.perf_counter()
+    collection = open_collection()
+    for offset in range(0, len(to_embed), write_batch_size):
+        batch = to_embed[offset:offset + write_batch_size]
+        collection.upsert(
+            ids=[cid for cid, _ in batch],
+            embeddings=vectors[offset:offset + write_batch_size],
+            documents=[doc.page_content for _, doc in batch],
+            metadatas=[doc.metadata for _, doc in batch]
+        )
+    to_delete = []
+    updates = []
+    for filename, region_name, ids, entry, reusable, new_positions, stale_ids in plans:
+        if not reusable:
+            stale_ids = _orphan_ids(collection, filename, ids)
+        to_delete.extend(stale_ids)
+        changed = bool(new_positions or stale_ids or not reusable)
+        updates.append((filename, region_name, ids, entry, changed))
+    for batch in _batched(to_delete, write_batch_size):
+        collection.delete(ids=batch)
+    t_write = time.perf_counter() - t_write
+
+    for filename, region_name, ids, entry, changed in updates:
+        _finish_update(filename, region_name, hashes[filename], ids, entry, changed)
+    if any(changed for *_, changed in updates):
+        _refresh_numpy_store()
+
+    # 6. Débit
+    elapsed = time.perf_counter() - start
+    n_chunks = len(to_embed)
+    stats = {
+        "documents": len(loaded),
+        "added": n_chunks,
+        "deleted": len(to_delete),
+        "seconds": elapsed,
+        "split_seconds": t_split,
+        "embed_seconds": t_embed,
+        "write_seconds": t_write,
+        "docs_per_second": len(loaded) / elapsed if elapsed else 0.0,
+        "chunks_per_second": n_chunks / elapsed if elapsed else 0.0,
+        "embed_chunks_per_second": n_chunks / t_embed if t_embed else 0.0
+    }
+    print(
+        f"Succès ! {stats['documents']} document(s), {n_chunks} morceau(x) ajouté(s), "
+        f"{stats['deleted']} supprimé(s) en {elapsed:.2f} s\n"
+        f"  découpage {t_split:.2f} s | embedding {t_embed:.2f} s | écriture {t_write:.2f} s\n"
+        f"  débit : {stats['docs_per_second']:.1f} docs/s, {stats['chunks_per_second']:.1f} morceaux/s "
+        f"(embedding seul : {stats['embed_chunks_per_second']:.1f} morceaux/s)"
     )
-    print(f"Succès ! Base de données mise à jour dans {VECTORSTORE_PATH}")
+    return stats
 
-def query_vector_db(question, region_name, n_results=4):
+def query_vector_db(question, region_name, n_results=4, verbose=True, db=None):
     """
     Fonction pour interroger la base vectorielle.
     Elle cherche les 'n_results' morceaux de textes les plus proches sémantiquement de la question.
+    verbose=False : pas d'affichage (benchmarks, service).
+    db : base à interroger, sinon celle du moteur (ouverte une seule fois par process,
+         Chroma ou index NumPy selon VECTOR_BACKEND).
     """
-    # 1. On charge la base existante (pas besoin de recréer)
-    db = Chroma(
-        persist_directory=VECTORSTORE_PATH, 
-        embedding_function=embedding_function
-    )
+    # 1. Base partagée du moteur (avant : Chroma ré-ouvert à chaque appel)
+    if db is None:
+        from engine import get_engine
+        db = get_engine().vector_db
     
     # 2. Recherche par similarité (Similarity Search)
     # Le filtre est CRUCIAL : on ne veut chercher QUE dans les documents de la région donnée
-    print(f"\n--- Recherche pour : '{question}' ({region_name}) ---")
     results = db.similarity_search(
         query=question,
         k=n_results,
@@ -73,6 +353,9 @@ def query_vector_db(question, region_name, n_results=4):
     )
     
     # 3. Affichage des résultats trouvés
+    if not verbose:
+        return results
+    print(f"\n--- Recherche pour : '{question}' ({region_name}) ---")
     for i, doc in enumerate(results):
         print(f"\n[Résultat {i+1}] (Source: {doc.metadata.get('source', 'Inconnue')})")
         print(doc.page_content)
@@ -81,23 +364,45 @@ def query_vector_db(question, region_name, n_results=4):
     return results
 
 if __name__ == "__main__":
-    # Test immédiat avec ton fichier texte
-    
-    # create_vector_db(filename="guide_antwerp.txt", region_name="antwerp")
-    # create_vector_db(filename="guide_bruxelles.txt", region_name="bruxelles")    
-    # create_vector_db(filename="guide_bw.txt", region_name="brabant_wallon")
-    # create_vector_db(filename="guide_charleroi.txt", region_name="charleroi")
-    # create_vector_db(filename="guide_hainaut.txt", region_name="hainaut")
-    # create_vector_db(filename="guide_liege.txt", region_name="liege")
-    # create_vector_db(filename="guide_luxembourg.txt", region_name="luxembourg")
-    # create_vector_db(filename="guide_mons.txt", region_name="mons")
-    # create_vector_db(filename="guide_namur.txt", region_name="namur")
-
-    # 2. TEST DE RECUPERATION
-    # Testons si le système comprend une question sur la pizza
-    query_vector_db("Dans quel sac mettre une peau de banane ?", "bruxelles")
-    query_vector_db("Dans quel sac mettre une peau de banane ?", "hainaut")
-
-    # Testons une question piège (si tu as mis les règles sur les piles/produits chimiques)
-    #query_vector_db("Où jeter une bouteille de produit chimique ?", "bruxelles")
-    
\ No newline at end of file
+    # Usage :
+    #   python rag_engine.py ingest [--force] [--workers N]   -> ingère tous les guides
+    #   python rag_engine.py query "question" bruxelles       -> teste la récupération
+    #   python rag_engine.py                                  -> tests de récupération par défaut
+    parser = argparse.ArgumentParser(description="Ingestion et interrogation de la base vectorielle")
+    subparsers = parser.add_subparsers(dest="command")
+
+    ingest_parser = subparsers.add_parser("ingest", help="Ingère tous les guides data/documents/guide_*")
+    ingest_parser.add_argument("--force", action="store_true", help="Ré-encode tout, même les guides inchangés")
+    ingest_parser.add_argument("--workers", type=int, default=None, help="Nombre de process pour le découpage")
+    ingest_parser.add_argument("--embed-batch-size", type=int, default=512)
+    ingest_parser.add_argument("--write-batch-size", type=int, default=1000)
+    ingest_parser.add_argument("--bin-table", action="store_true",
+                               help="Reconstruit ensuite la table classe -> sac des régions modifiées (appelle Mistral)")
+
+    query_parser = subparsers.add_parser("query", help="Recherche les morceaux proches d'une question")
+    query_parser.add_argument("question")
+    query_parser.add_argument("region")
+    query_parser.add_argument("-k", type=int, default=4)
+
+    args = parser.parse_args()
+
+    if args.command == "ingest":
+        ingest_all(
+            force=args.force,
+            max_workers=args.workers,
+            embed_batch_size=args.embed_batch_size,
+            write_batch_size=args.write_batch_size
+        )
+        if args.bin_table:
+            from bin_table import build_bin_table
+            build_bin_table()
+    elif args.command == "query":
+        query_vector_db(args.question, args.region, n_results=args.k)
+    else:
+        # 2. TEST DE RECUPERATION
+        # Testons si le système comprend une question sur la pizza
+        query_vector_db("Dans quel sac mettre une peau de banane ?", "bruxelles")
+        query_vector_db("Dans quel sac mettre une peau de banane ?", "hainaut")
+
+        # Testons une question piège (si tu as mis les règles sur les piles/produits chimiques)
+        #query_vector_db("Où jeter une bouteille de produit chimique ?", "bruxelles")
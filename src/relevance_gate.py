@@ -0,0 +1,248 @@
+import argparse
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Any, Optional
+
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.retrievers import BaseRetriever
+
+from config import (
+    REGIONS, RELEVANCE_DEFAULT_THRESHOLD,
+    RELEVANCE_GATE_ENABLED, RELEVANCE_THRESHOLDS_PATH
+)
+
+# --- FILTRE DE PERTINENCE DE LA RÉCUPÉRATION ---
+# Une bonne part des questions est hors sujet ("quel temps demain ?", "azerty").
+# Sans filtre, Mistral reçoit quand même le contexte et répond la phrase de repli
+# du prompt : on paie tous les tokens d'entrée pour une réponse connue d'avance.
+# On garde donc le score de la recherche vectorielle et, si aucun morceau de la
+# région n'atteint le seuil calibré pour cette région, le retriever ne renvoie
+# rien : agent_logic répond alors la phrase de repli localement (0 token).
+#
+# Score de pertinence = 1 / (1 + distance) : croissant avec la proximité, dans ]0, 1],
+# quelle que soit la métrique de la base (Chroma renvoie une distance L2 au carré).
+# Les seuils n'ont de sens que pour le modèle d'embedding qui a servi à les calibrer.
+
+PROJECT_ROOT = Path(__file__).parent.parent
+LABELS_PATH = PROJECT_ROOT / "data" / "benchmarks" / "relevance_queries.json"
+
+def relevance_from_distance(distance):
+    return 1.0 / (1.0 + max(0.0, float(distance)))
+
+def scored_search(vector_store, region, k, query=None, vector=None):
+    """
+    Recherche vectorielle filtrée par région, avec score de pertinence.
+    Le score est aussi copié dans doc.metadata["relevance_score"].
+
+    Returns:
+        list[(Document, float)]: par pertinence décroissante
+    """
+    search_filter = {"region": region}
+    if vector is not None:
+        results = vector_store.similarity_search_by_vector_with_relevance_scores(vector, k=k, filter=search_filter)
+    else:
+        results = vector_store.similarity_search_with_score(query, k=k, filter=search_filter)
+    scored = []
+    for doc, distance in results:
+        score = round(relevance_from_distance(distance), 4)
+        doc.metadata["relevance_score"] = score
+        scored.append((doc, score))
+    return scored
+
+def best_relevance(docs):
+    """
+    Meilleur score de pertinence parmi des documents récupérés (None si inconnu).
+    """
+    scores = [doc.metadata["relevance_score"] for doc in docs if "relevance_score" in doc.metadata]
+    return max(scores) if scores else None
+
+def passes(scored, threshold):
+    """
+    True si au moins un morceau atteint le seuil (toujours True sans seuil).
+    """
+    if threshold is None:
+        return True
+    return any(score >= threshold for _, score in scored)
+
+class ScoredVectorRetriever(BaseRetriever):
+    """
+    Retriever vectoriel de la région (mode RETRIEVAL_MODE="vector") avec filtre de pertinence :
+    liste vide si aucun morceau n'atteint score_threshold.
+    """
+    vector_store: Any
+    region: str
+    k: int = 2
+    score_threshold: Optional[float] = None
+
+    def _filter(self, scored):
+        return [doc for doc, _ in scored] if passes(scored, self.score_threshold) else []
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun):
+        return self._filter(scored_search(self.vector_store, self.region, self.k, query=query))
+
+    def retrieve_by_vector(self, query, vector):
+        return self._filter(scored_search(self.vector_store, self.region, self.k, vector=vector))
+
+# --- SEUILS PAR RÉGION ---
+_thresholds = None
+_thresholds_lock = threading.Lock()
+
+def _embedding_signature():
+    from embeddings import embedding_signature
+    return embedding_signature()
+
+def load_thresholds(path=RELEVANCE_THRESHOLDS_PATH):
+    """
+    Seuils calibrés {region: seuil} ; ignorés s'ils viennent d'un autre modèle d'embedding.
+    """
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    if data.get("signature") != _embedding_signature():
+        print(f"⚠️ Seuils de pertinence ignorés ({path}) : calibrés pour {data.get('signature')}, relancez la calibration")
+        return {}
+    return {region: value for region, value in data.get("thresholds", {}).items() if value is not None}
+
+def get_threshold(region):
+    """
+    Seuil de la région (calibré, sinon RELEVANCE_DEFAULT_THRESHOLD), None = pas de filtre.
+    """
+    global _thresholds
+    if not RELEVANCE_GATE_ENABLED:
+        return None
+    if _thresholds is None:
+        with _thresholds_lock:
+            if _thresholds is None:
+                _thresholds = load_thresholds()
+    return _thresholds.get(region, RELEVANCE_DEFAULT_THRESHOLD)
+
+def reload_thresholds():
+    """
+    Relit le fichier de seuils (à suivre d'un agent_logic.invalidate_rag_chains()).
+    """
+    global _thresholds
+    with _thresholds_lock:
+        _thresholds = None
+
+# --- CALIBRATION ---
+def choose_threshold(in_scope_scores, out_of_scope_scores, min_recall=0.98):
+    """
+    Seuil qui rejette le plus de questions hors sujet tout en laissant passer
+    au moins min_recall des questions du domaine. Placé à mi-chemin entre le
+    plus faible score du domaine conservé et le plus fort score hors sujet rejeté.
+
+    Returns:
+        float | None: None si aucun seuil ne rejette de question hors sujet
+    """
+    if not in_scope_scores or not out_of_scope_scores:
+        return None
+    best = None  # (rejetées, seuil candidat)
+    for candidate in sorted(set(in_scope_scores)):
+        recall = sum(s >= candidate for s in in_scope_scores) / len(in_scope_scores)
+        if recall < min_recall:
+            break
+        rejected = sum(s < candidate for s in out_of_scope_scores)
+        if best is None or rejected > best[0]:
+            best = (rejected, candidate)
+    if best is None or best[0] == 0:
+        return None
+    candidate = best[1]
+    below = max(s for s in out_of_scope_scores if s < candidate)
+    return round((candidate + below) / 2, 4)
+
+def _rate(count, total):
+    return round(count / total, 4) if total else None
+
+def calibrate(labels, regions=None, min_recall=0.98):
+    """
+    Calcule le meilleur score de chaque question étiquetée, région par région,
+    et en déduit le seuil de chaque région.
+
+    Args:
+        labels: {'in_scope': [questions], 'out_of_scope': [questions]}
+
+    Returns:
+        dict: {region: {'threshold', 'in_scope_recall', 'out_of_scope_rejected', ...}}
+    """
+    from engine import get_engine
+
+    engine = get_engine()
+    in_scope = list(labels["in_scope"])
+    out_of_scope = list(labels["out_of_scope"])
+    vectors = engine.embedding_function.embed_documents(in_scope + out_of_scope)
+
+    report = {}
+    for region in regions or labels.get("regions") or REGIONS:
+        scores = []
+        for vector in vectors:
+            scored = scored_search(engine.vector_db, region, k=1, vector=vector)
+            scores.append(scored[0][1] if scored else 0.0)
+        in_scores, out_scores = scores[:len(in_scope)], scores[len(in_scope):]
+        if not any(in_scores):
+            print(f"⚠️ {region} : aucun morceau indexé, région ignorée")
+            continue
+        threshold = choose_threshold(in_scores, out_scores, min_recall)
+        kept = sum(s >= threshold for s in in_scores) if threshold is not None else len(in_scores)
+        rejected = sum(s < threshold for s in out_scores) if threshold is not None else 0
+        report[region] = {
+            "threshold": threshold,
+            "in_scope_recall": _rate(kept, len(in_scores)),
+            "out_of_scope_rejected": _rate(rejected, len(out_scores)),
+            "in_scope_min": min(in_scores),
+            "out_of_scope_max": max(out_scores),
+            "missed": [q for q, s in zip(in_scope, in_scores) if threshold is not None and s < threshold]
+        }
+    return report
+
+def save_thresholds(report, path=RELEVANCE_THRESHOLDS_PATH, labels_path=None):
+    """
+    Écrit les seuils ; les régions non recalibrées gardent leur seuil (même modèle d'embedding).
+    """
+    data = {"thresholds": {}, "report": {}}
+    if os.path.exists(path):
+        with open(path, encoding="utf-8") as f:
+            previous = json.load(f)
+        if previous.get("signature") == _embedding_signature():
+            data = previous
+    data.update({
+        "signature": _embedding_signature(),
+        "score": "1 / (1 + distance)",
+        "labels": str(labels_path) if labels_path else None
+    })
+    for region, entry in report.items():
+        data["thresholds"][region] = entry["threshold"]
+        data["report"][region] = entry
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    reload_thresholds()
+    return data
+
+if __name__ == "__main__":
+    # Usage :
+    #   python relevance_gate.py                       -> calibre toutes les régions et écrit les seuils
+    #   python relevance_gate.py --region bruxelles --min-recall 1.0 --dry-run
+    parser = argparse.ArgumentParser(description="Calibration des seuils de pertinence par région")
+    parser.add_argument("--labels", default=str(LABELS_PATH), help="questions étiquetées (dans / hors sujet)")
+    parser.add_argument("--region", action="append", help="région(s) à calibrer (défaut : toutes)")
+    parser.add_argument("--min-recall", type=float, default=0.98,
+                        help="part minimale des questions du domaine qui doit passer le filtre")
+    parser.add_argument("--output", default=RELEVANCE_THRESHOLDS_PATH)
+    parser.add_argument("--dry-run", action="store_true", help="affiche le rapport sans écrire les seuils")
+    args = parser.parse_args()
+
+    with open(args.labels, encoding="utf-8") as f:
+        labels = json.load(f)
+    report = calibrate(labels, regions=args.region, min_recall=args.min_recall)
+    for region, entry in report.items():
+        threshold = "aucun" if entry["threshold"] is None else f"{entry['threshold']:.4f}"
+        print(f"📏 {region:<15} seuil {threshold:<8} domaine conservé {entry['in_scope_recall']:.0%} - "
+              f"hors sujet rejeté {entry['out_of_scope_rejected']:.0%}")
+        for question in entry["missed"]:
+            print(f"   ↳ filtrée à tort : {question}")
+    if not args.dry_run:
+        save_thresholds(report, args.output, args.labels)
+        print(f"✅ Seuils écrits dans {args.output}")
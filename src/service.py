@@ -0,0 +1,354 @@
+import asyncio
+import io
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from urllib.parse import parse_qs
+
+import numpy as np
+from PIL import Image
+
+from config import (
+    REGIONS, SERVICE_HOST, SERVICE_PORT, SERVICE_WORKERS,
+    SERVICE_VISION_BATCH_SIZE, SERVICE_VISION_BATCH_WAIT_MS
+)
+from engine import ConfigurationError, get_engine
+
+# --- SERVICE D'INFÉRENCE HTTP (un seul jeu de modèles par machine) ---
+# Chaque process Streamlit chargeait son YOLO, son MiniLM et son client Chroma.
+# Ici les modèles sont chargés une fois (moteur partagé) et servis en HTTP :
+#   GET  /health          -> le process répond (liveness)
+#   GET  /ready           -> 200 quand tous les composants sont chargés, sinon 503
+#   POST /ask             -> {"question", "region"} : réponse format ask_agent
+#   POST /ask/stream      -> idem en NDJSON : {"chunk": ...} puis {"result": ...}
+#   POST /ask/multi       -> {"objects": [...], "region"} : un seul appel pour plusieurs déchets
+#   POST /query           -> {"question", "region", "k"} : morceaux du guide
+#   POST /predict?conf=.5 -> octets d'une image : résultat format predict
+#                            (&mode=all : toutes les détections, format predict_all)
+#   GET  /bin?class_name=Glass&region=bruxelles -> réponse pré-calculée (ou 404)
+# Les appels bloquants passent par un pool fixe de SERVICE_WORKERS threads ;
+# les images reçues presque en même temps sont prédites en un seul lot YOLO.
+#
+#   python service.py   (ou : uvicorn service:app --host 0.0.0.0 --port 8000)
+# puis SERVICE_URL=http://127.0.0.1:8000 streamlit run app.py
+
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+# --- MICRO-LOTS VISION ---
+class VisionBatcher:
+    """
+    Regroupe les prédictions arrivées pendant `max_wait_ms` (au plus
+    `max_batch_size` images) en un seul appel VisionModel.predict_batch.
+    """
+    def __init__(self, executor, max_batch_size=8, max_wait_ms=10.0):
+        self.executor = executor
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+        self._queue = None
+        self._task = None
+        self.stats = {"batches": 0, "images": 0}
+
+    def start(self):
+        if self._task is None:
+            self._queue = asyncio.Queue()
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def predict(self, array, conf_threshold, kind="best"):
+        self.start()
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((array, (conf_threshold, kind), future))
+        return await future
+
+    async def _collect(self):
+        loop = asyncio.get_running_loop()
+        batch = [await self._queue.get()]
+        deadline = loop.time() + self.max_wait_ms / 1000
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._collect()
+            # Un lot YOLO = un seul seuil de confiance et un seul mode (best / all)
+            groups = {}
+            for array, group, future in batch:
+                groups.setdefault(group, []).append((array, future))
+            for (conf_threshold, kind), items in groups.items():
+                arrays = [array for array, _ in items]
+                try:
+                    results = await loop.run_in_executor(self.executor, partial(
+                        _predict_batch, arrays, conf_threshold, self.max_batch_size, kind
+                    ))
+                except Exception as e:
+                    for _, future in items:
+                        if not future.done():
+                            future.set_exception(e)
+                    continue
+                self.stats["batches"] += 1
+                self.stats["images"] += len(arrays)
+                for (_, future), result in zip(items, results):
+                    if not future.done():
+                        future.set_result(result)
+
+def _predict_batch(arrays, conf_threshold, batch_size, kind):
+    model = get_engine().vision_model
+    predict = model.predict_all_batch if kind == "all" else model.predict_batch
+    return predict(arrays, conf_threshold, batch_size=batch_size)
+
+def _decode_and_lookup(body, conf_threshold, kind):
+    from vision_model import prediction_cache
+    try:
+        array = np.array(Image.open(io.BytesIO(body)).convert("RGB"))
+    except Exception as e:
+        raise HTTPError(400, f"Image illisible : {e}")
+    result, cache_key = prediction_cache.get(array, conf_threshold, kind)
+    return array, result, cache_key
+
+# --- OUTILS HTTP (ASGI) ---
+async def _read_body(receive):
+    body = b""
+    more_body = True
+    while more_body:
+        message = await receive()
+        body += message.get("body", b"")
+        more_body = message.get("more_body", False)
+    return body
+
+def _json_body(body):
+    try:
+        payload = json.loads(body or b"{}")
+    except json.JSONDecodeError as e:
+        raise HTTPError(400, f"JSON invalide : {e}")
+    if not isinstance(payload, dict):
+        raise HTTPError(400, "Le corps doit être un objet JSON")
+    return payload
+
+def _question_and_region(payload):
+    question = payload.get("question")
+    region = payload.get("region", "bruxelles")
+    if not isinstance(question, str) or not question.strip():
+        raise HTTPError(400, "Champ 'question' manquant")
+    if region not in REGIONS:
+        raise HTTPError(400, f"Région inconnue : {region!r}")
+    return question, region
+
+async def _send_json(send, status, payload):
+    body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(b"content-type", b"application/json; charset=utf-8"), (b"content-length", str(len(body)).encode())]
+    })
+    await send({"type": "http.response.body", "body": body})
+
+# --- SERVICE ---
+class InferenceService:
+    """
+    Application ASGI (uvicorn) autour du moteur partagé.
+    """
+    def __init__(self, workers=SERVICE_WORKERS, vision_batch_size=SERVICE_VISION_BATCH_SIZE,
+                 vision_batch_wait_ms=SERVICE_VISION_BATCH_WAIT_MS):
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="inference")
+        self.batcher = VisionBatcher(self.executor, vision_batch_size, vision_batch_wait_ms)
+        self.routes = {
+            ("GET", "/health"): self.health,
+            ("GET", "/ready"): self.ready,
+            ("POST", "/ask"): self.ask,
+            ("POST", "/ask/stream"): self.ask_stream,
+            ("POST", "/ask/multi"): self.ask_multi,
+            ("POST", "/query"): self.query,
+            ("POST", "/predict"): self.predict,
+            ("GET", "/bin"): self.bin_answer
+        }
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+            return
+        if scope["type"] != "http":
+            return
+        handler = self.routes.get((scope["method"], scope["path"]))
+        if handler is None:
+            await _send_json(send, 404, {"error": f"Route inconnue : {scope['method']} {scope['path']}"})
+            return
+        try:
+            await handler(scope, receive, send)
+        except HTTPError as e:
+            await _send_json(send, e.status, {"error": str(e)})
+        except ConfigurationError as e:
+            await _send_json(send, 503, {"error": str(e), "configuration": True})
+        except Exception as e:
+            print(f"❌ Erreur service ({scope['path']}) : {e}")
+            await _send_json(send, 500, {"error": str(e)})
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                # Préchauffage en fond : /health répond tout de suite, /ready passe à 200 ensuite
+                get_engine().warmup(background=True)
+                self.batcher.start()
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await self.batcher.stop()
+                self.executor.shutdown(wait=False)
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def _run(self, fn, *args, **kwargs):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, partial(fn, *args, **kwargs))
+
+    # --- ROUTES ---
+    async def health(self, scope, receive, send):
+        await _send_json(send, 200, {"status": "ok"})
+
+    async def ready(self, scope, receive, send):
+        status = get_engine().status()
+        ready = all(info["state"] == "ready" for info in status.values())
+        await _send_json(send, 200 if ready else 503, {
+            "ready": ready,
+            "components": status,
+            "vision_batches": self.batcher.stats
+        })
+
+    async def ask(self, scope, receive, send):
+        from agent_logic import ask_agent
+        question, region = _question_and_region(_json_body(await _read_body(receive)))
+        await _send_json(send, 200, await self._run(ask_agent, question, region=region))
+
+    async def ask_multi(self, scope, receive, send):
+        from agent_logic import ask_agent_multi
+        payload = _json_body(await _read_body(receive))
+        objects = payload.get("objects")
+        region = payload.get("region", "bruxelles")
+        if not isinstance(objects, list) or not objects or not all(isinstance(o, str) for o in objects):
+            raise HTTPError(400, "Champ 'objects' manquant (liste de libellés)")
+        if region not in REGIONS:
+            raise HTTPError(400, f"Région inconnue : {region!r}")
+        await _send_json(send, 200, await self._run(ask_agent_multi, objects, region=region))
+
+    async def ask_stream(self, scope, receive, send):
+        from agent_logic import stream_agent
+        question, region = _question_and_region(_json_body(await _read_body(receive)))
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue()
+
+        def _produce():
+            # Thread du pool : itère le flux de l'agent et pousse chaque ligne vers la boucle
+            stream = stream_agent(question, region=region)
+            try:
+                for chunk in stream:
+                    loop.call_soon_threadsafe(queue.put_nowait, {"chunk": chunk})
+                line = {"result": stream.result}
+            except ConfigurationError as e:
+                line = {"error": str(e), "configuration": True}
+            except Exception as e:
+                line = {"error": str(e)}
+            loop.call_soon_threadsafe(queue.put_nowait, line)
+            loop.call_soon_threadsafe(queue.put_nowait, None)
+
+        producer = loop.run_in_executor(self.executor, _produce)
+        await send({
+            "type": "http.response.start",
+            "status": 200,
+            "headers": [(b"content-type", b"application/x-ndjson; charset=utf-8")]
+        })
+        while (line := await queue.get()) is not None:
+            await send({
+                "type": "http.response.body",
+                "body": (json.dumps(line, ensure_ascii=False) + "\n").encode("utf-8"),
+                "more_body": True
+            })
+        await send({"type": "http.response.body", "body": b""})
+        await producer
+
+    async def query(self, scope, receive, send):
+        from rag_engine import query_vector_db
+        payload = _json_body(await _read_body(receive))
+        question, region = _question_and_region(payload)
+        k = int(payload.get("k", 4))
+        docs = await self._run(lambda: query_vector_db(
+            question, region, n_results=k, verbose=False, db=get_engine().vector_db
+        ))
+        await _send_json(send, 200, {
+            "results": [{"content": doc.page_content, "metadata": doc.metadata} for doc in docs]
+        })
+
+    async def predict(self, scope, receive, send):
+        from vision_model import prediction_cache
+        params = parse_qs(scope.get("query_string", b"").decode())
+        conf = params.get("conf", ["0.5"])[0]
+        try:
+            conf_threshold = float(conf)
+        except ValueError:
+            conf_threshold = None
+        if conf_threshold is None or not 0 <= conf_threshold <= 1:
+            raise HTTPError(400, f"Seuil de confiance invalide : {conf!r} (attendu : nombre entre 0 et 1)")
+        kind = params.get("mode", ["best"])[0]
+        if kind not in ("best", "all"):
+            raise HTTPError(400, f"Mode inconnu : {kind!r} (attendu : best, all)")
+        body = await _read_body(receive)
+        if not body:
+            raise HTTPError(400, "Corps vide : envoyer les octets de l'image")
+        start = time.perf_counter()
+        # Décodage + hash de l'image dans le pool : une grosse photo ne bloque pas la boucle
+        # (et donc pas les autres requêtes, ni les tokens de /ask/stream)
+        array, result, cache_key = await self._run(_decode_and_lookup, body, conf_threshold, kind)
+        cache_hit = result is not None
+        if not cache_hit:
+            result = await self.batcher.predict(array, conf_threshold, kind)
+            prediction_cache.put(cache_key, result)
+        result = dict(result)
+        # Attente du lot comprise : c'est le temps vision vu par le client
+        result["timings_ms"] = {"vision": round((time.perf_counter() - start) * 1000, 1)}
+        result["cache_hit"] = cache_hit
+        await _send_json(send, 200, result)
+
+    async def bin_answer(self, scope, receive, send):
+        from bin_table import lookup_bin_answer
+        params = parse_qs(scope.get("query_string", b"").decode())
+        class_name = params.get("class_name", [None])[0]
+        region = params.get("region", [None])[0]
+        if not class_name or region not in REGIONS:
+            raise HTTPError(400, "Paramètres 'class_name' et 'region' requis")
+        entry = lookup_bin_answer(class_name, region)
+        if entry is None:
+            await _send_json(send, 404, {"error": "Réponse absente ou périmée"})
+            return
+        await _send_json(send, 200, entry)
+
+app = InferenceService()
+
+if __name__ == "__main__":
+    import argparse
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Service d'inférence HTTP Eco-Sorter")
+    parser.add_argument("--host", default=SERVICE_HOST)
+    parser.add_argument("--port", type=int, default=SERVICE_PORT)
+    args = parser.parse_args()
+
+    # Un seul process : les modèles ne sont chargés qu'une fois ; le parallélisme
+    # vient du pool de threads (SERVICE_WORKERS) et des micro-lots vision.
+    uvicorn.run(app, host=args.host, port=args.port, workers=1)
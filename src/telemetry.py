@@ -0,0 +1,246 @@
+import atexit
+import contextvars
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+from config import TELEMETRY_EXPORTER, TELEMETRY_FILE, TELEMETRY_SERVICE_NAME, TELEMETRY_METRICS_INTERVAL_MS
+
+# --- TÉLÉMÉTRIE PAR ÉTAPE (OpenTelemetry) ---
+# Quand une réponse est lente, on veut savoir si c'est l'embedding, le filtre
+# Chroma, l'assemblage du prompt, l'appel Mistral ou YOLO. Chaque étape ouvre
+# un span et alimente l'histogramme "eco_sorter.stage.duration" (ms) avec les
+# attributs stage / region / cache_hit ; les durées de la requête en cours sont
+# aussi renvoyées dans metrics["timings_ms"].
+# Étapes : cache, embed, retrieve, format, llm, vision_cache, vision
+
+EXPORTERS = ("none", "console", "file", "otlp")
+
+_state = None
+_state_lock = threading.Lock()
+
+# Requête en cours : durées cumulées par étape + attributs communs (région...)
+_current_timings = contextvars.ContextVar("eco_sorter_timings", default=None)
+_current_attributes = contextvars.ContextVar("eco_sorter_attributes", default={})
+
+def _json_lines(item):
+    return item.to_json(indent=None) + "\n"
+
+def _setup():
+    """
+    Crée traceur et histogramme selon TELEMETRY_EXPORTER (None, None si "none").
+    """
+    if TELEMETRY_EXPORTER not in EXPORTERS:
+        raise ValueError(f"Exporteur de télémétrie inconnu : {TELEMETRY_EXPORTER!r} (attendu : {', '.join(EXPORTERS)})")
+    if TELEMETRY_EXPORTER == "none":
+        return {"tracer": None, "histogram": None}
+
+    from opentelemetry.sdk.metrics import MeterProvider
+    from opentelemetry.sdk.metrics.export import PeriodicExportingMetricReader
+    from opentelemetry.sdk.resources import Resource
+    from opentelemetry.sdk.trace import TracerProvider
+    from opentelemetry.sdk.trace.export import BatchSpanProcessor
+
+    out = None  # fichier de l'exporteur "file"
+    if TELEMETRY_EXPORTER == "otlp":
+        from opentelemetry.exporter.otlp.proto.grpc.metric_exporter import OTLPMetricExporter
+        from opentelemetry.exporter.otlp.proto.grpc.trace_exporter import OTLPSpanExporter
+        span_exporter = OTLPSpanExporter()
+        metric_exporter = OTLPMetricExporter()
+    else:
+        # Console ou fichier : aucun collecteur nécessaire
+        from opentelemetry.sdk.metrics.export import ConsoleMetricExporter
+        from opentelemetry.sdk.trace.export import ConsoleSpanExporter
+        if TELEMETRY_EXPORTER == "file":
+            os.makedirs(os.path.dirname(TELEMETRY_FILE), exist_ok=True)
+            out = open(TELEMETRY_FILE, "a", encoding="utf-8")
+            span_exporter = ConsoleSpanExporter(out=out, formatter=_json_lines)
+            metric_exporter = ConsoleMetricExporter(out=out, formatter=_json_lines)
+        else:
+            span_exporter = ConsoleSpanExporter()
+            metric_exporter = ConsoleMetricExporter()
+
+    resource = Resource.create({"service.name": TELEMETRY_SERVICE_NAME})
+    # Arrêt géré par shutdown() (atexit) : vidage des spans et métriques, puis fermeture du fichier
+    tracer_provider = TracerProvider(resource=resource, shutdown_on_exit=False)
+    tracer_provider.add_span_processor(BatchSpanProcessor(span_exporter))
+    meter_provider = MeterProvider(
+        resource=resource,
+        metric_readers=[PeriodicExportingMetricReader(metric_exporter, export_interval_millis=TELEMETRY_METRICS_INTERVAL_MS)],
+        shutdown_on_exit=False
+    )
+    histogram = meter_provider.get_meter("eco_sorter").create_histogram(
+        "eco_sorter.stage.duration", unit="ms", description="Durée d'une étape du pipeline"
+    )
+    atexit.register(shutdown)
+    return {
+        "tracer": tracer_provider.get_tracer("eco_sorter"),
+        "histogram": histogram,
+        "providers": (tracer_provider, meter_provider),
+        "out": out
+    }
+
+def _telemetry():
+    global _state
+    if _state is None:
+        with _state_lock:
+            if _state is None:
+                _state = _setup()
+    return _state
+
+def shutdown():
+    """
+    Exporte les derniers spans et métriques puis ferme le fichier de télémétrie
+    (appelé à la sortie du process).
+    """
+    global _state
+    with _state_lock:
+        # Les étapes mesurées après l'arrêt ne sont plus exportées
+        state, _state = _state, {"tracer": None, "histogram": None}
+    if not state or state["tracer"] is None:
+        return
+    for provider in state["providers"]:
+        provider.shutdown()
+    if state["out"] is not None:
+        state["out"].close()
+
+def _clean(attributes):
+    # OpenTelemetry n'accepte pas None comme valeur d'attribut
+    return {key: value for key, value in attributes.items() if value is not None}
+
+def record_stage(name, duration_ms, attributes=None):
+    """
+    Enregistre la durée d'une étape : histogramme + durées de la requête en cours.
+    """
+    timings = _current_timings.get()
+    if timings is not None:
+        timings[name] = round(timings.get(name, 0.0) + duration_ms, 1)
+    histogram = _telemetry()["histogram"]
+    if histogram is not None:
+        histogram.record(duration_ms, _clean({**_current_attributes.get(), **(attributes or {}), "stage": name}))
+
+class StageTimer:
+    """
+    Mesure d'une étape en cours (span non attaché au contexte, voir start_stage).
+    """
+    def __init__(self, name, attributes, span=None):
+        self.name = name
+        self.attributes = attributes
+        self.span = span
+        self.start = time.perf_counter()
+
+    def set_attribute(self, key, value):
+        self.attributes[key] = value
+        if self.span is not None and value is not None:
+            self.span.set_attribute(key, value)
+
+    def end(self, error=None):
+        duration_ms = (time.perf_counter() - self.start) * 1000
+        if self.span is not None:
+            if error is not None:
+                from opentelemetry.trace import Status, StatusCode
+                self.span.record_exception(error)
+                self.span.set_status(Status(StatusCode.ERROR, str(error)))
+            self.span.end()
+        record_stage(self.name, duration_ms, self.attributes)
+        return duration_ms
+
+def start_stage(name, **attributes):
+    """
+    Démarre une étape terminée plus tard par .end() (ex : callbacks LangChain).
+    """
+    attributes = {**_current_attributes.get(), **_clean(attributes)}
+    tracer = _telemetry()["tracer"]
+    span = tracer.start_span(f"eco_sorter.{name}", attributes=_clean(attributes)) if tracer is not None else None
+    return StageTimer(name, attributes, span)
+
+@contextmanager
+def stage(name, **attributes):
+    """
+    Mesure le bloc `with` comme une étape (span courant : les étapes imbriquées en sont les enfants).
+    """
+    timer = start_stage(name, **attributes)
+    if timer.span is None:
+        try:
+            yield timer
+        finally:
+            timer.end()
+        return
+
+    from opentelemetry import trace
+    error = None
+    try:
+        with trace.use_span(timer.span, end_on_exit=False, record_exception=False, set_status_on_exception=False):
+            yield timer
+    except Exception as e:
+        error = e
+        raise
+    finally:
+        timer.end(error)
+
+@contextmanager
+def trace_request(name, **attributes):
+    """
+    Span racine d'une requête : les étapes mesurées dans le bloc héritent de
+    `attributes` (ex : region) et leurs durées sont cumulées dans timer.timings.
+    """
+    timings = {}
+    timings_token = _current_timings.set(timings)
+    attributes_token = _current_attributes.set({**_current_attributes.get(), **_clean(attributes)})
+    try:
+        with stage(name) as timer:
+            timer.timings = timings
+            yield timer
+    finally:
+        _current_attributes.reset(attributes_token)
+        _current_timings.reset(timings_token)
+        # La durée totale n'est pas une étape : on ne la garde que dans le span / l'histogramme
+        timings.pop(name, None)
+
+class StageCallbackHandler(BaseCallbackHandler):
+    """
+    Étapes "retrieve" et "llm" mesurées via les callbacks LangChain :
+    fonctionne pour invoke, stream, ainvoke et abatch sans toucher aux chaînes.
+    """
+    run_inline = True  # callbacks exécutés dans le contexte de la requête (durées par requête)
+
+    def __init__(self):
+        self._runs = {}
+        self._lock = threading.Lock()
+
+    def _start(self, run_id, name, metadata):
+        timer = start_stage(name, region=(metadata or {}).get("region"))
+        with self._lock:
+            self._runs[run_id] = timer
+
+    def _end(self, run_id, error=None):
+        with self._lock:
+            timer = self._runs.pop(run_id, None)
+        if timer is not None:
+            timer.end(error)
+
+    def on_retriever_start(self, serialized, query, *, run_id, metadata=None, **kwargs):
+        self._start(run_id, "retrieve", metadata)
+
+    def on_retriever_end(self, documents, *, run_id, **kwargs):
+        self._end(run_id)
+
+    def on_retriever_error(self, error, *, run_id, **kwargs):
+        self._end(run_id, error)
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, metadata=None, **kwargs):
+        self._start(run_id, "llm", metadata)
+
+    def on_llm_start(self, serialized, prompts, *, run_id, metadata=None, **kwargs):
+        self._start(run_id, "llm", metadata)
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        self._end(run_id)
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self._end(run_id, error)
+
+stage_callbacks = StageCallbackHandler()
@@ -0,0 +1,217 @@
+import asyncio
+import random
+import threading
+import time
+from concurrent.futures import Future
+
+# --- LIMITATION DE DÉBIT (appels Mistral) ---
+
+class AsyncRateLimiter:
+    """
+    Seau à jetons (token bucket) asynchrone : au plus `rate` acquisitions par
+    seconde en moyenne, avec des rafales jusqu'à `burst`.
+    """
+    def __init__(self, rate, burst=None):
+        if rate <= 0:
+            raise ValueError("rate doit être > 0 (requêtes par seconde)")
+        self.rate = float(rate)
+        self.capacity = float(burst) if burst else max(1.0, self.rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self):
+        """
+        Attend qu'un jeton soit disponible puis le consomme.
+        """
+        async with self._lock:
+            while True:
+                self._refill()
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+class RateLimiter:
+    """
+    Seau à jetons partagé entre threads (et utilisable depuis asyncio) :
+    chaque appel réserve un jeton et attend son tour, sans verrou pendant l'attente.
+    """
+    def __init__(self, rate, burst=None):
+        if rate <= 0:
+            raise ValueError("rate doit être > 0 (requêtes par seconde)")
+        self.rate = float(rate)
+        self.capacity = float(burst) if burst else max(1.0, self.rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+        self.stats = {"acquired": 0, "throttled": 0, "waited_s": 0.0}
+
+    def _reserve(self):
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            delay = max(0.0, -self._tokens / self.rate)
+            self.stats["acquired"] += 1
+            if delay:
+                self.stats["throttled"] += 1
+                self.stats["waited_s"] += delay
+            return delay
+
+    def acquire(self):
+        """
+        Bloque jusqu'à ce que le jeton réservé soit disponible. Returns: attente (s).
+        """
+        delay = self._reserve()
+        if delay:
+            time.sleep(delay)
+        return delay
+
+    async def aacquire(self):
+        delay = self._reserve()
+        if delay:
+            await asyncio.sleep(delay)
+        return delay
+
+# --- COALESCENCE DES REQUÊTES IDENTIQUES (single-flight) ---
+
+class CallInterrupted(RuntimeError):
+    """
+    L'appel partagé a été abandonné (flux fermé, tâche annulée) avant d'aboutir :
+    les appels en attente doivent le relancer eux-mêmes.
+    """
+
+class SingleFlight:
+    """
+    Une seule exécution en cours par clé : les appels identiques arrivés
+    pendant ce temps attendent le résultat (ou l'erreur) du premier.
+
+    timeout : attente max (s) d'un appel coalescé avant de lancer sa propre
+    exécution (None = pas de limite).
+    """
+    def __init__(self, timeout=None):
+        self.timeout = timeout
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.stats = {"leaders": 0, "coalesced": 0}
+
+    def begin(self, key):
+        """
+        Returns:
+            (Future, bool): le futur partagé, et True si l'appelant doit exécuter
+            l'appel (puis appeler finish), False s'il doit attendre le futur
+        """
+        with self._lock:
+            future = self._calls.get(key)
+            if future is not None:
+                self.stats["coalesced"] += 1
+                return future, False
+            future = Future()
+            self._calls[key] = future
+            self.stats["leaders"] += 1
+            return future, True
+
+    def finish(self, key, future, result=None, error=None):
+        with self._lock:
+            if self._calls.get(key) is future:
+                del self._calls[key]
+        if future.cancelled():
+            return
+        if error is not None:
+            if not isinstance(error, Exception):
+                # GeneratorExit, CancelledError, KeyboardInterrupt... : propres à l'appelant,
+                # ils ne doivent pas être relancés dans les threads en attente
+                error = CallInterrupted("flux interrompu")
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    def do(self, key, fn):
+        """
+        Returns: (résultat, True si cet appel a exécuté fn)
+        """
+        future, leader = self.begin(key)
+        if not leader:
+            try:
+                return future.result(timeout=self.timeout), False
+            except (TimeoutError, CallInterrupted):
+                # Premier appel trop lent ou abandonné : on exécute nous-mêmes
+                return fn(), True
+        try:
+            result = fn()
+        except BaseException as e:
+            self.finish(key, future, error=e)
+            raise
+        self.finish(key, future, result)
+        return result, True
+
+    async def ado(self, key, coroutine_fn):
+        future, leader = self.begin(key)
+        if not leader:
+            try:
+                # shield : un timeout ne doit pas annuler le futur partagé
+                return await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(future)), self.timeout), False
+            except (asyncio.TimeoutError, CallInterrupted):
+                return await coroutine_fn(), True
+        try:
+            result = await coroutine_fn()
+        except BaseException as e:
+            self.finish(key, future, error=e)
+            raise
+        self.finish(key, future, result)
+        return result, True
+
+# --- NOUVELLES TENTATIVES (erreurs transitoires de l'API) ---
+RETRYABLE_STATUS_CODES = {408, 409, 425, 429, 500, 502, 503, 504}
+
+def status_code(error):
+    response = getattr(error, "response", None)
+    return getattr(response, "status_code", None)
+
+def is_retryable(error):
+    """
+    Erreur transitoire (quota 429, 5xx, coupure réseau, timeout) : on peut réessayer.
+    """
+    import httpx
+
+    if isinstance(error, (httpx.TimeoutException, httpx.TransportError)):
+        return True
+    if isinstance(error, httpx.HTTPStatusError):
+        return status_code(error) in RETRYABLE_STATUS_CODES
+    return False
+
+def is_rate_limited(error):
+    return status_code(error) == 429
+
+def _log_retry(retry_state):
+    error = retry_state.outcome.exception()
+    print(f"🔁 Tentative {retry_state.attempt_number} échouée ({error}), "
+          f"nouvel essai dans {retry_state.next_action.sleep:.1f} s")
+
+def retrying(attempts=3, base_seconds=0.5, max_seconds=8.0, asynchronous=False):
+    """
+    Politique tenacity : backoff exponentiel à gigue complète
+    (attente tirée dans [0, min(max, base * 2^n)]), erreurs transitoires seulement.
+    """
+    from tenacity import AsyncRetrying, Retrying, retry_if_exception, stop_after_attempt, wait_random_exponential
+
+    return (AsyncRetrying if asynchronous else Retrying)(
+        retry=retry_if_exception(is_retryable),
+        wait=wait_random_exponential(multiplier=base_seconds, max=max_seconds),
+        stop=stop_after_attempt(attempts),
+        before_sleep=_log_retry,
+        reraise=True
+    )
+
+def backoff_delay(attempt, base_seconds=0.5, max_seconds=8.0):
+    """
+    Même attente que retrying() pour la n-ième tentative (boucles manuelles, ex : streaming).
+    """
+    return random.uniform(0, min(max_seconds, base_seconds * 2 ** attempt))
@@ -0,0 +1,309 @@
+import argparse
+import json
+import math
+import time
+from pathlib import Path
+
+from config import VIDEO_TARGET_FPS, VIDEO_MIN_HITS, VIDEO_MAX_MISSED, VIDEO_IOU_THRESHOLD
+
+# --- MODE FLUX VIDÉO (borne de tri avec caméra) ---
+# Pipeline de générateurs : source d'images -> saut adaptatif -> YOLO -> suivi.
+#   1. frame_source / replay_images produisent (index, horodatage, image BGR)
+#   2. AdaptiveFrameSkipper ne garde qu'assez d'images pour tenir VIDEO_TARGET_FPS
+#      sur CPU (si YOLO est plus lent que la cible, le pas augmente)
+#   3. IoUTracker associe les boîtes d'une image à l'autre : chaque objet n'est
+#      classé qu'une fois, et un événement n'est émis que lorsqu'un NOUVEL objet
+#      est stable (vu sur VIDEO_MIN_HITS images traitées)
+#
+#   python video_stream.py --source 0                   (caméra)
+#   python video_stream.py --source video.mp4
+#   python video_stream.py --replay ../data/test_images (mesure du FPS soutenu)
+
+PROJECT_ROOT = Path(__file__).parent.parent
+TEST_IMAGES_DIR = PROJECT_ROOT / "data" / "test_images"
+
+# --- SOURCES D'IMAGES ---
+def frame_source(source):
+    """
+    Images d'une vidéo (chemin) ou d'une caméra (index entier), au format BGR d'OpenCV
+    (celui qu'attend ultralytics pour un array numpy).
+
+    Yields:
+        (index, horodatage en secondes, image)
+    """
+    import cv2
+
+    capture = cv2.VideoCapture(int(source) if str(source).isdigit() else str(source))
+    if not capture.isOpened():
+        raise FileNotFoundError(f"Source vidéo illisible : {source}")
+    live = str(source).isdigit()
+    start = time.perf_counter()
+    index = 0
+    try:
+        while True:
+            ok, frame = capture.read()
+            if not ok:
+                return
+            timestamp = time.perf_counter() - start if live else capture.get(cv2.CAP_PROP_POS_MSEC) / 1000
+            yield index, timestamp, frame
+            index += 1
+    finally:
+        capture.release()
+
+def source_fps(source, default=30.0):
+    """
+    Cadence native de la source (images/s), `default` si inconnue (certaines caméras).
+    """
+    import cv2
+
+    capture = cv2.VideoCapture(int(source) if str(source).isdigit() else str(source))
+    fps = capture.get(cv2.CAP_PROP_FPS)
+    capture.release()
+    return fps if fps and fps > 0 else default
+
+def replay_images(paths, frames_per_image=30, fps=30.0, size=(640, 480)):
+    """
+    Rejoue des photos comme une vidéo : chaque image est tenue `frames_per_image`
+    images, redimensionnée à `size` (même taille pour toute la séquence).
+    """
+    import cv2
+
+    index = 0
+    for path in paths:
+        frame = cv2.imread(str(path))
+        if frame is None:
+            continue
+        frame = cv2.resize(frame, size)
+        for _ in range(frames_per_image):
+            yield index, index / fps, frame
+            index += 1
+
+# --- SAUT D'IMAGES ADAPTATIF ---
+class AdaptiveFrameSkipper:
+    """
+    Décide quelles images passer dans YOLO pour tenir `target_fps`.
+
+    Le pas (1 image traitée toutes les `stride`) découle de la cadence de la
+    source et de la latence d'inférence mesurée (moyenne mobile exponentielle) :
+    on ne traite jamais plus vite que la cible, ni plus vite que YOLO ne peut suivre.
+    """
+    def __init__(self, target_fps=VIDEO_TARGET_FPS, source_fps=30.0, smoothing=0.2):
+        self.target_fps = target_fps
+        self.source_fps = source_fps
+        self.smoothing = smoothing
+        self.latency_s = None
+        self._last_index = None
+
+    @property
+    def stride(self):
+        achievable_fps = self.target_fps
+        if self.latency_s:
+            achievable_fps = min(achievable_fps, 1.0 / self.latency_s)
+        return max(1, math.ceil(self.source_fps / achievable_fps))
+
+    def should_process(self, index):
+        return self._last_index is None or index - self._last_index >= self.stride
+
+    def record(self, index, latency_s):
+        self._last_index = index
+        if self.latency_s is None:
+            self.latency_s = latency_s
+        else:
+            self.latency_s += self.smoothing * (latency_s - self.latency_s)
+
+# --- SUIVI D'OBJETS ---
+def iou(a, b):
+    """
+    Intersection sur union de deux boîtes [x1, y1, x2, y2].
+    """
+    x1, y1 = max(a[0], b[0]), max(a[1], b[1])
+    x2, y2 = min(a[2], b[2]), min(a[3], b[3])
+    inter = max(0.0, x2 - x1) * max(0.0, y2 - y1)
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter
+    return inter / union if union > 0 else 0.0
+
+class Track:
+    def __init__(self, track_id, detection):
+        self.track_id = track_id
+        self.box = detection["box"]
+        self.hits = 0
+        self.missed = 0
+        self.reported = False
+        self.votes = {}  # classe -> somme des confiances
+        self.update(detection)
+
+    def update(self, detection):
+        self.box = detection["box"]
+        self.hits += 1
+        self.missed = 0
+        self.votes[detection["class_name"]] = self.votes.get(detection["class_name"], 0.0) + detection["confidence"]
+
+    @property
+    def class_name(self):
+        # Vote pondéré sur toutes les images : une erreur ponctuelle ne change pas la classe
+        return max(self.votes, key=self.votes.get)
+
+    @property
+    def confidence(self):
+        return self.votes[self.class_name] / self.hits
+
+class IoUTracker:
+    """
+    Suivi glouton par IoU : chaque détection est associée à la piste dont la
+    boîte la recouvre le plus (>= iou_threshold), sinon elle ouvre une piste.
+    Une piste non revue pendant `max_missed` images traitées est abandonnée.
+    """
+    def __init__(self, iou_threshold=VIDEO_IOU_THRESHOLD, min_hits=VIDEO_MIN_HITS, max_missed=VIDEO_MAX_MISSED):
+        self.iou_threshold = iou_threshold
+        self.min_hits = min_hits
+        self.max_missed = max_missed
+        self.tracks = []
+        self._next_id = 1
+
+    def update(self, detections):
+        """
+        Returns:
+            list[Track]: pistes devenues stables à cette image (à signaler une seule fois)
+        """
+        candidates = sorted(
+            ((iou(track.box, det["box"]), t, d) for t, track in enumerate(self.tracks) for d, det in enumerate(detections)),
+            reverse=True
+        )
+        matched_tracks = set()
+        matched_detections = set()
+        for overlap, t, d in candidates:
+            if overlap < self.iou_threshold:
+                break
+            if t in matched_tracks or d in matched_detections:
+                continue
+            self.tracks[t].update(detections[d])
+            matched_tracks.add(t)
+            matched_detections.add(d)
+
+        for t, track in enumerate(self.tracks):
+            if t not in matched_tracks:
+                track.missed += 1
+        self.tracks = [track for track in self.tracks if track.missed <= self.max_missed]
+
+        for d, det in enumerate(detections):
+            if d not in matched_detections:
+                self.tracks.append(Track(self._next_id, det))
+                self._next_id += 1
+
+        stable = [track for track in self.tracks if not track.reported and track.hits >= self.min_hits]
+        for track in stable:
+            track.reported = True
+        return stable
+
+# --- PIPELINE ---
+class VideoSorter:
+    """
+    Consomme un flux (index, horodatage, image) et produit un événement par
+    nouvel objet stable : {'track_id', 'class_name', 'class_name_fr',
+    'confidence', 'box', 'frame', 'timestamp'}.
+    Les compteurs de débit sont dans .stats (voir summary()).
+    """
+    def __init__(self, model=None, target_fps=VIDEO_TARGET_FPS, source_fps=30.0,
+                 conf_threshold=0.5, tracker=None):
+        if model is None:
+            from vision_model import get_model
+            model = get_model()
+        self.model = model
+        self.conf_threshold = conf_threshold
+        self.skipper = AdaptiveFrameSkipper(target_fps, source_fps)
+        self.tracker = tracker or IoUTracker()
+        self.stats = {"frames_read": 0, "frames_processed": 0, "events": 0, "inference_s": 0.0, "elapsed_s": 0.0}
+
+    def run(self, frames):
+        from vision_model import CLASS_NAMES_FR
+
+        start = time.perf_counter()
+        try:
+            for index, timestamp, frame in frames:
+                self.stats["frames_read"] += 1
+                if not self.skipper.should_process(index):
+                    continue
+
+                inference_start = time.perf_counter()
+                detections = self.model.detect_batch([frame], self.conf_threshold)[0]
+                latency = time.perf_counter() - inference_start
+                self.skipper.record(index, latency)
+                self.stats["frames_processed"] += 1
+                self.stats["inference_s"] += latency
+
+                for track in self.tracker.update(detections):
+                    self.stats["events"] += 1
+                    yield {
+                        "track_id": track.track_id,
+                        "class_name": track.class_name,
+                        "class_name_fr": CLASS_NAMES_FR.get(track.class_name, track.class_name.lower()),
+                        "confidence": round(track.confidence, 4),
+                        "box": track.box,
+                        "frame": index,
+                        "timestamp": round(timestamp, 3)
+                    }
+        finally:
+            self.stats["elapsed_s"] += time.perf_counter() - start
+
+    def summary(self):
+        """
+        Débit mesuré : images lues/s (FPS soutenu sur la source) et images traitées/s.
+        """
+        elapsed = self.stats["elapsed_s"] or float("nan")
+        processed = self.stats["frames_processed"]
+        return {
+            **{key: round(value, 3) if isinstance(value, float) else value for key, value in self.stats.items()},
+            "sustained_fps": round(self.stats["frames_read"] / elapsed, 2),
+            "processed_fps": round(processed / elapsed, 2),
+            "inference_ms": round(1000 * self.stats["inference_s"] / processed, 1) if processed else None,
+            "final_stride": self.skipper.stride
+        }
+
+def replay_benchmark(images_dir=TEST_IMAGES_DIR, frames_per_image=30, target_fps=VIDEO_TARGET_FPS,
+                     size=(640, 480), model=None, realtime=False):
+    """
+    Rejoue data/test_images comme une vidéo 30 FPS et mesure le FPS soutenu.
+    realtime=True : les images arrivent au rythme de la source (comme une caméra),
+    sinon aussi vite que le pipeline les consomme.
+    """
+    paths = sorted(p for p in Path(images_dir).iterdir() if p.suffix.lower() in (".jpg", ".jpeg", ".png"))
+    frames = replay_images(paths, frames_per_image, fps=30.0, size=size)
+    if realtime:
+        frames = _paced(frames, 30.0)
+    sorter = VideoSorter(model=model, target_fps=target_fps, source_fps=30.0)
+    events = list(sorter.run(frames))
+    return {"images": len(paths), "frames_per_image": frames_per_image, "target_fps": target_fps,
+            "events": events, **sorter.summary()}
+
+def _paced(frames, fps):
+    start = time.perf_counter()
+    for index, timestamp, frame in frames:
+        delay = start + index / fps - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        yield index, timestamp, frame
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Tri en continu depuis une vidéo ou une caméra")
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument("--source", help="Fichier vidéo ou index de caméra (0, 1...)")
+    group.add_argument("--replay", nargs="?", const=str(TEST_IMAGES_DIR), help="Rejoue un dossier d'images comme une vidéo")
+    parser.add_argument("--target-fps", type=float, default=VIDEO_TARGET_FPS)
+    parser.add_argument("--frames-per-image", type=int, default=30)
+    parser.add_argument("--realtime", action="store_true", help="Rejeu au rythme de la source (30 FPS)")
+    parser.add_argument("--conf", type=float, default=0.5)
+    args = parser.parse_args()
+
+    if args.source is None:
+        report = replay_benchmark(args.replay or TEST_IMAGES_DIR, args.frames_per_image, args.target_fps, realtime=args.realtime)
+        for event in report.pop("events"):
+            print(f"🆕 [{event['frame']}] objet #{event['track_id']} : {event['class_name_fr']} ({event['confidence']:.0%})")
+        print(json.dumps(report, indent=2))
+    else:
+        sorter = VideoSorter(target_fps=args.target_fps, source_fps=source_fps(args.source), conf_threshold=args.conf)
+        try:
+            for event in sorter.run(frame_source(args.source)):
+                print(f"🆕 [{event['timestamp']:.1f} s] objet #{event['track_id']} : {event['class_name_fr']} ({event['confidence']:.0%})")
+        except KeyboardInterrupt:
+            pass
+        print(json.dumps(sorter.summary(), indent=2))
@@ -1,11 +1,36 @@
-from ultralytics import YOLO
+import copy
 from pathlib import Path
 from PIL import Image
 import numpy as np
+import threading
+import time
+import xxhash
+from collections import OrderedDict
+
+from config import (
+    VISION_RUN, VISION_WEIGHTS, VISION_BACKEND, VISION_IMGSZ, VISION_THREADS,
+    VISION_CACHE_SIZE, VISION_CACHE_MODE, VISION_CACHE_MAX_DISTANCE
+)
+from telemetry import stage, trace_request
 
 # --- CONFIGURATION ---
 PROJECT_ROOT = Path(__file__).parent.parent
-MODEL_PATH = PROJECT_ROOT / 'models_training_runs' / 'eco_sorter_v5' / 'weights' / 'best.pt'
+RUNS_DIR = PROJECT_ROOT / 'models_training_runs'
+
+def weights_path(run):
+    """
+    Poids 'best.pt' d'un run d'entraînement (ex : "eco_sorter_v2").
+    """
+    return RUNS_DIR / run / 'weights' / 'best.pt'
+
+def list_runs():
+    """
+    Runs d'entraînement disponibles (dossiers de models_training_runs), triés par nom.
+    """
+    return sorted(p.name for p in RUNS_DIR.iterdir() if p.is_dir()) if RUNS_DIR.exists() else []
+
+# Profil choisi dans la configuration (VISION_WEIGHTS, sinon le run VISION_RUN)
+MODEL_PATH = Path(VISION_WEIGHTS) if VISION_WEIGHTS else weights_path(VISION_RUN)
 
 # Classes détectables par le modèle
 CLASS_NAMES = ['Cardboard', 'Garbage', 'Glass', 'Metal', 'Paper', 'Plastic', 'Trash']
@@ -21,54 +46,117 @@ CLASS_NAMES_FR = {
     'Trash': 'déchet'
 }
 
+# Backends d'inférence disponibles
+#   "torch" : poids .pt via PyTorch (comportement historique)
+#   "onnx"  : export ONNX (batch dynamique) exécuté par ONNX Runtime, plus rapide sur CPU
+BACKENDS = ("torch", "onnx")
+
 class VisionModel:
     """
     Classe pour charger et utiliser le modèle YOLO pour la classification des déchets.
+
+    Args:
+        model_path: chemin vers les poids 'best.pt'
+        backend: "torch" ou "onnx" (l'export ONNX est créé et mis en cache à côté du .pt)
+        imgsz: taille d'entrée de l'inférence (640 = taille d'entraînement)
+        threads: threads CPU de l'inférence (None = défaut du backend)
+        warmup: lance une inférence à vide au chargement (évite la latence du 1er appel)
+
+    Par défaut, le profil (poids, imgsz, backend, threads) vient de la configuration.
     """
-    def __init__(self):
-        if not MODEL_PATH.exists():
+    def __init__(self, model_path=MODEL_PATH, backend=VISION_BACKEND, imgsz=VISION_IMGSZ,
+                 threads=VISION_THREADS, warmup=True):
+        self.model_path = Path(model_path)
+        self.backend = backend
+        self.imgsz = imgsz
+        self.threads = threads
+
+        if backend not in BACKENDS:
+            raise ValueError(f"Backend vision inconnu : {backend!r} (attendu : {', '.join(BACKENDS)})")
+        if not self.model_path.exists():
             raise FileNotFoundError(
-                f"Le modèle est introuvable à : {MODEL_PATH}\n"
+                f"Le modèle est introuvable à : {self.model_path}\n"
                 f"Vérifie que le fichier 'best.pt' existe bien."
             )
         
-        print(f"Chargement du modèle depuis : {MODEL_PATH}")
-        self.model = YOLO(str(MODEL_PATH))
+        # Import ici : ultralytics/torch ne sont chargés qu'à la création du modèle
+        from ultralytics import YOLO
+
+        weights = self._export_onnx() if backend == "onnx" else self.model_path
+        print(f"Chargement du modèle depuis : {weights} (backend {backend}, imgsz {imgsz})")
+        self.model = YOLO(str(weights), task="detect")
         print("✅ Modèle chargé avec succès")
-    
-    def predict(self, image, conf_threshold=0.5):
+
+        if threads:
+            self._set_threads(weights, threads)
+        if warmup:
+            self.warmup()
+
+    def _set_threads(self, weights, threads):
         """
-        Fait une prédiction sur une image.
-        
-        Args:
-            image: Image PIL ou chemin vers une image
-            conf_threshold: Seuil de confiance minimum (0-1)
-        
-        Returns:
-            dict: {
-                'class_name': str,  # Nom de la classe en anglais
-                'class_name_fr': str,  # Nom de la classe en français
-                'confidence': float,  # Score de confiance
-                'detected': bool  # True si quelque chose a été détecté
-            }
+        Limite les threads CPU de l'inférence (profils mesurés par vision_profile.py).
         """
+        if self.backend == "torch":
+            # Réglage global du process PyTorch
+            import torch
+            torch.set_num_threads(threads)
+            return
+        # ONNX : ultralytics crée la session sans options -> on la recrée avec
+        # intra_op_num_threads (le prédicteur n'existe qu'après une 1ère inférence)
+        import onnxruntime as ort
+
+        self.model.predict(source=np.zeros((self.imgsz, self.imgsz, 3), dtype=np.uint8), imgsz=self.imgsz, verbose=False)
+        backend = self.model.predictor.model
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = threads
+        backend.session = ort.InferenceSession(str(weights), sess_options=options, providers=backend.session.get_providers())
+
+    def _export_onnx(self):
+        """
+        Exporte les poids en ONNX (une fois) et renvoie le chemin de l'export.
+        L'export est mis en cache à côté du .pt : best_<imgsz>.onnx
+        """
+        onnx_path = self.model_path.with_name(f"{self.model_path.stem}_{self.imgsz}.onnx")
+        if onnx_path.exists() and onnx_path.stat().st_mtime >= self.model_path.stat().st_mtime:
+            return onnx_path
+
+        from ultralytics import YOLO
+
+        print(f"Export ONNX de {self.model_path.name} (imgsz {self.imgsz})...")
+        exported = YOLO(str(self.model_path)).export(format="onnx", imgsz=self.imgsz, dynamic=True)
+        Path(exported).replace(onnx_path)
+        print(f"✅ Export ONNX mis en cache : {onnx_path}")
+        return onnx_path
+
+    def profile(self):
+        """
+        Profil d'inférence effectif (affiché dans les rapports de performance).
+        """
+        return {"weights": str(self.model_path), "backend": self.backend, "imgsz": self.imgsz, "threads": self.threads}
+
+    def warmup(self, runs=2):
+        """
+        Inférences à vide pour initialiser le backend (allocations, graphe ONNX).
+        """
+        start = time.perf_counter()
+        dummy = np.zeros((self.imgsz, self.imgsz, 3), dtype=np.uint8)
+        for _ in range(runs):
+            self.model.predict(source=dummy, imgsz=self.imgsz, verbose=False)
+        print(f"🔥 Warmup vision en {(time.perf_counter() - start) * 1000:.0f} ms")
+
+    @staticmethod
+    def _to_array(image):
         # Si c'est une image PIL, on la convertit en array numpy
         if isinstance(image, Image.Image):
-            image_array = np.array(image)
-        else:
-            image_array = image
-        
-        # Prédiction
-        results = self.model.predict(
-            source=image_array,
-            conf=conf_threshold,
-            verbose=False  # Pour éviter les logs dans la console
-        )
-        
+            return np.array(image)
+        return image
+
+    @staticmethod
+    def _parse_result(result):
         # Traitement du résultat
-        if len(results) > 0 and len(results[0].boxes) > 0:
+        if len(result.boxes) > 0:
             # On prend la détection avec la plus haute confiance
-            boxes = results[0].boxes
+            boxes = result.boxes
             confidences = boxes.conf.cpu().numpy()
             classes = boxes.cls.cpu().numpy().astype(int)
             
@@ -94,8 +182,218 @@ class VisionModel:
                 'detected': False
             }
 
+    @staticmethod
+    def _parse_boxes(result):
+        """
+        Toutes les boîtes du résultat : [{'class_name', 'class_name_fr', 'confidence', 'box'}].
+        """
+        boxes = result.boxes
+        if len(boxes) == 0:
+            return []
+        confidences = boxes.conf.cpu().numpy()
+        classes = boxes.cls.cpu().numpy().astype(int)
+        coordinates = boxes.xyxy.cpu().numpy()
+        return [
+            {
+                'class_name': CLASS_NAMES[cls],
+                'class_name_fr': CLASS_NAMES_FR.get(CLASS_NAMES[cls], CLASS_NAMES[cls].lower()),
+                'confidence': float(conf),
+                'box': [round(float(v), 1) for v in xyxy]
+            }
+            for conf, cls, xyxy in zip(confidences, classes, coordinates)
+        ]
+
+    @classmethod
+    def _parse_detections(cls, result):
+        """
+        Toutes les boîtes du résultat, une par classe (la plus confiante),
+        triées par confiance décroissante.
+        """
+        by_class = {}
+        for box in cls._parse_boxes(result):
+            best = by_class.get(box['class_name'])
+            if best is None:
+                by_class[box['class_name']] = best = {**box, 'count': 0}
+            elif box['confidence'] > best['confidence']:
+                best['confidence'] = box['confidence']
+                best['box'] = box['box']
+            best['count'] += 1
+
+        detections = sorted(by_class.values(), key=lambda d: d['confidence'], reverse=True)
+        return {'detections': detections, 'detected': bool(detections)}
+    
+    def predict(self, image, conf_threshold=0.5):
+        """
+        Fait une prédiction sur une image.
+        
+        Args:
+            image: Image PIL ou chemin vers une image
+            conf_threshold: Seuil de confiance minimum (0-1)
+        
+        Returns:
+            dict: {
+                'class_name': str,  # Nom de la classe en anglais
+                'class_name_fr': str,  # Nom de la classe en français
+                'confidence': float,  # Score de confiance
+                'detected': bool  # True si quelque chose a été détecté
+            }
+        """
+        return self.predict_batch([image], conf_threshold)[0]
+
+    def predict_batch(self, images, conf_threshold=0.5, batch_size=16):
+        """
+        Prédit plusieurs images : chaque lot de `batch_size` images passe
+        dans le réseau en une seule passe (forward) batchée.
+        
+        Args:
+            images: liste d'images PIL, d'arrays numpy ou de chemins
+            conf_threshold: Seuil de confiance minimum (0-1)
+            batch_size: nombre d'images par passe
+        
+        Returns:
+            list[dict]: un résultat (format predict) par image, dans l'ordre
+        """
+        return self._predict_batch(images, conf_threshold, batch_size, self._parse_result)
+
+    def predict_all(self, image, conf_threshold=0.5):
+        """
+        Mode multi-objets : toutes les détections au-dessus du seuil, dédoublonnées par classe.
+
+        Returns:
+            dict: {
+                'detections': [{'class_name', 'class_name_fr', 'confidence',
+                                'box': [x1, y1, x2, y2] (pixels), 'count'}],
+                'detected': bool
+            }
+        """
+        return self.predict_all_batch([image], conf_threshold)[0]
+
+    def predict_all_batch(self, images, conf_threshold=0.5, batch_size=16):
+        """
+        predict_all sur plusieurs images (passes batchées comme predict_batch).
+        """
+        return self._predict_batch(images, conf_threshold, batch_size, self._parse_detections)
+
+    def detect_batch(self, images, conf_threshold=0.5, batch_size=16):
+        """
+        Boîtes brutes par image, sans dédoublonnage (suivi d'objets, video_stream.py).
+
+        Returns:
+            list[list[dict]]: {'class_name', 'class_name_fr', 'confidence', 'box'} par boîte
+        """
+        return self._predict_batch(images, conf_threshold, batch_size, self._parse_boxes)
+
+    def _predict_batch(self, images, conf_threshold, batch_size, parse):
+        arrays = [self._to_array(image) for image in images]
+        predictions = []
+        for i in range(0, len(arrays), batch_size):
+            batch = arrays[i:i + batch_size]
+            with stage("vision", backend=self.backend, imgsz=self.imgsz, images=len(batch)):
+                results = self.model.predict(
+                    source=batch,
+                    conf=conf_threshold,
+                    imgsz=self.imgsz,
+                    verbose=False  # Pour éviter les logs dans la console
+                )
+                predictions.extend(parse(result) for result in results)
+        return predictions
+
+# --- CACHE DES PRÉDICTIONS ---
+class PredictionCache:
+    """
+    Cache LRU des résultats de predict, adressé par le contenu de l'image.
+
+    Modes :
+        "exact"      : hash xxh3 des pixels décodés (même image = même clé)
+        "perceptual" : en plus, un dHash 64 bits retrouve les ré-encodages
+                       quasi identiques (distance de Hamming <= max_distance)
+    """
+    def __init__(self, max_entries=256, mode="exact", max_distance=4):
+        if mode not in ("exact", "perceptual"):
+            raise ValueError(f"Mode de cache inconnu : {mode!r} (attendu : exact, perceptual)")
+        self.max_entries = max_entries
+        self.mode = mode
+        self.max_distance = max_distance
+        self._entries = OrderedDict()  # (clé pixels, seuil, mode de prédiction) -> (dhash, résultat)
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "perceptual_hits": 0, "misses": 0}
+
+    @staticmethod
+    def content_key(array):
+        array = np.ascontiguousarray(array)
+        digest = xxhash.xxh3_64_hexdigest(memoryview(array).cast("B"))
+        return f"{digest}-{'x'.join(map(str, array.shape))}-{array.dtype}"
+
+    @staticmethod
+    def perceptual_hash(array):
+        # dHash : compare chaque pixel à son voisin sur une vignette 9x8 en niveaux de gris
+        thumb = np.asarray(
+            Image.fromarray(array).convert("L").resize((9, 8), Image.Resampling.LANCZOS),
+            dtype=np.int16
+        )
+        bits = (thumb[:, 1:] > thumb[:, :-1]).flatten()
+        return int("".join("1" if b else "0" for b in bits), 2)
+
+    def get(self, array, conf_threshold, kind="best"):
+        """
+        Retourne (résultat ou None, clé) ; la clé se réutilise dans put().
+        kind : "best" (predict) ou "all" (predict_all), mis en cache séparément.
+        """
+        key = (self.content_key(array), conf_threshold, kind)
+        dhash = self.perceptual_hash(array) if self.mode == "perceptual" else None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.stats["hits"] += 1
+                return copy.deepcopy(entry[1]), (key, dhash)
+
+            if dhash is not None:
+                for other_key, (other_dhash, result) in reversed(self._entries.items()):
+                    if other_key[1:] == key[1:] and bin(dhash ^ other_dhash).count("1") <= self.max_distance:
+                        self._entries.move_to_end(other_key)
+                        self.stats["hits"] += 1
+                        self.stats["perceptual_hits"] += 1
+                        return copy.deepcopy(result), (key, dhash)
+
+            self.stats["misses"] += 1
+            return None, (key, dhash)
+
+    def put(self, cache_key, result):
+        key, dhash = cache_key
+        with self._lock:
+            # Copies profondes à l'entrée et à la sortie : la liste 'detections' et ses
+            # dicts ne sont jamais partagés entre le cache et les appelants
+            self._entries[key] = (dhash, copy.deepcopy(result))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def info(self):
+        """
+        Compteurs hits/misses + taille courante.
+        """
+        with self._lock:
+            total = self.stats["hits"] + self.stats["misses"]
+            return {
+                **self.stats,
+                "size": len(self._entries),
+                "hit_rate": self.stats["hits"] / total if total else 0.0
+            }
+
+prediction_cache = PredictionCache(
+    max_entries=VISION_CACHE_SIZE,
+    mode=VISION_CACHE_MODE,
+    max_distance=VISION_CACHE_MAX_DISTANCE
+)
+
 # Instance globale du modèle (singleton)
 _model_instance = None
+_model_lock = threading.Lock()
 
 def get_model():
     """
@@ -103,9 +401,70 @@ def get_model():
     """
     global _model_instance
     if _model_instance is None:
-        _model_instance = VisionModel()
+        with _model_lock:
+            if _model_instance is None:
+                _model_instance = VisionModel()
     return _model_instance
 
+def predict_cached(image, conf_threshold=0.5):
+    """
+    predict() avec le cache de prédictions : une image déjà vue (ré-upload,
+    rerun Streamlit) est servie sans repasser dans YOLO.
+    Le résultat porte les durées de l'appel dans 'timings_ms' (telemetry.py).
+    """
+    return _predict_cached(image, conf_threshold, "best")
+
+def predict_all_cached(image, conf_threshold=0.5):
+    """
+    predict_all() avec le cache de prédictions (mode multi-objets).
+    """
+    return _predict_cached(image, conf_threshold, "all")
+
+def _predict_cached(image, conf_threshold, kind):
+    with trace_request("predict", mode=kind) as request:
+        model_predict = get_model().predict_all if kind == "all" else get_model().predict
+        array = VisionModel._to_array(image)
+        if not isinstance(array, np.ndarray) or VISION_CACHE_SIZE <= 0:
+            result = model_predict(array, conf_threshold)
+        else:
+            with stage("vision_cache") as timer:
+                result, cache_key = prediction_cache.get(array, conf_threshold, kind)
+                timer.set_attribute("cache_hit", result is not None)
+            request.set_attribute("cache_hit", result is not None)
+            if result is None:
+                result = model_predict(array, conf_threshold)
+                prediction_cache.put(cache_key, result)
+        # Copie : les durées ne concernent que cet appel (pas le cache)
+        result = dict(result)
+        result["timings_ms"] = dict(request.timings)
+    return result
+
+def get_prediction_cache_stats():
+    """
+    Statistiques du cache de prédictions (hits, misses, taille, hit_rate).
+    """
+    return prediction_cache.info()
+
+def describe_prediction(result):
+    """
+    Texte affiché pour un résultat de predict (ex : "plastique (confiance: 87.00%)").
+    """
+    if result['detected']:
+        return f"{result['class_name_fr']} (confiance: {result['confidence']:.2%})"
+    else:
+        return "aucun déchet détecté"
+
+def describe_detections(result):
+    """
+    Texte affiché pour un résultat de predict_all (ex : "métal (91%), plastique (78%)").
+    """
+    if not result['detected']:
+        return "aucun déchet détecté"
+    return ", ".join(
+        f"{d['class_name_fr']}" + (f" x{d['count']}" if d['count'] > 1 else "") + f" ({d['confidence']:.0%})"
+        for d in result['detections']
+    )
+
 def predict_waste_type(image):
     """
     Fonction simple pour prédire le type de déchet.
@@ -117,10 +476,4 @@ def predict_waste_type(image):
     Returns:
         str: Description du déchet détecté en français
     """
-    model = get_model()
-    result = model.predict(image)
-    
-    if result['detected']:
-        return f"{result['class_name_fr']} (confiance: {result['confidence']:.2%})"
-    else:
-        return "aucun déchet détecté"
+    return describe_prediction(predict_cached(image))
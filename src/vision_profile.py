@@ -0,0 +1,248 @@
+import argparse
+import contextlib
+import csv
+import json
+import os
+import time
+from pathlib import Path
+
+from benchmark import TEST_IMAGES_DIR, git_commit, summarize, timed
+
+# --- BALAYAGE DES PROFILS D'INFÉRENCE VISION ---
+# Compare, sur CPU, chaque run entraîné (eco_sorter_v1, v2, v5...) à plusieurs
+# tailles d'entrée, backends et nombres de threads : latence (p50/p95), débit
+# (séquentiel et par lot) et exactitude sur des images étiquetées.
+# Le profil retenu se reporte dans le .env :
+#   VISION_RUN / VISION_IMGSZ / VISION_BACKEND / VISION_THREADS
+#
+#   python vision_profile.py                                 -> balayage par défaut
+#   python vision_profile.py --runs eco_sorter_v5 --imgsz 320 480 640 --backends onnx
+#   python vision_profile.py --val-dir chemin/dataset/valid  -> + images de validation YOLO
+
+LABELS_PATH = TEST_IMAGES_DIR / "labels.json"
+IMAGE_SUFFIXES = (".jpg", ".jpeg", ".png")
+
+def load_labelled_images(images_dir=TEST_IMAGES_DIR, labels_path=LABELS_PATH):
+    """
+    Images de data/test_images et leurs classes acceptées (labels.json).
+    Une image sans étiquette compte pour la latence, pas pour l'exactitude.
+
+    Returns:
+        list[(Path, set[str] | None)]
+    """
+    labels = {}
+    if labels_path and Path(labels_path).exists():
+        with open(labels_path, encoding="utf-8") as f:
+            labels = json.load(f)["images"]
+    paths = sorted(p for p in Path(images_dir).iterdir() if p.suffix.lower() in IMAGE_SUFFIXES)
+    return [(p, set(labels[p.name]) if p.name in labels else None) for p in paths]
+
+def load_yolo_validation(val_dir, limit=None):
+    """
+    Jeu de validation au format YOLO (<val_dir>/images/*.jpg + <val_dir>/labels/*.txt).
+    Classes attendues d'une image = classes de ses boîtes annotées.
+
+    Returns:
+        list[(Path, set[str])]
+    """
+    from vision_model import CLASS_NAMES
+
+    val_dir = Path(val_dir)
+    items = []
+    for image_path in sorted((val_dir / "images").iterdir()):
+        if image_path.suffix.lower() not in IMAGE_SUFFIXES:
+            continue
+        label_path = val_dir / "labels" / f"{image_path.stem}.txt"
+        if not label_path.exists():
+            continue
+        with open(label_path, encoding="utf-8") as f:
+            classes = {CLASS_NAMES[int(line.split()[0])] for line in f if line.strip()}
+        if classes:
+            items.append((image_path, classes))
+        if limit and len(items) >= limit:
+            break
+    return items
+
+def training_metrics(run):
+    """
+    Métriques de validation de la dernière époque (results.csv d'ultralytics).
+    """
+    from vision_model import RUNS_DIR
+
+    path = RUNS_DIR / run / "results.csv"
+    if not path.exists():
+        return None
+    with open(path, encoding="utf-8") as f:
+        rows = [{key.strip(): value for key, value in row.items()} for row in csv.DictReader(f)]
+    if not rows:
+        return None
+    last = rows[-1]
+    return {
+        "epochs": int(float(last["epoch"])),
+        "map50": round(float(last["metrics/mAP50(B)"]), 4),
+        "map50_95": round(float(last["metrics/mAP50-95(B)"]), 4)
+    }
+
+def accuracy(predictions, items):
+    """
+    Part des images étiquetées dont la meilleure détection est une classe acceptée.
+    """
+    labelled = [(prediction, expected) for prediction, (_, expected) in zip(predictions, items) if expected]
+    if not labelled:
+        return None
+    correct = sum(prediction["detected"] and prediction["class_name"] in expected for prediction, expected in labelled)
+    return round(correct / len(labelled), 4)
+
+def profile_once(weights, backend, imgsz, threads, datasets, repeat=3, batch_size=8, conf=0.5):
+    """
+    Mesure un profil (poids, backend, imgsz, threads).
+
+    Args:
+        datasets: {nom: [(Path, classes attendues)]} ; "test_images" sert aussi à la latence
+    """
+    from PIL import Image
+    from vision_model import VisionModel
+
+    model, load_ms = timed(VisionModel, weights, backend=backend, imgsz=imgsz, threads=threads)
+    images = {name: [Image.open(path).convert("RGB") for path, _ in items] for name, items in datasets.items()}
+    timing_images = images.get("test_images") or next(iter(images.values()))
+
+    latencies = []
+    for _ in range(repeat):
+        for image in timing_images:
+            _, ms = timed(model.predict, image, conf)
+            latencies.append(ms)
+    _, batch_ms = timed(model.predict_batch, timing_images * repeat, conf, batch_size)
+
+    scores = {}
+    for name, items in datasets.items():
+        predictions = model.predict_batch(images[name], conf, batch_size)
+        scores[name] = accuracy(predictions, items)
+
+    return {
+        **model.profile(),
+        "load_ms": round(load_ms, 1),
+        "latency_ms": summarize(latencies),
+        "throughput_ips": {
+            "sequential": round(1000 * len(latencies) / sum(latencies), 2) if latencies else 0,
+            "batch": round(1000 * len(timing_images) * repeat / batch_ms, 2) if batch_ms else 0
+        },
+        "accuracy": scores
+    }
+
+def _score(result, dataset):
+    return result["accuracy"].get(dataset)
+
+def recommend(results, dataset, max_accuracy_drop=0.0):
+    """
+    Profil le plus rapide (p50) dont l'exactitude reste à max_accuracy_drop de la meilleure.
+    """
+    measured = [r for r in results if "latency_ms" in r and _score(r, dataset) is not None]
+    if not measured:
+        measured = [r for r in results if "latency_ms" in r]
+        return min(measured, key=lambda r: r["latency_ms"]["p50"]) if measured else None
+    best_accuracy = max(_score(r, dataset) for r in measured)
+    eligible = [r for r in measured if _score(r, dataset) >= best_accuracy - max_accuracy_drop]
+    return min(eligible, key=lambda r: r["latency_ms"]["p50"])
+
+@contextlib.contextmanager
+def _restore_torch_threads():
+    # torch.set_num_threads (VisionModel threads=...) est global au process :
+    # sans remise à zéro, le profil "défaut" suivant hériterait du réglage précédent
+    import torch
+
+    original = torch.get_num_threads()
+    try:
+        yield
+    finally:
+        torch.set_num_threads(original)
+
+def sweep(runs, imgsz_values, backends, thread_values, datasets, repeat=3, batch_size=8, conf=0.5):
+    from vision_model import weights_path
+
+    results = []
+    for run in runs:
+        weights = weights_path(run)
+        if not weights.exists():
+            print(f"⏭️ {run} : poids introuvables ({weights})")
+            results.append({"run": run, "skipped": f"poids introuvables : {weights}"})
+            continue
+        metrics = training_metrics(run)
+        for backend in backends:
+            for imgsz in imgsz_values:
+                for threads in thread_values:
+                    label = f"{run} {backend} imgsz {imgsz} threads {threads or 'défaut'}"
+                    print(f"▶️ {label}")
+                    try:
+                        with _restore_torch_threads():
+                            result = profile_once(weights, backend, imgsz, threads or None, datasets, repeat, batch_size, conf)
+                    except Exception as e:
+                        print(f"❌ {label} : {e}")
+                        results.append({"run": run, "backend": backend, "imgsz": imgsz, "threads": threads, "error": str(e)})
+                        continue
+                    results.append({"run": run, "training": metrics, **result})
+    return results
+
+def print_table(results, dataset):
+    print(f"\n{'run':<15} {'backend':<7} {'imgsz':>5} {'thr':>4} {'p50 ms':>9} {'p95 ms':>9} {'img/s':>7} {'lot img/s':>9} {'exact.':>7}")
+    for r in results:
+        if "latency_ms" not in r:
+            print(f"{r['run']:<15} {r.get('skipped') or r.get('error')}")
+            continue
+        score = _score(r, dataset)
+        print(
+            f"{r['run']:<15} {r['backend']:<7} {r['imgsz']:>5} {r['threads'] or '-':>4} "
+            f"{r['latency_ms']['p50']:>9} {r['latency_ms']['p95']:>9} "
+            f"{r['throughput_ips']['sequential']:>7} {r['throughput_ips']['batch']:>9} "
+            f"{'-' if score is None else f'{score:.0%}':>7}"
+        )
+
+if __name__ == "__main__":
+    from vision_model import list_runs
+
+    parser = argparse.ArgumentParser(description="Balayage des profils d'inférence vision (runs x imgsz x backends x threads)")
+    parser.add_argument("--runs", nargs="+", default=None, help="runs de models_training_runs (défaut : tous)")
+    parser.add_argument("--imgsz", nargs="+", type=int, default=[320, 416, 512, 640])
+    parser.add_argument("--backends", nargs="+", choices=("torch", "onnx"), default=["torch", "onnx"])
+    parser.add_argument("--threads", nargs="+", type=int, default=[0], help="threads CPU (0 = défaut du backend)")
+    parser.add_argument("--images", default=str(TEST_IMAGES_DIR))
+    parser.add_argument("--labels", default=str(LABELS_PATH))
+    parser.add_argument("--val-dir", default=None, help="jeu de validation YOLO (images/ + labels/)")
+    parser.add_argument("--val-limit", type=int, default=200)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--conf", type=float, default=0.5)
+    parser.add_argument("--max-accuracy-drop", type=float, default=0.0,
+                        help="perte d'exactitude tolérée pour choisir un profil plus rapide")
+    parser.add_argument("--output", default=None, help="rapport JSON")
+    args = parser.parse_args()
+
+    datasets = {"test_images": load_labelled_images(args.images, args.labels)}
+    if args.val_dir:
+        datasets["validation"] = load_yolo_validation(args.val_dir, args.val_limit)
+    reference = "validation" if args.val_dir else "test_images"
+
+    results = sweep(args.runs or list_runs(), args.imgsz, args.backends, args.threads, datasets,
+                    args.repeat, args.batch_size, args.conf)
+    print_table(results, reference)
+
+    best = recommend(results, reference, args.max_accuracy_drop)
+    report = {
+        "commit": git_commit(),
+        "timestamp": int(time.time()),
+        "cpu_count": os.cpu_count(),
+        "datasets": {name: len(items) for name, items in datasets.items()},
+        "reference": reference,
+        "results": results,
+        "recommended": best
+    }
+    if best is not None:
+        print(f"\n✅ Profil recommandé (exactitude {reference}) :")
+        print(f"VISION_RUN={best['run']}")
+        print(f"VISION_BACKEND={best['backend']}")
+        print(f"VISION_IMGSZ={best['imgsz']}")
+        print(f"VISION_THREADS={best['threads'] or 0}")
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"Rapport écrit dans {args.output}")
@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# Les modules de src/ s'importent entre eux par leur nom (from config import ...)
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
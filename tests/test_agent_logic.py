@@ -0,0 +1,240 @@
+import threading
+import time
+import uuid
+
+import pytest
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+pytest.importorskip("langchain_chroma")
+
+import agent_logic
+import engine
+import ingestion_state
+from answer_cache import SemanticAnswerCache
+from benchmark import FakeEcoSorterChat
+from lexical_index import invalidate_region_indices
+from throttling import SingleFlight
+
+class CountingChat(FakeEcoSorterChat):
+    calls: int = 0
+    last_prompt: str = ""
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        self.calls += 1
+        self.last_prompt = self._prompt_text(messages)
+        return super()._generate(messages, stop, run_manager, **kwargs)
+
+class BrokenChat(FakeEcoSorterChat):
+    """
+    Le flux attend `release` puis échoue (erreur non transitoire : pas de nouvel essai).
+    """
+    release: threading.Event
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        self.release.wait(5)
+        raise ValueError("modèle indisponible")
+
+CHUNKS = [
+    "Les piles usagées se déposent dans les points Bebat.",
+    "Les bouteilles et flacons en plastique vont dans le sac PMC bleu.",
+    "Les bouteilles en verre vont dans les bulles à verre."
+]
+
+@pytest.fixture
+def agent(tmp_path, monkeypatch):
+    """
+    Moteur de test : base Chroma éphémère, embedder déterministe et FakeEcoSorterChat.
+    """
+    from langchain_chroma import Chroma
+
+    embedder = DeterministicFakeEmbedding(size=32)
+    store = Chroma(collection_name=f"test-{uuid.uuid4().hex}", embedding_function=embedder)
+    docs = [Document(page_content=text, metadata={"region": "bruxelles", "source": "guide_bruxelles.txt"}, id=f"c{i}")
+            for i, text in enumerate(CHUNKS)]
+    store.add_documents(docs, ids=[doc.id for doc in docs])
+
+    test_engine = engine.Engine(components={})
+    test_engine.set("embedder", embedder)
+    test_engine.set("vector_db", store)
+    test_engine.set("llm", CountingChat(token_latency_ms=20))
+    monkeypatch.setattr(engine, "_engine", test_engine)
+    monkeypatch.setattr(ingestion_state, "REGION_VERSIONS_FILE", str(tmp_path / "region_versions.json"))
+    monkeypatch.setattr(agent_logic, "get_threshold", lambda region: None)
+    monkeypatch.setattr(agent_logic, "ANSWER_CACHE_ENABLED", False)
+    monkeypatch.setattr(agent_logic, "_inflight", SingleFlight(timeout=5))
+    agent_logic.invalidate_rag_chains()
+    invalidate_region_indices()
+    yield test_engine
+    agent_logic.invalidate_rag_chains()
+    invalidate_region_indices()
+    store.delete_collection()
+
+@pytest.fixture
+def answer_cache(agent, monkeypatch):
+    """
+    Cache sémantique en mémoire (sans persistance), lié aux versions de guide du test.
+    """
+    cache = SemanticAnswerCache(agent.embedding_function, version_fn=ingestion_state.get_region_version)
+    monkeypatch.setattr(agent_logic, "ANSWER_CACHE_ENABLED", True)
+    monkeypatch.setattr(agent_logic, "_answer_cache", cache)
+    return cache
+
+def _wait_for(condition, seconds=5):
+    deadline = time.monotonic() + seconds
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.005)
+    assert condition()
+
+# --- Cache des réponses (_cached_response) ---
+def test_cache_hit_skips_retrieval_and_llm(agent, answer_cache):
+    first = agent_logic.ask_agent("Où jeter mes piles ?", region="bruxelles")
+    second = agent_logic.ask_agent("où JETER mes piles", region="bruxelles")
+
+    assert agent.llm.calls == 1
+    assert second["answer"] == first["answer"]
+    assert first["metrics"]["cache_hit"] is False
+    metrics = second["metrics"]
+    assert metrics["cache_hit"] is True
+    assert metrics["cache_similarity"] == 1.0
+    assert (metrics["input_tokens"], metrics["output_tokens"], metrics["total_tokens"]) == (0, 0, 0)
+    # Court-circuit : ni contexte reconstruit, ni étape retrieve / llm mesurée
+    assert "context_tokens" not in metrics and "context_tokens_saved" not in metrics
+    assert set(metrics["timings_ms"]) == {"cache"}
+    # Les métriques stockées ne sont pas modifiées par la réponse en cache
+    assert agent_logic.ask_agent("Où jeter mes piles ?", region="bruxelles")["metrics"]["cache_hit"] is True
+    assert answer_cache.get("bruxelles", "Où jeter mes piles ?")["metrics"]["total_tokens"] == first["metrics"]["total_tokens"]
+
+def test_cache_hit_in_a_stream_and_a_batch(agent, answer_cache):
+    agent_logic.ask_agent("Où jeter mes piles ?", region="bruxelles")
+
+    stream = agent_logic.stream_agent("Où jeter mes piles ?", region="bruxelles")
+    chunks = list(stream)
+    results = agent_logic.ask_agent_batch([("Où jeter mes piles ?", "bruxelles")] * 2)
+
+    assert agent.llm.calls == 1
+    assert chunks == [stream.result["answer"]]
+    assert stream.result["metrics"]["cache_hit"] and stream.result["metrics"]["ttft_ms"] is not None
+    assert [r["metrics"]["cache_hit"] for r in results] == [True, True]
+    assert [r["metrics"]["total_tokens"] for r in results] == [0, 0]
+
+def test_out_of_scope_answers_are_not_cached(agent, answer_cache, monkeypatch):
+    monkeypatch.setattr(agent_logic, "get_threshold", lambda region: 1.01)
+    agent_logic.invalidate_rag_chains()
+    response = agent_logic.ask_agent("Où jeter mon smartphone ?", region="bruxelles")
+
+    assert response["metrics"]["out_of_scope"]
+    assert agent.llm.calls == 0
+    assert answer_cache.get("bruxelles", "Où jeter mon smartphone ?") is None
+
+# --- Coalescence des flux (AgentStream) ---
+def test_abandoned_leader_stream_does_not_break_its_follower(agent):
+    question = "Où jeter mes piles ?"
+    leader = iter(agent_logic.stream_agent(question, region="bruxelles"))
+    assert next(leader)  # le premier flux est en cours de génération
+
+    follower = agent_logic.stream_agent(question, region="bruxelles")
+    chunks = []
+    thread = threading.Thread(target=lambda: chunks.extend(follower))
+    thread.start()
+    _wait_for(lambda: agent_logic._inflight.stats["coalesced"] == 1)
+
+    # L'utilisateur ferme la page : GeneratorExit dans le flux qui génère
+    leader.close()
+    thread.join(10)
+
+    assert not thread.is_alive()
+    assert follower.result["error"] is None
+    # Le flux en attente a relancé la génération lui-même
+    assert "".join(chunks) == follower.result["answer"]
+    assert follower.result["answer"].startswith("D'après le guide")
+    assert not follower.result["metrics"].get("coalesced")
+    assert follower.result["metrics"]["total_tokens"] > 0
+    assert agent_logic._inflight._calls == {}
+
+def _start_stream(question, chunks):
+    stream = agent_logic.stream_agent(question, region="bruxelles")
+    thread = threading.Thread(target=lambda: chunks.extend(stream))
+    thread.start()
+    return stream, thread
+
+def test_identical_streams_share_one_generation(agent):
+    question = "Où jeter mes piles ?"
+    leader_chunks, follower_chunks = [], []
+    leader, leader_thread = _start_stream(question, leader_chunks)
+    _wait_for(lambda: leader_chunks)  # génération en cours
+    follower, follower_thread = _start_stream("où jeter MES piles", follower_chunks)
+    for thread in (leader_thread, follower_thread):
+        thread.join(10)
+
+    assert agent_logic._inflight.stats == {"leaders": 1, "coalesced": 1}
+    assert len(leader_chunks) > 1 and follower_chunks == [leader.result["answer"]]
+    assert follower.result["answer"] == leader.result["answer"]
+    assert follower.result["metrics"]["coalesced"]
+    assert follower.result["metrics"]["total_tokens"] == 0
+    assert leader.result["metrics"]["total_tokens"] > 0
+    assert "coalesced" not in leader.result["metrics"]
+
+def test_leader_stream_error_is_shared_with_its_follower(agent):
+    release = threading.Event()
+    agent.set("llm", BrokenChat(release=release))
+    agent_logic.invalidate_rag_chains()
+    question = "Où jeter mes piles ?"
+    leader, leader_thread = _start_stream(question, [])
+    _wait_for(lambda: agent_logic._inflight.stats["leaders"] == 1)
+    follower, follower_thread = _start_stream(question, [])
+    _wait_for(lambda: agent_logic._inflight.stats["coalesced"] == 1)
+    release.set()
+    for thread in (leader_thread, follower_thread):
+        thread.join(10)
+
+    # Erreur du modèle (pas une interruption) : pas de nouvel appel, même réponse d'erreur
+    assert leader.result["error"] == follower.result["error"] == "modèle indisponible"
+    assert follower.result["answer"] == "Désolé, une erreur technique est survenue."
+    assert agent_logic._inflight._calls == {}
+
+# --- Lots (aask_agent_batch) ---
+def test_batch_answers_duplicate_questions_once(agent):
+    results = agent_logic.ask_agent_batch([
+        ("Où jeter mes piles ?", "bruxelles"),
+        ("Où jeter une bouteille en verre ?", "bruxelles"),
+        ("où JETER mes piles", "bruxelles")
+    ])
+
+    assert agent.llm.calls == 2
+    assert [r["error"] for r in results] == [None, None, None]
+    assert results[2]["answer"] == results[0]["answer"]
+    assert results[0]["metrics"]["total_tokens"] > 0
+    assert results[2]["metrics"]["total_tokens"] == 0
+    assert results[2]["metrics"]["coalesced"]
+
+# --- Mode multi-objets (ask_agent_multi) ---
+def test_multi_answers_every_object_with_one_llm_call(agent):
+    response = agent_logic.ask_agent_multi(["piles", "verre", "plastique", "piles"], region="bruxelles")
+
+    assert response["error"] is None
+    assert agent.llm.calls == 1
+    assert response["metrics"]["objects"] == 3
+    assert response["metrics"]["total_tokens"] > 0
+    # Contexte commun : le meilleur morceau de chaque objet est envoyé
+    for text in CHUNKS:
+        assert text in agent.llm.last_prompt
+    assert "piles, verre, plastique" in agent.llm.last_prompt
+
+def test_multi_out_of_scope_skips_the_llm(agent, monkeypatch):
+    monkeypatch.setattr(agent_logic, "get_threshold", lambda region: 1.01)
+    response = agent_logic.ask_agent_multi(["smartphone", "trottinette"], region="bruxelles")
+
+    assert agent.llm.calls == 0
+    assert response["answer"] == agent_logic.FALLBACK_ANSWER.format(region_name="bruxelles")
+    assert response["metrics"]["out_of_scope"]
+    assert response["metrics"]["objects"] == 2
+    assert response["metrics"]["total_tokens"] == 0
+
+def test_multi_with_a_single_object_is_a_plain_question(agent):
+    response = agent_logic.ask_agent_multi(["piles", "piles"], region="bruxelles")
+
+    assert response["error"] is None
+    assert agent.llm.calls == 1
+    assert "objects" not in response["metrics"]
+    assert "QUESTION DE L'UTILISATEUR" in agent.llm.last_prompt
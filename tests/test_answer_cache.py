@@ -0,0 +1,157 @@
+import numpy as np
+import pytest
+
+import answer_cache
+from answer_cache import SemanticAnswerCache, normalize_question
+
+class WordEmbeddings:
+    """
+    Embedder déterministe pour les tests : sac de mots sur un petit vocabulaire.
+    """
+    VOCABULARY = ["ou", "jeter", "piles", "pile", "usagees", "bouteille", "verre", "javel", "sac", "banane"]
+
+    def __init__(self):
+        self.calls = 0
+
+    def _vector(self, text):
+        words = text.split()
+        return [float(words.count(word)) for word in self.VOCABULARY] + [0.01]
+
+    def embed_query(self, text):
+        self.calls += 1
+        return self._vector(text)
+
+    def embed_documents(self, texts):
+        self.calls += 1
+        return [self._vector(text) for text in texts]
+
+def _cache(**kwargs):
+    return SemanticAnswerCache(WordEmbeddings(), **kwargs)
+
+@pytest.mark.parametrize("question, expected", [
+    ("Où jeter mes PILES ?", "ou jeter mes piles"),
+    ("  Bouteille   de Javel!!", "bouteille de javel"),
+    ("Sac bleu, sac blanc... ou sac jaune ?", "sac bleu sac blanc ou sac jaune"),
+    ("Épluchures d'œufs", "epluchures d œufs")
+])
+def test_normalize_question(question, expected):
+    assert normalize_question(question) == expected
+
+def test_exact_hit_after_normalization():
+    cache = _cache()
+    cache.put("bruxelles", "Où jeter mes piles ?", "Au point Bebat.", {"total_tokens": 120})
+    hit = cache.get("bruxelles", "où JETER mes piles")
+    assert hit["answer"] == "Au point Bebat."
+    assert hit["similarity"] == 1.0
+    assert hit["metrics"] == {"total_tokens": 120}
+    assert cache.stats["hits"] == 1
+
+def test_semantic_hit_and_threshold():
+    cache = _cache(similarity_threshold=0.9)
+    cache.put("bruxelles", "Où jeter des piles usagées ?", "Au point Bebat.", {})
+    hit = cache.get("bruxelles", "piles usagées : où jeter ?")
+    assert hit is not None and hit["matched_question"] == "ou jeter des piles usagees"
+    assert cache.stats["semantic_hits"] == 1
+    assert cache.get("bruxelles", "Où jeter une bouteille en verre ?") is None
+
+def test_regions_are_isolated():
+    cache = _cache()
+    cache.put("bruxelles", "Où jeter mes piles ?", "Bebat", {})
+    assert cache.get("liege", "Où jeter mes piles ?") is None
+
+def test_lru_eviction_per_region():
+    cache = _cache(max_entries_per_region=2, similarity_threshold=1.01)
+    cache.put("bruxelles", "piles", "a", {})
+    cache.put("bruxelles", "verre", "b", {})
+    cache.get("bruxelles", "piles")  # "piles" redevient la plus récente
+    cache.put("bruxelles", "javel", "c", {})
+    assert cache.get("bruxelles", "verre") is None
+    assert cache.get("bruxelles", "piles")["answer"] == "a"
+    assert cache.stats["evictions"] == 1
+
+def test_ttl_expiry(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(answer_cache.time, "time", lambda: now[0])
+    cache = _cache(ttl_seconds=60)
+    cache.put("bruxelles", "piles", "Bebat", {})
+    now[0] += 59
+    assert cache.get("bruxelles", "piles") is not None
+    now[0] += 2
+    assert cache.get("bruxelles", "piles") is None
+
+def test_guide_version_invalidates_entries():
+    versions = {"bruxelles": "v1"}
+    cache = _cache(version_fn=versions.get)
+    cache.put("bruxelles", "piles", "Bebat", {})
+    assert cache.get("bruxelles", "piles") is not None
+    versions["bruxelles"] = "v2"
+    assert cache.get("bruxelles", "piles") is None
+
+def test_guide_version_is_read_once_per_lookup():
+    calls = []
+
+    def version_fn(region):
+        calls.append(region)
+        return "v1"
+
+    cache = _cache(version_fn=version_fn, similarity_threshold=1.01)
+    for word in ("piles", "verre", "javel", "banane"):
+        cache.put("bruxelles", word, "réponse", {})
+    calls.clear()
+    cache.get("bruxelles", "sac")
+    assert calls == ["bruxelles"]
+
+def test_cached_metrics_are_copies():
+    cache = _cache()
+    cache.put("bruxelles", "piles", "Bebat", {"total_tokens": 10})
+    cache.get("bruxelles", "piles")["metrics"]["cache_hit"] = True
+    assert cache.get("bruxelles", "piles")["metrics"] == {"total_tokens": 10}
+
+def test_put_reuses_the_embedding_of_get():
+    cache = _cache()
+    cache.put("bruxelles", "verre", "Bulle à verre", {})
+    embedder = cache.embedding_function
+    calls = embedder.calls
+    cache.get("bruxelles", "bouteille de javel")
+    cache.put("bruxelles", "bouteille de javel", "Proxy Chimik", {})
+    assert embedder.calls == calls + 1
+
+def test_get_many_embeds_the_batch_once():
+    cache = _cache(similarity_threshold=0.9)
+    cache.put("bruxelles", "Où jeter des piles usagées ?", "Au point Bebat.", {})
+    cache.put("liege", "bouteille de javel", "Recyparc", {})
+    embedder = cache.embedding_function
+    calls = embedder.calls
+    hits = cache.get_many([
+        ("bruxelles", "où jeter des piles usagées"),  # exacte : pas d'embedding
+        ("bruxelles", "piles usagées : où jeter ?"),
+        ("bruxelles", "Où jeter une bouteille en verre ?"),
+        ("liege", "javel bouteille"),
+        ("namur", "piles")  # région vide
+    ])
+    assert embedder.calls == calls + 1
+    assert [hit and hit["answer"] for hit in hits] == ["Au point Bebat.", "Au point Bebat.", None, "Recyparc", None]
+    assert hits[0]["similarity"] == 1.0
+    assert cache.stats["semantic_hits"] == 2
+
+def test_persistence_round_trip(tmp_path):
+    path = str(tmp_path / "answer_cache.json")
+    cache = _cache(persist_path=path)
+    cache.put("bruxelles", "piles", "Bebat", {"total_tokens": 10})
+    cache.flush()
+
+    reloaded = _cache(persist_path=path)
+    hit = reloaded.get("bruxelles", "piles")
+    assert hit["answer"] == "Bebat"
+    assert np.allclose(
+        reloaded._regions["bruxelles"]["piles"]["embedding"],
+        cache._regions["bruxelles"]["piles"]["embedding"]
+    )
+
+def test_invalidate_region():
+    cache = _cache()
+    cache.put("bruxelles", "piles", "Bebat", {})
+    cache.put("liege", "piles", "Recyparc", {})
+    cache.invalidate("bruxelles")
+    assert cache.get("bruxelles", "piles") is None
+    assert cache.get("liege", "piles") is not None
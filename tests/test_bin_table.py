@@ -0,0 +1,53 @@
+import pytest
+
+import agent_logic
+import bin_table
+from vision_model import CLASS_NAMES
+
+FALLBACK = "Je n'ai pas l'information dans le guide de bruxelles."
+
+@pytest.fixture
+def table(tmp_path, monkeypatch):
+    monkeypatch.setattr(bin_table, "BIN_TABLE_FILE", str(tmp_path / "bin_table.json"))
+    monkeypatch.setattr(bin_table, "_table", {"mtime": None, "data": {}})
+    monkeypatch.setattr(bin_table, "get_region_version", lambda region: "v1")
+    calls = []
+
+    def fake_batch(items, max_concurrency=4):
+        calls.append(items)
+        results = []
+        for question, region in items:
+            if question == bin_table.CLASS_QUESTIONS["Trash"]:
+                # Filtre de pertinence : aucun morceau du guide, phrase de repli locale
+                results.append({"answer": FALLBACK, "metrics": {"out_of_scope": True}, "error": None})
+            else:
+                results.append({"answer": f"Réponse pour {region}", "metrics": {"total_tokens": 50}, "error": None})
+        return results
+
+    monkeypatch.setattr(agent_logic, "ask_agent_batch", fake_batch)
+    return calls
+
+def test_out_of_scope_answers_are_not_stored(table):
+    assert bin_table.build_bin_table(regions=["bruxelles"]) == ["bruxelles"]
+    assert bin_table.lookup_bin_answer("Glass", "bruxelles")["answer"] == "Réponse pour bruxelles"
+    # Pas de réponse figée : l'app repassera par le LLM
+    assert bin_table.lookup_bin_answer("Trash", "bruxelles") is None
+
+def test_region_with_unanswered_classes_is_up_to_date(table):
+    bin_table.build_bin_table(regions=["bruxelles"])
+    assert bin_table.stale_regions(["bruxelles"]) == []
+    assert bin_table.build_bin_table(regions=["bruxelles"]) == []
+    assert len(table) == 1
+
+def test_errors_leave_the_region_untouched(table, monkeypatch):
+    monkeypatch.setattr(agent_logic, "ask_agent_batch", lambda items, max_concurrency=4: [
+        {"answer": "Erreur technique.", "metrics": {}, "error": "429"} for _ in items
+    ])
+    assert bin_table.build_bin_table(regions=["bruxelles"]) == []
+    assert all(bin_table.lookup_bin_answer(name, "bruxelles") is None for name in CLASS_NAMES)
+
+def test_new_guide_version_makes_answers_stale(table, monkeypatch):
+    bin_table.build_bin_table(regions=["bruxelles"])
+    monkeypatch.setattr(bin_table, "get_region_version", lambda region: "v2")
+    assert bin_table.lookup_bin_answer("Glass", "bruxelles") is None
+    assert bin_table.stale_regions(["bruxelles"]) == ["bruxelles"]
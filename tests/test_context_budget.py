@@ -0,0 +1,96 @@
+import pytest
+from langchain_core.documents import Document
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+from config import CHUNK_OVERLAP, CHUNK_SIZE
+from context_budget import _merge_overlapping, _overlap, assemble_context, estimate_tokens
+
+def _doc(text, source="guide_bruxelles.txt", **metadata):
+    return Document(page_content=text, metadata={"source": source, **metadata})
+
+def _chunk(text, rank, start=None, source="guide_bruxelles.txt"):
+    return {"text": text, "source": source, "page": None, "start": start, "rank": rank}
+
+# Paragraphe plus long que CHUNK_SIZE : le splitter le coupe entre deux mots avec recouvrement
+LONG_PARAGRAPH = " ".join(
+    f"Consigne {i} : les bouteilles et flacons en plastique vont dans le sac PMC bleu, bien vidés."
+    for i in range(8)
+)
+
+def _split(text, add_start_index=True):
+    splitter = RecursiveCharacterTextSplitter(
+        chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP, add_start_index=add_start_index
+    )
+    return splitter.split_documents([_doc(text)])
+
+def test_estimate_tokens():
+    assert estimate_tokens("") == 0
+    assert estimate_tokens("a" * 7) == 2
+
+def test_exact_and_near_duplicates_are_dropped():
+    text = "Les piles usagées se déposent dans les points de collecte Bebat des magasins."
+    docs = [_doc(text), _doc(f"  {text}  "), _doc(text.replace("magasins.", "magasins !"))]
+    context, stats = assemble_context(docs)
+    assert context == text
+    assert stats["chunks_in"] == 3
+    assert stats["chunks_out"] == 1
+
+def test_scored_pairs_are_sorted_by_score():
+    context, _ = assemble_context([(_doc("moins pertinent"), 0.2), (_doc("plus pertinent"), 0.9)])
+    assert context == "plus pertinent\n\nmoins pertinent"
+
+@pytest.mark.parametrize("add_start_index", [True, False])
+def test_adjacent_splitter_chunks_are_merged(add_start_index):
+    chunks = _split(LONG_PARAGRAPH, add_start_index)
+    assert len(chunks) >= 2
+    assert _overlap(chunks[0].page_content, chunks[1].page_content) > 0
+
+    context, stats = assemble_context(list(reversed(chunks[:2])))
+    assert stats["chunks_out"] == 1
+    assert context == LONG_PARAGRAPH[:len(context)]
+    assert stats["context_tokens_saved"] > 0
+
+@pytest.mark.parametrize("add_start_index", [True, False])
+def test_unrelated_chunks_sharing_a_phrase_are_not_merged(add_start_index):
+    # Deux paragraphes d'un même guide : la fin de l'un ("vont dans le sac PMC.")
+    # est aussi le début de l'autre, sans être un recouvrement du splitter
+    first = "Les canettes et boîtes de conserve vont dans le sac PMC."
+    second = "vont dans le sac PMC. Les cartons à boissons (Tetra Pak) aussi, aplatis et bien vidés."
+    chunks = _split(f"{first}\n\nIntro du chapitre suivant, assez longue. " + "x " * 200 + f"\n\n{second}", add_start_index)
+    docs = [chunk for chunk in chunks if chunk.page_content in (first, second)]
+    assert len(docs) == 2
+
+    context, stats = assemble_context(docs)
+    assert stats["chunks_out"] == 2
+    assert context == f"{first}\n\n{second}"
+
+def test_short_shared_phrase_is_not_an_overlap():
+    assert _overlap("Déposez-le au recyparc le plus proche", "recyparc le plus proche : horaires") == 0
+    a = "début " + "mot " * 20
+    shared = "fin commune des deux morceaux voisins"
+    assert _overlap(a + shared, f"{shared} et la suite") == len(shared)
+    # Recouvrement qui ne commence pas entre deux mots : pas une coupure du splitter
+    assert _overlap(a + "x" + shared, f"{shared} et la suite") == 0
+
+def test_merge_by_position_keeps_best_rank():
+    chunks = [_chunk("abc def ghi", rank=3, start=0), _chunk("ghi jkl", rank=0, start=8)]
+    merged = _merge_overlapping(chunks)
+    assert [(c["text"], c["rank"]) for c in merged] == [("abc def ghi jkl", 0)]
+
+def test_merge_requires_same_source():
+    chunks = [_chunk("abc def ghi", rank=0, start=0), _chunk("ghi jkl", rank=1, start=8, source="autre.txt")]
+    assert len(_merge_overlapping(chunks)) == 2
+
+def test_budget_skips_a_long_chunk_but_keeps_later_ones():
+    long_chunk = "mot " * 400
+    short_chunk = "Les langes vont dans le sac blanc."
+    context, stats = assemble_context([_doc("Réponse courte au sac jaune.", source="a"), _doc(long_chunk, source="b"),
+                                       _doc(short_chunk, source="c")], max_tokens=40)
+    assert context == f"Réponse courte au sac jaune.\n\n{short_chunk}"
+    assert stats["chunks_out"] == 2
+    assert stats["context_tokens"] <= 40
+
+def test_budget_truncates_only_the_first_chunk():
+    context, stats = assemble_context([_doc("a" * 1000, source="a"), _doc("court", source="b")], max_tokens=10)
+    assert context == "a" * 35
+    assert stats["chunks_out"] == 1
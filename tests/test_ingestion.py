@@ -0,0 +1,118 @@
+import pytest
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+pytest.importorskip("langchain_chroma")
+pytest.importorskip("langchain_community")
+
+import ingestion_state
+import rag_engine
+from embeddings import embedding_signature
+from rag_engine import _plan_update, chunk_id, dedupe_chunks, region_from_filename
+
+# Trois paragraphes de plus de CHUNK_SIZE / 2 caractères : un morceau chacun
+GUIDE = "\n\n".join(paragraph + " Détails : " + "consigne " * 20 for paragraph in (
+    "Les bouteilles en plastique vont dans le sac PMC bleu.",
+    "Les bouteilles et bocaux en verre vont dans les bulles à verre.",
+    "Les piles usagées se déposent dans les points Bebat."
+))
+
+def _doc(text, region="bruxelles", source="guide_bruxelles.txt"):
+    return Document(page_content=text, metadata={"region": region, "source": source})
+
+def _entry(ids, region="bruxelles", embedding=None):
+    return {"region": region, "file_hash": "h", "chunk_ids": list(ids), "embedding": embedding or embedding_signature()}
+
+# --- Fonctions pures ---
+def test_chunk_id_depends_on_region_source_and_content():
+    assert chunk_id(_doc("a")) == chunk_id(_doc("a"))
+    assert len({chunk_id(_doc("a")), chunk_id(_doc("b")), chunk_id(_doc("a", region="liege")),
+                chunk_id(_doc("a", source="autre.txt"))}) == 4
+
+def test_dedupe_chunks_keeps_document_order():
+    ids, docs = dedupe_chunks([_doc("a"), _doc("b"), _doc("a"), _doc("c")])
+    assert [d.page_content for d in docs] == ["a", "b", "c"]
+    assert ids == [chunk_id(d) for d in docs]
+
+def test_region_from_filename():
+    assert region_from_filename("guide_bruxelles.txt") == "bruxelles"
+    assert region_from_filename("/chemin/guide_bw.pdf") == "brabant_wallon"
+
+def test_plan_update_first_ingestion():
+    assert _plan_update(None, "bruxelles", ["a", "b"]) == (False, [0, 1], [])
+
+def test_plan_update_diff():
+    reusable, new_positions, stale_ids = _plan_update(_entry(["a", "b", "c"]), "bruxelles", ["a", "c", "d"])
+    assert reusable
+    assert new_positions == [2]
+    assert stale_ids == ["b"]
+
+@pytest.mark.parametrize("entry, force", [
+    (_entry(["a"], region="liege"), False),
+    (_entry(["a"], embedding={"embedding_model": "sentence-transformers/all-MiniLM-L6-v2", "embedding_backend": "onnx-int8"}), False),
+    ({"region": "bruxelles", "file_hash": "h", "chunk_ids": ["a"], "embedding_model": "ancien manifeste"}, False),
+    (_entry(["a"]), True)
+])
+def test_plan_update_rebuilds_when_not_reusable(entry, force):
+    # Région, embedder (dont le backend) ou manifeste différents : tout est ré-encodé
+    assert _plan_update(entry, "bruxelles", ["a", "b"], force) == (False, [0, 1], [])
+
+# --- Ingestion dans une base Chroma temporaire ---
+class FlakyEmbeddings(DeterministicFakeEmbedding):
+    fail: bool = False
+
+    def embed_documents(self, texts):
+        if self.fail:
+            raise RuntimeError("embedder indisponible")
+        return super().embed_documents(texts)
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    documents = tmp_path / "documents"
+    documents.mkdir()
+    (documents / "guide_bruxelles.txt").write_text(GUIDE, encoding="utf-8")
+    vectorstore = tmp_path / "vectorstore"
+    embedder = FlakyEmbeddings(size=16)
+    monkeypatch.setattr(rag_engine, "DOCUMENTS_PATH", str(documents))
+    discover_guides = rag_engine.discover_guides
+    monkeypatch.setattr(rag_engine, "discover_guides", lambda: discover_guides(str(documents)))
+    monkeypatch.setattr(rag_engine, "VECTORSTORE_PATH", str(vectorstore))
+    monkeypatch.setattr(rag_engine, "VECTOR_BACKEND", "chroma")
+    monkeypatch.setattr(rag_engine, "get_embedding_function", lambda: embedder)
+    monkeypatch.setattr(ingestion_state, "SOURCES_MANIFEST_FILE", str(vectorstore / "sources_manifest.json"))
+    monkeypatch.setattr(ingestion_state, "REGION_VERSIONS_FILE", str(vectorstore / "region_versions.json"))
+    monkeypatch.setattr(ingestion_state, "_versions_cache", {"mtime": None, "data": {}})
+    return documents, embedder
+
+def _stored_texts():
+    return sorted(rag_engine.open_collection().get(where={"source": "guide_bruxelles.txt"})["documents"])
+
+def test_create_vector_db_is_incremental(store):
+    documents, _ = store
+    assert rag_engine.create_vector_db("guide_bruxelles.txt", "bruxelles") == {"added": 3, "deleted": 0, "skipped": False}
+    assert rag_engine.create_vector_db("guide_bruxelles.txt", "bruxelles")["skipped"]
+
+    (documents / "guide_bruxelles.txt").write_text(GUIDE.replace("Bebat", "Bebat du magasin"), encoding="utf-8")
+    assert rag_engine.create_vector_db("guide_bruxelles.txt", "bruxelles") == {"added": 1, "deleted": 1, "skipped": False}
+    assert len(_stored_texts()) == 3
+    assert ingestion_state.get_source_manifest("guide_bruxelles.txt")["embedding"] == embedding_signature()
+
+def test_ingest_all_keeps_the_old_version_when_embedding_fails(store, monkeypatch):
+    documents, embedder = store
+    rag_engine.ingest_all(max_workers=1)
+    before = _stored_texts()
+    manifest = ingestion_state.get_source_manifest("guide_bruxelles.txt")
+
+    # Guide modifié et changement de backend : tout le fichier est à ré-encoder
+    (documents / "guide_bruxelles.txt").write_text(GUIDE.replace("verre", "verre coloré"), encoding="utf-8")
+    monkeypatch.setattr(rag_engine, "embedding_signature", lambda: embedding_signature("onnx-int8"))
+    embedder.fail = True
+    with pytest.raises(RuntimeError):
+        rag_engine.ingest_all(max_workers=1)
+    assert _stored_texts() == before
+    assert ingestion_state.get_source_manifest("guide_bruxelles.txt") == manifest
+
+    embedder.fail = False
+    stats = rag_engine.ingest_all(max_workers=1)
+    assert (stats["added"], stats["deleted"]) == (3, 1)
+    assert any("verre coloré" in text for text in _stored_texts())
@@ -0,0 +1,75 @@
+import uuid
+
+import pytest
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from lexical_index import BM25Index, HybridRetriever, fuse_rankings, invalidate_region_indices, tokenize
+
+CHUNKS = [
+    "Les bouteilles de Javel et produits chimiques vont au Proxy Chimik.",
+    "Les bouteilles et flacons en plastique vont dans le sac PMC bleu.",
+    "Les bouteilles en verre vont dans les bulles à verre.",
+    "La frigolite (polystyrène) se dépose au recyparc.",
+    "Les cartons à boissons Tetra Pak vont dans le sac PMC."
+]
+
+def _docs():
+    return [Document(page_content=text, metadata={"region": "bruxelles", "source": "guide"}, id=f"c{i}")
+            for i, text in enumerate(CHUNKS)]
+
+def test_tokenize_drops_accents_stop_words_and_plurals():
+    assert tokenize("Où jeter mes bouteilles de Javel ?") == ["bouteille", "javel"]
+    assert tokenize("Les bocaux en verre") == ["bocau", "verre"]
+
+def test_bm25_ranks_the_exact_product_first():
+    index = BM25Index(_docs())
+    results = index.search("bouteille de Javel", k=3)
+    assert results[0][0].id == "c0"
+    assert [score for _, score in results] == sorted((score for _, score in results), reverse=True)
+    assert index.search("frigolite")[0][0].id == "c3"
+
+def test_bm25_rare_terms_weigh_more():
+    index = BM25Index(_docs())
+    # "bouteille" est dans 3 morceaux, "tetra" dans un seul
+    assert index._idf["tetra"] > index._idf["bouteille"]
+
+def test_bm25_unknown_or_empty_query():
+    index = BM25Index(_docs())
+    assert index.search("smartphone") == []
+    assert index.search("où le la") == []
+    assert BM25Index([]).search("verre") == []
+
+def test_fuse_rankings_rewards_agreement():
+    a, b, c, d = _docs()[:4]
+    fused = fuse_rankings([[a, b, c], [c, d]], k=2)
+    # c est 3e d'un classement et 1er de l'autre : il passe devant a
+    assert [doc.id for doc in fused] == ["c2", "c0"]
+
+def test_fuse_rankings_deduplicates_by_id():
+    a, b = _docs()[:2]
+    copy_of_a = Document(page_content=a.page_content, metadata=dict(a.metadata), id=a.id)
+    fused = fuse_rankings([[a, b], [copy_of_a]], k=5)
+    assert [doc.id for doc in fused] == ["c0", "c1"]
+
+@pytest.fixture
+def vector_store():
+    chroma = pytest.importorskip("langchain_chroma")
+    store = chroma.Chroma(collection_name=f"test-{uuid.uuid4().hex}", embedding_function=DeterministicFakeEmbedding(size=32))
+    docs = _docs()
+    store.add_documents(docs, ids=[doc.id for doc in docs])
+    invalidate_region_indices()
+    yield store
+    invalidate_region_indices()
+    store.delete_collection()
+
+def test_hybrid_retriever_returns_k_fused_documents(vector_store):
+    retriever = HybridRetriever(vector_store=vector_store, region="bruxelles", k=2, fetch_k=5)
+    docs = retriever.invoke("bouteille de Javel")
+    assert len(docs) == 2
+    # Le fake embedder ne sait rien du sens : c'est BM25 qui fait remonter le bon morceau
+    assert "c0" in [doc.id for doc in docs]
+
+def test_hybrid_retriever_gate(vector_store):
+    retriever = HybridRetriever(vector_store=vector_store, region="bruxelles", k=2, fetch_k=5, score_threshold=1.01)
+    assert retriever.invoke("bouteille de Javel") == []
@@ -0,0 +1,89 @@
+import uuid
+
+import numpy as np
+import pytest
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from engine import ConfigurationError
+from numpy_store import NumpyVectorStore, quantize_int8, write_shards
+
+class NormalizedFakeEmbedding(DeterministicFakeEmbedding):
+    # Comme all-MiniLM-L6-v2 : vecteurs de norme 1 (hypothèse de l'échelle 2 - 2 cos)
+    def _get_embedding(self, seed):
+        vector = np.asarray(super()._get_embedding(seed))
+        return (vector / np.linalg.norm(vector)).tolist()
+
+TEXTS = [f"Consigne {i} : déchet de type {kind}" for i, kind in enumerate(["verre", "papier", "PMC", "piles"] * 10)]
+METADATAS = [{"region": "bruxelles" if i % 2 else "liege", "source": f"guide_{i % 3}.txt"} for i in range(len(TEXTS))]
+IDS = [f"c{i}" for i in range(len(TEXTS))]
+QUERIES = ["Où jeter une bouteille ?", "piles usagées", "carton de pizza", "Consigne 3 : déchet de type piles"]
+
+@pytest.fixture
+def embedding():
+    return NormalizedFakeEmbedding(size=64)
+
+@pytest.fixture
+def chroma(embedding):
+    langchain_chroma = pytest.importorskip("langchain_chroma")
+    store = langchain_chroma.Chroma(collection_name=f"test-{uuid.uuid4().hex}", embedding_function=embedding)
+    store.add_texts(TEXTS, metadatas=METADATAS, ids=IDS)
+    yield store
+    store.delete_collection()
+
+def _numpy_store(tmp_path, embedding, dtype):
+    return NumpyVectorStore.from_texts(TEXTS, embedding, metadatas=METADATAS, ids=IDS, path=str(tmp_path), dtype=dtype)
+
+def test_quantize_int8():
+    matrix = np.random.default_rng(0).normal(size=(5, 384)).astype(np.float32)
+    matrix[4] = 0.0
+    quantized, scales = quantize_int8(matrix)
+    assert quantized.dtype == np.int8 and scales.dtype == np.float32
+    assert np.abs(quantized).max() == 127
+    assert scales[4] == 1.0 and not quantized[4].any()
+    assert np.abs(quantized * scales[:, None] - matrix).max() <= scales.max() / 2 + 1e-6
+
+def test_unknown_dtype(tmp_path):
+    with pytest.raises(ValueError):
+        write_shards(str(tmp_path), {}, dtype="float16")
+
+@pytest.mark.parametrize("region", ["bruxelles", "liege"])
+def test_float32_matches_chroma(tmp_path, embedding, chroma, region):
+    store = _numpy_store(tmp_path, embedding, "float32")
+    for query in QUERIES:
+        expected = chroma.similarity_search_with_score(query, k=4, filter={"region": region})
+        actual = store.similarity_search_with_score(query, k=4, filter={"region": region})
+        assert [doc.id for doc, _ in actual] == [doc.id for doc, _ in expected]
+        assert [d for _, d in actual] == pytest.approx([d for _, d in expected], abs=1e-4)
+        assert all(doc.metadata["region"] == region for doc, _ in actual)
+
+def test_int8_stays_close_to_chroma(tmp_path, embedding, chroma):
+    store = _numpy_store(tmp_path, embedding, "int8")
+    for query in QUERIES:
+        expected = chroma.similarity_search_with_score(query, k=4, filter={"region": "bruxelles"})
+        actual = store.similarity_search_with_score(query, k=4, filter={"region": "bruxelles"})
+        assert actual[0][0].id == expected[0][0].id
+        assert len({doc.id for doc, _ in actual} & {doc.id for doc, _ in expected}) >= 3
+        assert [d for _, d in actual] == pytest.approx([d for _, d in expected], abs=0.02)
+
+def test_metadata_filter_and_get(tmp_path, embedding):
+    store = _numpy_store(tmp_path, embedding, "float32")
+    docs = store.similarity_search("piles", k=50, filter={"region": "liege", "source": "guide_0.txt"})
+    assert docs and all(doc.metadata == {"region": "liege", "source": "guide_0.txt"} for doc in docs)
+
+    data = store.get(where={"region": "bruxelles"})
+    assert sorted(data["ids"], key=lambda i: int(i[1:])) == IDS[1::2]
+    assert sorted(store.get(ids=["c0", "c1"])["ids"]) == ["c0", "c1"]
+
+    with pytest.raises(ValueError):
+        store.similarity_search("piles", filter={"$or": [{"region": "liege"}]})
+
+def test_results_do_not_share_metadata(tmp_path, embedding):
+    store = _numpy_store(tmp_path, embedding, "float32")
+    doc = store.similarity_search("verre", k=1, filter={"region": "liege"})[0]
+    doc.metadata["relevance_score"] = 0.9
+    assert "relevance_score" not in store.similarity_search("verre", k=1, filter={"region": "liege"})[0].metadata
+
+def test_index_from_another_embedder_is_refused(tmp_path, embedding):
+    _numpy_store(tmp_path, embedding, "float32")
+    with pytest.raises(ConfigurationError):
+        NumpyVectorStore(str(tmp_path), embedding, signature={"embedding_model": "autre", "embedding_backend": "onnx-int8"})
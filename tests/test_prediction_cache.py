@@ -0,0 +1,90 @@
+import numpy as np
+import pytest
+
+from vision_model import PredictionCache
+
+def _image(seed=0, shape=(32, 32, 3)):
+    return np.random.default_rng(seed).integers(0, 256, size=shape, dtype=np.uint8)
+
+RESULT = {
+    "detected": True,
+    "class_name": "Glass",
+    "confidence": 0.91,
+    "detections": [{"class_name": "Glass", "confidence": 0.91, "box": [1, 2, 3, 4]}]
+}
+
+def test_miss_then_hit():
+    cache = PredictionCache(max_entries=4)
+    image = _image()
+    result, key = cache.get(image, 0.5)
+    assert result is None
+    cache.put(key, RESULT)
+
+    result, _ = cache.get(image.copy(), 0.5)
+    assert result == RESULT
+    assert cache.info()["hits"] == 1
+    assert cache.info()["misses"] == 1
+
+def test_key_depends_on_threshold_and_kind():
+    cache = PredictionCache(max_entries=4)
+    image = _image()
+    _, key = cache.get(image, 0.5)
+    cache.put(key, RESULT)
+    assert cache.get(image, 0.3)[0] is None
+    assert cache.get(image, 0.5, kind="all")[0] is None
+
+def test_content_key_depends_on_shape():
+    flat = np.zeros((4, 8, 3), dtype=np.uint8)
+    assert PredictionCache.content_key(flat) != PredictionCache.content_key(flat.reshape(8, 4, 3))
+
+def test_lru_eviction():
+    cache = PredictionCache(max_entries=2)
+    keys = []
+    for seed in range(3):
+        _, key = cache.get(_image(seed), 0.5)
+        cache.put(key, {"seed": seed})
+        keys.append(key)
+    assert cache.get(_image(0), 0.5)[0] is None
+    assert cache.get(_image(2), 0.5)[0] == {"seed": 2}
+    assert cache.info()["size"] == 2
+
+def test_callers_cannot_corrupt_cached_entries():
+    cache = PredictionCache(max_entries=4)
+    image = _image()
+    stored = {**RESULT, "detections": [dict(d) for d in RESULT["detections"]]}
+    _, key = cache.get(image, 0.5)
+    cache.put(key, stored)
+    stored["detections"][0]["class_name"] = "Metal"  # l'appelant garde et modifie son résultat
+
+    first, _ = cache.get(image, 0.5)
+    first["detections"][0]["class_name"] = "Paper"
+    first["detections"].append({"class_name": "Trash"})
+    first["timings_ms"] = {"vision": 12.0}
+
+    second, _ = cache.get(image, 0.5)
+    assert second == RESULT
+
+def test_perceptual_mode_finds_near_duplicates():
+    cache = PredictionCache(max_entries=4, mode="perceptual", max_distance=4)
+    # Dégradé lisse : un léger bruit (ré-encodage) ne change pas le dHash
+    gradient = np.tile(np.linspace(0, 255, 64, dtype=np.uint8)[None, :, None], (64, 1, 3))
+    _, key = cache.get(gradient, 0.5)
+    cache.put(key, RESULT)
+
+    noisy = np.clip(gradient.astype(np.int16) + 1, 0, 255).astype(np.uint8)
+    result, _ = cache.get(noisy, 0.5)
+    assert result == RESULT
+    assert cache.info()["perceptual_hits"] == 1
+
+def test_exact_mode_ignores_near_duplicates():
+    cache = PredictionCache(max_entries=4, mode="exact")
+    image = _image()
+    _, key = cache.get(image, 0.5)
+    cache.put(key, RESULT)
+    other = image.copy()
+    other[0, 0, 0] ^= 1
+    assert cache.get(other, 0.5)[0] is None
+
+def test_unknown_mode():
+    with pytest.raises(ValueError):
+        PredictionCache(mode="fuzzy")
@@ -0,0 +1,68 @@
+import json
+
+import pytest
+from langchain_core.documents import Document
+
+from embeddings import embedding_signature
+from relevance_gate import (
+    best_relevance, choose_threshold, load_thresholds, passes, relevance_from_distance, save_thresholds
+)
+
+def test_relevance_from_distance():
+    assert relevance_from_distance(0) == 1.0
+    assert relevance_from_distance(1) == 0.5
+    assert relevance_from_distance(-0.001) == 1.0  # arrondis de Chroma
+    assert relevance_from_distance(0.4) > relevance_from_distance(0.8)
+
+def test_passes():
+    scored = [(None, 0.4), (None, 0.62)]
+    assert passes(scored, None)
+    assert passes(scored, 0.6)
+    assert not passes(scored, 0.7)
+    assert not passes([], 0.1)
+
+def test_best_relevance():
+    docs = [Document(page_content="a", metadata={"relevance_score": 0.5}),
+            Document(page_content="b", metadata={"relevance_score": 0.7}),
+            Document(page_content="c")]
+    assert best_relevance(docs) == 0.7
+    assert best_relevance([Document(page_content="c")]) is None
+
+def test_choose_threshold_separates_the_two_sets():
+    in_scope = [0.70, 0.72, 0.80, 0.85]
+    out_of_scope = [0.40, 0.50, 0.55]
+    assert choose_threshold(in_scope, out_of_scope, min_recall=1.0) == pytest.approx((0.70 + 0.55) / 2)
+
+def test_choose_threshold_respects_min_recall():
+    in_scope = [0.45, 0.70, 0.72, 0.80]
+    out_of_scope = [0.40, 0.50, 0.55]
+    # Recall 100 % : le seuil doit laisser passer 0.45
+    assert choose_threshold(in_scope, out_of_scope, min_recall=1.0) == pytest.approx((0.45 + 0.40) / 2)
+    # Recall 75 % : on peut sacrifier 0.45 pour rejeter tout le hors sujet
+    assert choose_threshold(in_scope, out_of_scope, min_recall=0.75) == pytest.approx((0.70 + 0.55) / 2)
+
+def test_choose_threshold_none_when_nothing_can_be_rejected():
+    assert choose_threshold([0.5, 0.6], [0.7, 0.8], min_recall=1.0) is None
+    assert choose_threshold([], [0.3]) is None
+    assert choose_threshold([0.5], []) is None
+
+def test_thresholds_round_trip_and_signature(tmp_path):
+    path = str(tmp_path / "thresholds.json")
+    save_thresholds({"bruxelles": {"threshold": 0.61}, "liege": {"threshold": None}}, path)
+    assert load_thresholds(path) == {"bruxelles": 0.61}
+
+    # Recalibrer une région garde les autres
+    save_thresholds({"liege": {"threshold": 0.58}}, path)
+    assert load_thresholds(path) == {"bruxelles": 0.61, "liege": 0.58}
+
+    # Seuils calibrés pour un autre embedder : ignorés
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    assert data["signature"] == embedding_signature()
+    data["signature"] = {**data["signature"], "embedding_backend": "autre-backend"}
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f)
+    assert load_thresholds(path) == {}
+
+def test_missing_thresholds_file(tmp_path):
+    assert load_thresholds(str(tmp_path / "absent.json")) == {}
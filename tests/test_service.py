@@ -0,0 +1,55 @@
+import asyncio
+import json
+
+import pytest
+
+from service import InferenceService
+
+def _call(app, method, path, query=b"", body=b""):
+    """
+    Appelle l'application ASGI directement (sans serveur) : retourne (statut, JSON).
+    """
+    scope = {"type": "http", "method": method, "path": path, "query_string": query}
+    messages = []
+
+    async def receive():
+        return {"type": "http.request", "body": body, "more_body": False}
+
+    async def send(message):
+        messages.append(message)
+
+    asyncio.run(app(scope, receive, send))
+    status = next(m["status"] for m in messages if m["type"] == "http.response.start")
+    payload = b"".join(m.get("body", b"") for m in messages if m["type"] == "http.response.body")
+    return status, json.loads(payload)
+
+@pytest.fixture(scope="module")
+def app():
+    service = InferenceService(workers=1)
+    yield service
+    service.executor.shutdown(wait=False)
+
+def test_health(app):
+    assert _call(app, "GET", "/health") == (200, {"status": "ok"})
+
+def test_unknown_route(app):
+    status, payload = _call(app, "GET", "/inconnue")
+    assert status == 404 and "Route inconnue" in payload["error"]
+
+@pytest.mark.parametrize("query", [b"conf=abc", b"conf=1.5", b"conf=-0.1", b"conf=nan"])
+def test_predict_rejects_an_invalid_confidence(app, query):
+    status, payload = _call(app, "POST", "/predict", query=query, body=b"image")
+    assert status == 400
+    assert "Seuil de confiance invalide" in payload["error"]
+
+def test_predict_rejects_an_unknown_mode(app):
+    status, payload = _call(app, "POST", "/predict", query=b"conf=0.4&mode=tout", body=b"image")
+    assert status == 400 and "Mode inconnu" in payload["error"]
+
+def test_predict_rejects_an_empty_body(app):
+    status, payload = _call(app, "POST", "/predict", query=b"conf=0.4")
+    assert status == 400 and "Corps vide" in payload["error"]
+
+def test_bin_requires_class_name_and_region(app):
+    status, _ = _call(app, "GET", "/bin", query=b"class_name=Glass&region=atlantide")
+    assert status == 400
@@ -0,0 +1,160 @@
+import asyncio
+import threading
+import time
+
+import httpx
+import pytest
+
+from throttling import CallInterrupted, RateLimiter, SingleFlight, backoff_delay, is_rate_limited, is_retryable, retrying
+
+def _status_error(code):
+    request = httpx.Request("POST", "https://api.mistral.ai/v1/chat/completions")
+    return httpx.HTTPStatusError(f"Error response {code}", request=request, response=httpx.Response(code, request=request))
+
+# --- RateLimiter ---
+def test_rate_limiter_allows_a_burst_then_spaces_calls():
+    limiter = RateLimiter(rate=10, burst=2)
+    delays = [limiter._reserve() for _ in range(4)]
+    assert delays[:2] == [0.0, 0.0]
+    assert delays[2] == pytest.approx(0.1, abs=0.01)
+    assert delays[3] == pytest.approx(0.2, abs=0.01)
+    assert limiter.stats["acquired"] == 4
+    assert limiter.stats["throttled"] == 2
+
+def test_rate_limiter_rejects_a_null_rate():
+    with pytest.raises(ValueError):
+        RateLimiter(rate=0)
+
+# --- SingleFlight ---
+def test_single_flight_runs_identical_calls_once():
+    flight = SingleFlight()
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def slow():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return "réponse"
+
+    results = []
+    leader = threading.Thread(target=lambda: results.append(flight.do("bruxelles|piles", slow)))
+    leader.start()
+    started.wait(5)
+    followers = [threading.Thread(target=lambda: results.append(flight.do("bruxelles|piles", slow))) for _ in range(3)]
+    for thread in followers:
+        thread.start()
+    deadline = time.monotonic() + 5
+    while flight.stats["coalesced"] < 3 and time.monotonic() < deadline:
+        time.sleep(0.001)
+    release.set()
+    for thread in [leader, *followers]:
+        thread.join(5)
+
+    assert len(calls) == 1
+    assert sorted(results, key=lambda r: not r[1]) == [("réponse", True)] + [("réponse", False)] * 3
+    assert flight.stats == {"leaders": 1, "coalesced": 3}
+
+def test_single_flight_shares_the_error_and_forgets_the_key():
+    flight = SingleFlight()
+    future, leader = flight.begin("k")
+    follower_future, follower_leads = flight.begin("k")
+    assert leader and not follower_leads and follower_future is future
+    flight.finish("k", future, error=RuntimeError("quota"))
+    with pytest.raises(RuntimeError):
+        follower_future.result()
+    # Clé libérée : l'appel suivant repart d'une nouvelle exécution
+    assert flight.do("k", lambda: 42) == (42, True)
+
+def test_single_flight_interrupted_leader_hands_over_to_the_follower():
+    flight = SingleFlight()
+    future, _ = flight.begin("k")
+    results = []
+    follower = threading.Thread(target=lambda: results.append(flight.do("k", lambda: "relancé")))
+    follower.start()
+    deadline = time.monotonic() + 5
+    while flight.stats["coalesced"] < 1 and time.monotonic() < deadline:
+        time.sleep(0.001)
+    # GeneratorExit / KeyboardInterrupt du premier appel : jamais relancés chez les autres
+    flight.finish("k", future, error=GeneratorExit())
+    follower.join(5)
+    assert isinstance(future.exception(), CallInterrupted)
+    assert results == [("relancé", True)]
+
+def test_single_flight_follower_timeout_runs_the_call():
+    flight = SingleFlight(timeout=0.01)
+    flight.begin("k")  # premier appel bloqué, jamais terminé
+    assert flight.do("k", lambda: 42) == (42, True)
+
+def test_single_flight_async():
+    flight = SingleFlight()
+    calls = []
+
+    async def answer():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return "ok"
+
+    async def main():
+        return await asyncio.gather(*(flight.ado("k", answer) for _ in range(3)))
+
+    results = asyncio.run(main())
+    assert len(calls) == 1
+    assert sorted(leader for _, leader in results) == [False, False, True]
+
+# --- Nouvelles tentatives ---
+@pytest.mark.parametrize("error, retryable", [
+    (_status_error(429), True),
+    (_status_error(503), True),
+    (_status_error(400), False),
+    (_status_error(401), False),
+    (httpx.ConnectError("coupure"), True),
+    (httpx.ReadTimeout("timeout"), True),
+    (ValueError("bug"), False)
+])
+def test_is_retryable(error, retryable):
+    assert is_retryable(error) is retryable
+
+def test_retrying_retries_transient_errors_only():
+    outcomes = [_status_error(503), _status_error(429), "ok"]
+
+    def flaky():
+        outcome = outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    assert retrying(attempts=3, base_seconds=0.001, max_seconds=0.001)(flaky) == "ok"
+
+    calls = []
+
+    def broken():
+        calls.append(1)
+        raise _status_error(400)
+
+    with pytest.raises(httpx.HTTPStatusError):
+        retrying(attempts=3, base_seconds=0.001, max_seconds=0.001)(broken)
+    assert len(calls) == 1
+
+def test_backoff_delay_is_bounded():
+    for attempt in range(10):
+        assert 0 <= backoff_delay(attempt, base_seconds=0.5, max_seconds=8.0) <= min(8.0, 0.5 * 2 ** attempt)
+
+def test_mistral_429_is_retryable_and_not_retried_by_the_client():
+    # Exception réellement levée par langchain_mistralai sur un 429, client configuré comme engine.py
+    langchain_mistralai = pytest.importorskip("langchain_mistralai")
+    requests = []
+
+    def handler(request):
+        requests.append(request)
+        return httpx.Response(429, json={"message": "Requests rate limit exceeded"})
+
+    llm = langchain_mistralai.ChatMistralAI(model="mistral-small-latest", api_key="test", max_retries=0)
+    llm.client = httpx.Client(base_url="https://api.mistral.ai/v1", transport=httpx.MockTransport(handler))
+    with pytest.raises(Exception) as excinfo:
+        llm.invoke("Où jeter mes piles ?")
+
+    assert is_retryable(excinfo.value)
+    assert is_rate_limited(excinfo.value)
+    assert len(requests) == 1
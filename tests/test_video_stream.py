@@ -0,0 +1,90 @@
+import pytest
+
+from video_stream import AdaptiveFrameSkipper, IoUTracker, VideoSorter, iou
+
+def _det(box, class_name="Glass", confidence=0.9):
+    return {"box": box, "class_name": class_name, "confidence": confidence}
+
+# --- IoU ---
+def test_iou():
+    assert iou([0, 0, 10, 10], [0, 0, 10, 10]) == 1.0
+    assert iou([0, 0, 10, 10], [20, 20, 30, 30]) == 0.0
+    assert iou([0, 0, 10, 10], [5, 0, 15, 10]) == pytest.approx(50 / 150)
+    assert iou([0, 0, 0, 0], [0, 0, 0, 0]) == 0.0
+
+# --- Saut d'images ---
+def test_skipper_stride_follows_target_fps():
+    skipper = AdaptiveFrameSkipper(target_fps=10, source_fps=30)
+    assert skipper.stride == 3
+    processed = []
+    for index in range(10):
+        if skipper.should_process(index):
+            skipper.record(index, 0.01)
+            processed.append(index)
+    assert processed == [0, 3, 6, 9]
+
+def test_skipper_slows_down_when_inference_is_slow():
+    skipper = AdaptiveFrameSkipper(target_fps=10, source_fps=30, smoothing=0.5)
+    skipper.record(0, 0.25)  # YOLO à 4 images/s
+    assert skipper.stride == 8
+    skipper.record(8, 0.05)  # moyenne mobile : 0.15 s
+    assert skipper.latency_s == pytest.approx(0.15)
+    assert skipper.stride == 5
+
+def test_skipper_never_goes_below_one():
+    skipper = AdaptiveFrameSkipper(target_fps=60, source_fps=30)
+    skipper.record(0, 0.001)
+    assert skipper.stride == 1
+
+# --- Suivi ---
+def test_tracker_reports_an_object_once_when_stable():
+    tracker = IoUTracker(iou_threshold=0.3, min_hits=3, max_missed=2)
+    reports = [tracker.update([_det([10 + i, 10, 50 + i, 50])]) for i in range(5)]
+    assert [len(r) for r in reports] == [0, 0, 1, 0, 0]
+    assert reports[2][0].track_id == 1
+    assert len(tracker.tracks) == 1
+
+def test_tracker_separates_objects_and_votes_the_class():
+    tracker = IoUTracker(iou_threshold=0.3, min_hits=3, max_missed=2)
+    frames = [
+        [_det([0, 0, 40, 40], "Glass", 0.9), _det([100, 100, 140, 140], "Metal", 0.8)],
+        [_det([2, 0, 42, 40], "Plastic", 0.6), _det([101, 100, 141, 140], "Metal", 0.8)],
+        [_det([4, 0, 44, 40], "Glass", 0.9), _det([102, 100, 142, 140], "Metal", 0.8)]
+    ]
+    stable = []
+    for detections in frames:
+        stable.extend(tracker.update(detections))
+    assert sorted((t.track_id, t.class_name) for t in stable) == [(1, "Glass"), (2, "Metal")]
+    glass = next(t for t in stable if t.track_id == 1)
+    assert glass.confidence == pytest.approx(1.8 / 3)
+
+def test_tracker_forgets_lost_objects():
+    tracker = IoUTracker(iou_threshold=0.3, min_hits=2, max_missed=1)
+    tracker.update([_det([0, 0, 10, 10])])
+    tracker.update([])
+    tracker.update([])
+    assert tracker.tracks == []
+    # L'objet qui revient est un nouvel objet
+    tracker.update([_det([0, 0, 10, 10])])
+    assert tracker.tracks[0].track_id == 2
+
+# --- Pipeline ---
+class FakeModel:
+    def __init__(self, detections_by_frame):
+        self.detections_by_frame = detections_by_frame
+        self.seen = []
+
+    def detect_batch(self, frames, conf_threshold):
+        self.seen.append(frames[0])
+        return [self.detections_by_frame.get(frames[0], [])]
+
+def test_video_sorter_emits_one_event_per_new_object():
+    # Image = son index ; un objet visible sur toute la séquence
+    model = FakeModel({i: [_det([10, 10, 50, 50], "Paper", 0.7)] for i in range(30)})
+    sorter = VideoSorter(model=model, target_fps=10, source_fps=30, tracker=IoUTracker(min_hits=3))
+    events = list(sorter.run((i, i / 30, i) for i in range(30)))
+    assert len(events) == 1
+    assert events[0]["class_name"] == "Paper"
+    assert events[0]["frame"] == 6  # 3e image traitée (pas de 3)
+    assert sorter.stats["frames_read"] == 30
+    assert sorter.stats["frames_processed"] == len(model.seen) < 30